@@ -0,0 +1 @@
+"""DL+ Intelligence System - Benchmarks"""
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ArabicProcessor.normalize_text
+قياس أداء تطبيع النص
+
+Compares the single-pass translate normalizer with the previous
+four-pass regex implementation on the synthetic mixed corpus.
+
+    python benchmarks/bench_normalize.py
+"""
+
+import re
+import sys
+import os
+import timeit
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dlplus.core import ArabicProcessor
+from benchmarks.corpus import build_corpus
+
+DIACRITICS = re.compile(r'[\u0617-\u061A\u064B-\u0652]')
+
+
+def legacy_normalize(text: str) -> str:
+    """Previous regex-based normalize_text, kept for comparison"""
+    text = DIACRITICS.sub('', text)
+    text = re.sub(r'[إأآا]', 'ا', text)
+    text = re.sub(r'ة', 'ه', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def time_per_call(func, texts, repeat: int = 5) -> float:
+    """Best-of-repeat microseconds per call over texts"""
+    def run():
+        for text in texts:
+            func(text)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return best / len(texts) * 1e6
+
+
+def main():
+    processor = ArabicProcessor()
+    corpus = build_corpus()
+    subsets = {
+        "mixed": corpus,
+        "arabic": [text for text in corpus if not text.isascii()],
+        "ascii": [text for text in corpus if text.isascii()],
+    }
+    
+    print(f"{'corpus':<8} {'texts':>6} {'regex µs':>10} {'translate µs':>13} {'speedup':>8}")
+    for name, texts in subsets.items():
+        legacy = time_per_call(legacy_normalize, texts)
+        current = time_per_call(processor.normalize_text, texts)
+        print(f"{name:<8} {len(texts):>6} {legacy:>10.2f} {current:>13.2f} {legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite: IntelligenceCore request pipeline
+حزمة قياس أداء مسار معالجة الطلبات
+
+Runs every pipeline stage on the deterministic synthetic corpus, prints
+ops/sec, p50/p99 and allocations per call, saves the results as JSON and
+fails (exit code 1) when a stage regresses past its threshold against a
+stored baseline.
+
+    python benchmarks/bench_pipeline.py                      # run and compare
+    python benchmarks/bench_pipeline.py --save-baseline      # refresh baseline
+    python benchmarks/bench_pipeline.py --stage arabic --threshold 0.4
+    python benchmarks/bench_pipeline.py --stage-threshold api.execute=0.5
+
+Baselines are machine specific: record one on the machine (or CI runner
+class) that will run the comparison.
+"""
+
+import argparse
+import sys
+import os
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dlplus.core import IntelligenceCore, ArabicProcessor, ContextAnalyzer, IntentType
+from dlplus.core.embeddings import HashingEmbedder
+from dlplus.core.metrics import StageTimer
+from dlplus.agents import WebRetrievalAgent, CodeGeneratorAgent
+from dlplus.config import settings
+from benchmarks.corpus import build_corpus
+from benchmarks.harness import measure, environment, save_results, load_results, find_regressions
+
+BENCHMARK_DIR = Path(__file__).parent
+DEFAULT_RESULTS = BENCHMARK_DIR / "results" / "latest.json"
+DEFAULT_BASELINE = BENCHMARK_DIR / "baseline.json"
+
+
+def build_stages(corpus: List[str]) -> List[Tuple[str, Callable, list]]:
+    """Return (stage name, callable, inputs) for every pipeline stage"""
+    processor = ArabicProcessor()
+    core = IntelligenceCore()
+    analyzed = [
+        (text, processor.detect_intent(text), processor.extract_entities(text))
+        for text in corpus
+    ]
+
+    context = ContextAnalyzer()
+
+    def add_turn(item):
+        text, intent, entities = item
+        context.add_turn(text, "ok", intent.value, entities, ["run_web_search"])
+
+    # Semantic retrieval over a long session (20k turns)
+    long_context = ContextAnalyzer(max_history=20000, embedder=HashingEmbedder())
+    for index in range(20000):
+        long_context.add_turn(corpus[index % len(corpus)], "ok", "search", {})
+
+    def plan(item):
+        text, intent, entities = item
+        model = core._select_model(intent, processor.is_arabic(text), text)["model"]
+        tools = core._select_tools(intent, entities)
+        return core._create_execution_plan(intent, entities, tools, {}), model
+
+    # What process_request adds for timing and metrics, without the work:
+    # every stage lap, the histogram and counter updates and three steps
+    request_stages = (
+        "language", "intent", "entities", "context", "model_selection",
+        "prompt_context", "cache_lookup", "planning", "execution", "context_update"
+    )
+    step_actions = ("read_file", "analyze_results", "format_response")
+
+    def instrumentation(_):
+        timer = StageTimer()
+        for stage in request_stages:
+            timer.lap(stage)
+        core.metrics.observe_stages("stage_duration_seconds", timer)
+        core.metrics.inc("requests_total", ("analyze", "computed", "true"))
+        core.metrics.inc_many("plan_steps_total", [(action, "ok") for action in step_actions])
+        core.metrics.observe_many("step_duration_seconds", [(action, 25000) for action in step_actions])
+        return timer.elapsed_ns()
+
+    web_agent = WebRetrievalAgent()
+    code_agent = CodeGeneratorAgent()
+
+    stages = [
+        ("arabic.normalize_text", processor.normalize_text, corpus),
+        ("arabic.detect_intent", processor.detect_intent, corpus),
+        ("arabic.rank_intents", processor.rank_intents, corpus),
+        ("arabic.extract_entities", processor.extract_entities, corpus),
+        ("arabic.analyze", processor.analyze, corpus),
+        ("context.add_turn", add_turn, analyzed),
+        ("context.get_context_summary", lambda _: context.get_context_summary(), corpus),
+        ("context.search_history", long_context.search_history, corpus),
+        ("core.plan", plan, analyzed),
+        ("core.instrumentation", instrumentation, corpus),
+        ("agent.web_retrieval", web_agent.execute, corpus),
+        ("agent.code_generator", code_agent.execute, corpus),
+        ("core.process_request", core.process_request, corpus),
+    ]
+
+    try:
+        from fastapi.testclient import TestClient
+        from dlplus.main import app
+    except ImportError as e:
+        print(f"Skipping api.* stages: {e}")
+    else:
+        # URL entities would otherwise be fetched over the network
+        settings.enable_web_search = False
+        client = TestClient(app)
+        stages.append((
+            "api.execute",
+            lambda text: client.post("/api/agent/execute", json={"prompt": text}),
+            corpus
+        ))
+
+    return stages
+
+
+def parse_stage_thresholds(values: List[str]) -> Dict[str, float]:
+    """Parse repeated NAME=FRACTION options"""
+    thresholds = {}
+    for value in values:
+        name, _, fraction = value.partition("=")
+        thresholds[name] = float(fraction)
+    return thresholds
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="DL+ pipeline benchmarks")
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--stage", action="append", default=[],
+                        help="only run stages starting with this prefix (repeatable)")
+    parser.add_argument("--output", type=Path, default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write the results to the baseline path as well")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed regression as a fraction (default 0.25)")
+    parser.add_argument("--stage-threshold", action="append", default=[],
+                        metavar="NAME=FRACTION", help="per-stage threshold override")
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus(args.corpus_size, seed=args.seed)
+    results = {
+        "environment": environment(),
+        "corpus": {"size": args.corpus_size, "seed": args.seed},
+        "stages": {}
+    }
+
+    print(f"{'stage':<30} {'ops/sec':>10} {'p50 µs':>9} {'p99 µs':>9} {'peak B':>9} {'kept blk':>9}")
+    for name, func, inputs in build_stages(corpus):
+        if args.stage and not any(name.startswith(prefix) for prefix in args.stage):
+            continue
+        stats = measure(func, inputs, iterations=args.iterations)
+        results["stages"][name] = stats
+        print(
+            f"{name:<30} {stats['ops_per_sec']:>10.0f} {stats['p50_us']:>9.1f} "
+            f"{stats['p99_us']:>9.1f} {stats['alloc_peak_bytes']:>9.0f} {stats['retained_blocks']:>9.2f}"
+        )
+
+    save_results(results, args.output)
+    print(f"\nResults saved to {args.output}")
+
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = load_results(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+
+    problems = find_regressions(
+        results,
+        baseline,
+        threshold=args.threshold,
+        stage_thresholds=parse_stage_thresholds(args.stage_threshold)
+    )
+    if problems:
+        print("\nRegressions:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+
+    print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Synthetic Benchmark Corpus
+مجموعة نصوص اصطناعية لقياس الأداء
+
+Deterministic mixed Arabic/English prompts shaped like production traffic:
+commands with diacritics, tatweel, Arabic-Indic digits, file names, URLs
+and quoted strings.
+"""
+
+import random
+from typing import List
+
+ARABIC_TEMPLATES = [
+    "ابحث عن {topic} في {site}",
+    "اكتب كود بايثون لحساب {topic} واحفظه في {file}",
+    "قم بتنفيذ الأمر \"{command}\" على الخادم",
+    "اقرأ ملف {file} ولخص محتواه",
+    "حلّل البيانات في {file} وقارنها بـ {site}",
+    "ترجم هذه الفقرة عن {topic} إلى الإنجليزية",
+    "أنشئ ملف {file} يحتوي على {number} سطراً",
+    "مَا هِيَ أَفْضَلُ طَرِيقَةٍ لِتَعَلُّمِ {topic}؟",
+    "الســــلام عليكم، أريد تلخيص {topic} في {number} نقاط",
+]
+
+ENGLISH_TEMPLATES = [
+    "search for {topic} on {site}",
+    "generate code to parse {file} and print the totals",
+    "run command '{command}' and show the output",
+    "read file {file} and summarize it",
+    "analyze the logs in {file} for errors since {number} days",
+    "please explain {topic} in simple terms",
+]
+
+TOPICS = [
+    "الذكاء الاصطناعي", "تعلم الآلة", "الشبكات العصبية", "قواعد البيانات",
+    "machine learning", "neural networks", "web scraping", "fibonacci numbers",
+]
+
+FILES = ["main.py", "config.json", "README.md", "deploy.sh", "app.js", "تقرير.txt", "data.yaml"]
+
+SITES = ["https://example.com/docs", "https://ar.wikipedia.org/wiki/ذكاء", "http://localhost:8000/api"]
+
+COMMANDS = ["ls -la", "df -h", "python --version", "uptime"]
+
+NUMBERS = ["٣", "١٠", "۲۵", "42", "7"]
+
+
+def build_corpus(size: int = 5000, seed: int = 1234, arabic_ratio: float = 0.6) -> List[str]:
+    """Build a reproducible list of mixed Arabic/English prompts"""
+    rng = random.Random(seed)
+    corpus = []
+    
+    for _ in range(size):
+        templates = ARABIC_TEMPLATES if rng.random() < arabic_ratio else ENGLISH_TEMPLATES
+        corpus.append(rng.choice(templates).format(
+            topic=rng.choice(TOPICS),
+            file=rng.choice(FILES),
+            site=rng.choice(SITES),
+            command=rng.choice(COMMANDS),
+            number=rng.choice(NUMBERS)
+        ))
+    
+    return corpus
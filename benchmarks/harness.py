@@ -0,0 +1,199 @@
+"""
+Benchmark Harness
+أدوات قياس الأداء
+
+Times a callable (sync or async) over a deterministic sequence of inputs
+and reports ops/sec, p50/p99 latency and allocations per call. Results
+are plain dicts so they can be saved as JSON and compared against a
+stored baseline.
+"""
+
+import asyncio
+import gc
+import inspect
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from array import array
+from itertools import cycle, islice
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+def percentile(sorted_values: Sequence[int], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return float(sorted_values[index])
+
+
+def _summarize(durations_ns: List[int], total_ns: int) -> Dict[str, float]:
+    durations_ns.sort()
+    return {
+        "iterations": len(durations_ns),
+        "ops_per_sec": len(durations_ns) / (total_ns / 1e9) if total_ns else 0.0,
+        "mean_us": total_ns / len(durations_ns) / 1e3,
+        "p50_us": percentile(durations_ns, 0.50) / 1e3,
+        "p99_us": percentile(durations_ns, 0.99) / 1e3,
+    }
+
+
+def _measure_allocations(call: Callable[[Any], Any], inputs: List[Any]) -> Dict[str, float]:
+    """Peak traced bytes per call and blocks still alive afterwards"""
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    # Preallocated so recording a peak does not allocate itself
+    peaks = array("q", [0]) * len(inputs)
+    tracemalloc.start()
+    try:
+        for index, item in enumerate(inputs):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            call(item)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks[index] = peak - current
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    retained = sys.getallocatedblocks() - blocks_before
+    return {
+        "alloc_peak_bytes": sum(peaks) / len(peaks),
+        "retained_blocks": retained / len(inputs),
+    }
+
+
+def measure(
+    func: Callable[[Any], Any],
+    inputs: Sequence[Any],
+    iterations: int = 2000,
+    warmup: int = 100,
+    alloc_iterations: int = 200
+) -> Dict[str, float]:
+    """
+    Benchmark ``func(item)`` over inputs, cycling through them
+    قياس أداء دالة على مجموعة مدخلات
+    
+    Coroutine functions are awaited on one event loop, so loop start-up
+    is not part of the per-call time.
+    """
+    if inspect.iscoroutinefunction(func):
+        return asyncio.run(_measure_async(func, inputs, iterations, warmup, alloc_iterations))
+    
+    for item in islice(cycle(inputs), warmup):
+        func(item)
+    
+    durations = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for item in islice(cycle(inputs), iterations):
+        before = clock()
+        func(item)
+        durations.append(clock() - before)
+    total = clock() - started
+    
+    stats = _summarize(durations, total)
+    stats.update(_measure_allocations(func, list(islice(cycle(inputs), alloc_iterations))))
+    return stats
+
+
+async def _measure_async(func, inputs, iterations, warmup, alloc_iterations) -> Dict[str, float]:
+    for item in islice(cycle(inputs), warmup):
+        await func(item)
+    
+    durations = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for item in islice(cycle(inputs), iterations):
+        before = clock()
+        await func(item)
+        durations.append(clock() - before)
+    total = clock() - started
+    
+    stats = _summarize(durations, total)
+    stats.update(await _measure_allocations_async(func, list(islice(cycle(inputs), alloc_iterations))))
+    return stats
+
+
+async def _measure_allocations_async(func, inputs: List[Any]) -> Dict[str, float]:
+    """Async counterpart of _measure_allocations"""
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    peaks = array("q", [0]) * len(inputs)
+    tracemalloc.start()
+    try:
+        for index, item in enumerate(inputs):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await func(item)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks[index] = peak - current
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    retained = sys.getallocatedblocks() - blocks_before
+    return {
+        "alloc_peak_bytes": sum(peaks) / len(peaks),
+        "retained_blocks": retained / len(inputs),
+    }
+
+
+def environment() -> Dict[str, str]:
+    """Describe the machine the numbers came from"""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def save_results(results: Dict, path: Path):
+    """Write results as pretty JSON"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def load_results(path: Path) -> Optional[Dict]:
+    """Read results JSON, or None when the file does not exist"""
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def find_regressions(
+    current: Dict,
+    baseline: Dict,
+    threshold: float = 0.25,
+    stage_thresholds: Optional[Dict[str, float]] = None
+) -> List[str]:
+    """
+    Compare stage results against a baseline
+    
+    A stage regresses when its throughput drops, or its p99 latency grows,
+    by more than its threshold (a fraction, 0.25 = 25%). Stages missing
+    from either side are ignored.
+    """
+    stage_thresholds = stage_thresholds or {}
+    problems = []
+    
+    for stage, stats in current.get("stages", {}).items():
+        reference = baseline.get("stages", {}).get(stage)
+        if not reference:
+            continue
+        limit = stage_thresholds.get(stage, threshold)
+        
+        if stats["ops_per_sec"] < reference["ops_per_sec"] * (1 - limit):
+            problems.append(
+                f"{stage}: ops/sec {stats['ops_per_sec']:.0f} < baseline "
+                f"{reference['ops_per_sec']:.0f} (-{limit:.0%} allowed)"
+            )
+        if stats["p99_us"] > reference["p99_us"] * (1 + limit):
+            problems.append(
+                f"{stage}: p99 {stats['p99_us']:.1f}µs > baseline "
+                f"{reference['p99_us']:.1f}µs (+{limit:.0%} allowed)"
+            )
+    
+    return problems
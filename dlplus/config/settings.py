@@ -21,6 +21,16 @@ class Settings(BaseSettings):
     openai_api_key: str = Field(default="", env="OPENAI_API_KEY")
     anthropic_api_key: str = Field(default="", env="ANTHROPIC_API_KEY")
     
+    # LLM Provider Clients (base URLs override the public endpoints)
+    openrouter_base_url: Optional[str] = Field(default=None, env="OPENROUTER_BASE_URL")
+    openai_base_url: Optional[str] = Field(default=None, env="OPENAI_BASE_URL")
+    anthropic_base_url: Optional[str] = Field(default=None, env="ANTHROPIC_BASE_URL")
+    provider_timeout: float = Field(default=60.0, env="PROVIDER_TIMEOUT")
+    provider_max_connections: int = Field(default=20, env="PROVIDER_MAX_CONNECTIONS")
+    provider_max_keepalive: int = Field(default=10, env="PROVIDER_MAX_KEEPALIVE")
+    provider_max_retries: int = Field(default=3, env="PROVIDER_MAX_RETRIES")
+    provider_http2: bool = Field(default=True, env="PROVIDER_HTTP2")
+    
     # Server Configuration
     api_host: str = Field(default="0.0.0.0", env="API_HOST")
     api_port: int = Field(default=8000, env="API_PORT")
@@ -37,12 +47,105 @@ class Settings(BaseSettings):
     default_arabic_model: str = Field(default="qwen-2.5-arabic", env="DEFAULT_ARABIC_MODEL")
     max_tokens: int = Field(default=2000, env="MAX_TOKENS")
     temperature: float = Field(default=0.7, env="TEMPERATURE")
+    context_max_tokens: int = Field(default=1500, env="CONTEXT_MAX_TOKENS")
+    
+    # Model Routing (cheapest capable model within the latency SLO)
+    model_routing: bool = Field(default=True, env="MODEL_ROUTING")
+    router_latency_slo_ms: Optional[float] = Field(default=None, env="ROUTER_LATENCY_SLO_MS")
+    router_response_tokens: int = Field(default=512, env="ROUTER_RESPONSE_TOKENS")
+    router_ewma_alpha: float = Field(default=0.2, env="ROUTER_EWMA_ALPHA")
+    router_error_threshold: float = Field(default=0.5, env="ROUTER_ERROR_THRESHOLD")
+    router_cooldown_seconds: float = Field(default=30.0, env="ROUTER_COOLDOWN_SECONDS")
+    
+    # Hedged Model Calls (a duplicate request after the primary's p95 latency)
+    hedge_requests: bool = Field(default=False, env="HEDGE_REQUESTS")
+    hedge_budget_ratio: float = Field(default=0.1, env="HEDGE_BUDGET_RATIO")
+    hedge_percentile: float = Field(default=0.95, env="HEDGE_PERCENTILE")
+    hedge_min_samples: int = Field(default=20, env="HEDGE_MIN_SAMPLES")
+    hedge_default_delay_ms: float = Field(default=2000.0, env="HEDGE_DEFAULT_DELAY_MS")
+    
+    # Response Generation (False keeps the built-in canned responses)
+    llm_responses: bool = Field(default=False, env="LLM_RESPONSES")
+    # Unread events a streaming client may fall behind before token output waits
+    stream_high_water: int = Field(default=64, env="STREAM_HIGH_WATER")
     
     # Agent Configuration
     max_reasoning_steps: int = Field(default=5, env="MAX_REASONING_STEPS")
     enable_web_search: bool = Field(default=True, env="ENABLE_WEB_SEARCH")
     enable_code_generation: bool = Field(default=True, env="ENABLE_CODE_GENERATION")
     enable_shell_execution: bool = Field(default=False, env="ENABLE_SHELL_EXECUTION")
+    enable_file_writes: bool = Field(default=True, env="ENABLE_FILE_WRITES")
+    # Fetching URLs named in prompts (never private, loopback or link-local
+    # addresses; with an allow-list, only those hosts and their subdomains)
+    enable_url_fetch: bool = Field(default=False, env="ENABLE_URL_FETCH")
+    url_fetch_allowed_hosts: List[str] = Field(default=[], env="URL_FETCH_ALLOWED_HOSTS")
+    plan_step_timeout: float = Field(default=30.0, env="PLAN_STEP_TIMEOUT")
+    
+    # Tool Runtime (sync tools run in worker pools)
+    tool_thread_workers: int = Field(default=8, env="TOOL_THREAD_WORKERS")
+    tool_process_workers: int = Field(default=2, env="TOOL_PROCESS_WORKERS")
+    tool_max_concurrency: int = Field(default=4, env="TOOL_MAX_CONCURRENCY")
+    tool_timeout: float = Field(default=30.0, env="TOOL_TIMEOUT")
+    
+    # Text Processing Cache (0 disables)
+    processor_cache_size: int = Field(default=0, env="PROCESSOR_CACHE_SIZE")
+    processor_cache_max_bytes: int = Field(default=8 * 1024 * 1024, env="PROCESSOR_CACHE_MAX_BYTES")
+    
+    # Response Cache (0 disables; TTLs in seconds per intent, 0 = never cache)
+    response_cache_size: int = Field(default=0, env="RESPONSE_CACHE_SIZE")
+    response_cache_max_bytes: int = Field(default=16 * 1024 * 1024, env="RESPONSE_CACHE_MAX_BYTES")
+    response_cache_mode: str = Field(default="normalized", env="RESPONSE_CACHE_MODE")
+    response_cache_disk: bool = Field(default=False, env="RESPONSE_CACHE_DISK")
+    response_cache_disk_max_bytes: int = Field(default=256 * 1024 * 1024, env="RESPONSE_CACHE_DISK_MAX_BYTES")
+    response_cache_ttl: float = Field(default=3600.0, env="RESPONSE_CACHE_TTL")
+    response_cache_ttls: Dict[str, float] = Field(
+        default={"search": 300.0, "execute_command": 0.0},
+        env="RESPONSE_CACHE_TTLS"
+    )
+    # Share one execution between identical concurrent requests
+    request_coalescing: bool = Field(default=True, env="REQUEST_COALESCING")
+    
+    # Batch Analysis
+    batch_max_prompts: int = Field(default=1000, env="BATCH_MAX_PROMPTS")
+    batch_workers: int = Field(default=0, env="BATCH_WORKERS")
+    
+    # Conversation Sessions
+    session_max_count: int = Field(default=10000, env="SESSION_MAX_COUNT")
+    session_ttl_seconds: float = Field(default=1800.0, env="SESSION_TTL_SECONDS")
+    session_shards: int = Field(default=16, env="SESSION_SHARDS")
+    context_max_history: int = Field(default=10, env="CONTEXT_MAX_HISTORY")
+    
+    # Conversation Persistence (SQLite under cache_dir unless a path is given)
+    conversation_persistence: bool = Field(default=False, env="CONVERSATION_PERSISTENCE")
+    conversation_db_path: Optional[Path] = Field(default=None, env="CONVERSATION_DB_PATH")
+    
+    # Semantic History Retrieval ("hashing", "sentence-transformers" or "none")
+    context_embedder: str = Field(default="hashing", env="CONTEXT_EMBEDDER")
+    context_embedding_dim: int = Field(default=128, env="CONTEXT_EMBEDDING_DIM")
+    context_embedding_model: Optional[str] = Field(default=None, env="CONTEXT_EMBEDDING_MODEL")
+    context_vector_memmap: bool = Field(default=False, env="CONTEXT_VECTOR_MEMMAP")
+    
+    # Execution Log (DEBUG also records each request's progress; JSON lines go to logs_dir)
+    log_level: str = Field(default="INFO", env="LOG_LEVEL")
+    log_buffer_size: int = Field(default=100, env="LOG_BUFFER_SIZE")
+    log_sink: bool = Field(default=False, env="LOG_SINK")
+    log_flush_interval: float = Field(default=1.0, env="LOG_FLUSH_INTERVAL")
+    
+    # Admission Control (requests beyond the in-flight limit queue by intent priority;
+    # rate limiting per api_key_header value is off while ADMISSION_RATE is 0)
+    admission_control: bool = Field(default=True, env="ADMISSION_CONTROL")
+    admission_max_in_flight: int = Field(default=64, env="ADMISSION_MAX_IN_FLIGHT")
+    admission_max_queue: int = Field(default=256, env="ADMISSION_MAX_QUEUE")
+    admission_queue_timeout: float = Field(default=5.0, env="ADMISSION_QUEUE_TIMEOUT")
+    admission_priorities: Dict[str, int] = Field(
+        default={"read_file": 0, "create_file": 0, "search": 2, "generate_code": 2},
+        env="ADMISSION_PRIORITIES"
+    )
+    admission_rate: float = Field(default=0.0, env="ADMISSION_RATE")
+    admission_burst: int = Field(default=20, env="ADMISSION_BURST")
+    
+    # Metrics (stage latency histograms and counters at /metrics)
+    metrics_enabled: bool = Field(default=True, env="METRICS_ENABLED")
     
     # Paths
     base_dir: Path = Path(__file__).parent.parent.parent
@@ -1,12 +1,25 @@
 """DL+ Intelligence System - Core Package"""
 
 from .intelligence_core import IntelligenceCore
-from .arabic_processor import ArabicProcessor, IntentType
+from .admission import AdmissionController, AdmissionRejected
+from .arabic_processor import ArabicProcessor, EntityMatch, IntentType, NormalizationProfile
 from .context_analyzer import ContextAnalyzer
+from .event_stream import EventStream
+from .execution_log import ExecutionLog
+from .session_store import SessionStore
+from .tool_runtime import ToolRuntime
 
 __all__ = [
     'IntelligenceCore',
+    'AdmissionController',
+    'AdmissionRejected',
     'ArabicProcessor',
     'IntentType',
-    'ContextAnalyzer'
+    'EntityMatch',
+    'NormalizationProfile',
+    'ContextAnalyzer',
+    'EventStream',
+    'ExecutionLog',
+    'SessionStore',
+    'ToolRuntime'
 ]
@@ -0,0 +1,224 @@
+"""
+Admission Control
+التحكم في قبول الطلبات
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional
+
+# Lower runs first: quick file operations ahead of searches and code
+# generation; intents not listed get 1
+DEFAULT_PRIORITIES = {"read_file": 0, "create_file": 0, "search": 2, "generate_code": 2}
+
+
+class AdmissionRejected(Exception):
+    """A request turned away; ``retry_after`` is a suggested delay in seconds"""
+    
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _TokenBucket:
+    """Request allowance for one API key"""
+    
+    __slots__ = ("tokens", "updated")
+    
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class _Ticket:
+    """An admitted request; releasing it twice is harmless"""
+    
+    __slots__ = ("admitted_at", "released")
+    
+    def __init__(self, admitted_at: float):
+        self.admitted_at = admitted_at
+        self.released = False
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a priority queue and per-key quotas
+    حد للطلبات المتزامنة مع طابور أولويات وحصص لكل مفتاح
+    
+    At most ``max_in_flight`` requests run at once. Others wait in a queue
+    ordered by priority (lower first), then arrival. A request is turned
+    away immediately when the queue is full or when its expected wait,
+    estimated from the requests ahead of it and a moving average of how
+    long requests take, exceeds ``max_queue_wait``; a queued request that
+    is still waiting after ``max_queue_wait`` is turned away too. Under
+    saturation latency therefore stays bounded and excess load gets a
+    fast rejection with a retry hint instead of an ever longer queue.
+    
+    With ``rate`` > 0 each key also has a token bucket of ``burst``
+    requests refilled at ``rate`` per second. Buckets for the
+    ``max_keys`` most recently seen keys are kept.
+    """
+    
+    def __init__(
+        self,
+        max_in_flight: int = 64,
+        max_queue: int = 256,
+        max_queue_wait: float = 5.0,
+        priorities: Optional[Dict[str, int]] = None,
+        rate: float = 0.0,
+        burst: int = 20,
+        max_keys: int = 10000,
+        alpha: float = 0.2,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.priorities = dict(DEFAULT_PRIORITIES if priorities is None else priorities)
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.alpha = alpha
+        self.clock = clock
+        
+        self.in_flight = 0
+        # (priority, arrival, future); cancelled futures are skipped when popped
+        self._queue: List[tuple] = []
+        self._arrivals = itertools.count()
+        # Live (not cancelled) queued requests per priority
+        self._queued: Dict[int, int] = {}
+        self._buckets: "OrderedDict[Hashable, _TokenBucket]" = OrderedDict()
+        # Smoothed seconds a request holds its slot
+        self.service_time: Optional[float] = None
+        
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected: Dict[str, int] = {"rate_limited": 0, "queue_full": 0, "wait_estimate": 0, "queue_timeout": 0}
+    
+    def priority(self, intent: str) -> int:
+        """Queue priority for an intent (lower runs first)"""
+        return self.priorities.get(intent, 1)
+    
+    @property
+    def queued(self) -> int:
+        return sum(self._queued.values())
+    
+    def estimated_wait(self, priority: int) -> float:
+        """Expected seconds before a new request at ``priority`` would start"""
+        if self.in_flight < self.max_in_flight and not self.queued:
+            return 0.0
+        ahead = sum(count for level, count in self._queued.items() if level <= priority)
+        service_time = self.service_time if self.service_time is not None else 0.0
+        # Slots free up at max_in_flight / service_time per second
+        return (ahead + 1) * service_time / self.max_in_flight
+    
+    async def acquire(self, key: Hashable = None, priority: int = 1) -> _Ticket:
+        """
+        Wait for a slot; raises AdmissionRejected when the request is shed
+        
+        Pass the returned ticket to ``release`` when the request finishes.
+        """
+        self._take_token(key)
+        
+        if self.in_flight < self.max_in_flight and not self.queued:
+            return self._admit()
+        
+        if self.queued >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise AdmissionRejected("queue is full", self._retry_after(priority))
+        wait = self.estimated_wait(priority)
+        if wait > self.max_queue_wait:
+            self.rejected["wait_estimate"] += 1
+            raise AdmissionRejected(f"expected wait {wait:.1f}s exceeds {self.max_queue_wait:g}s", wait)
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._arrivals), future))
+        self._queued[priority] = self._queued.get(priority, 0) + 1
+        self.queued_total += 1
+        try:
+            done, _ = await asyncio.wait({future}, timeout=self.max_queue_wait)
+        except asyncio.CancelledError:
+            self._abandon(future, priority)
+            raise
+        if not done:
+            self._abandon(future, priority)
+            self.rejected["queue_timeout"] += 1
+            raise AdmissionRejected("timed out waiting in the queue", self._retry_after(priority))
+        return future.result()
+    
+    def release(self, ticket: Optional[_Ticket]):
+        """Free a ticket's slot and start the next queued request"""
+        if ticket is None or ticket.released:
+            return
+        ticket.released = True
+        elapsed = self.clock() - ticket.admitted_at
+        if self.service_time is None:
+            self.service_time = elapsed
+        else:
+            self.service_time += self.alpha * (elapsed - self.service_time)
+        self.in_flight -= 1
+        self._dispatch()
+    
+    def _admit(self) -> _Ticket:
+        self.in_flight += 1
+        self.admitted += 1
+        return _Ticket(self.clock())
+    
+    def _dispatch(self):
+        while self._queue and self.in_flight < self.max_in_flight:
+            priority, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._queued[priority] -= 1
+            future.set_result(self._admit())
+    
+    def _abandon(self, future: asyncio.Future, priority: int):
+        """Withdraw a queued request, handing back a slot granted meanwhile"""
+        if future.done() and not future.cancelled():
+            # Never used, so it says nothing about service time
+            future.result().released = True
+            self.in_flight -= 1
+            self._dispatch()
+            return
+        future.cancel()
+        self._queued[priority] -= 1
+    
+    def _take_token(self, key: Hashable):
+        if self.rate <= 0:
+            return
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _TokenBucket(float(self.burst), now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(float(self.burst), bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        
+        if bucket.tokens < 1.0:
+            self.rejected["rate_limited"] += 1
+            raise AdmissionRejected("rate limit exceeded", (1.0 - bucket.tokens) / self.rate)
+        bucket.tokens -= 1.0
+    
+    def _retry_after(self, priority: int) -> float:
+        return max(self.estimated_wait(priority), self.service_time or 1.0)
+    
+    def get_stats(self) -> Dict:
+        """Occupancy, service time and rejection counters"""
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "rejected": dict(self.rejected),
+            "service_time_ms": round(self.service_time * 1000, 3) if self.service_time is not None else None,
+            "tracked_keys": len(self._buckets)
+        }
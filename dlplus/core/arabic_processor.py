@@ -3,10 +3,19 @@ Arabic Language Processor
 معالج اللغة العربية المتقدم
 """
 
+import os
 import re
-from typing import Dict, List, Optional, Tuple
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+from dataclasses import dataclass
 from enum import Enum
 
+from .keyword_matcher import KeywordMatcher
+from .lru_cache import LRUCache
+
 
 class IntentType(Enum):
     """Types of user intents / أنواع النوايا"""
@@ -21,13 +30,104 @@ class IntentType(Enum):
     UNKNOWN = "unknown"
 
 
+class EntityMatch(NamedTuple):
+    """An extracted entity with its character span in the source text"""
+    kind: str
+    value: str
+    start: int
+    end: int
+
+
+# First words that make a quoted string look like a shell command
+SHELL_COMMANDS = frozenset([
+    "ls", "cd", "pwd", "cat", "echo", "grep", "find", "mkdir", "rm", "cp", "mv",
+    "chmod", "touch", "head", "tail", "python", "python3", "pip", "npm", "node",
+    "git", "docker", "curl", "wget", "bash", "sh", "sudo", "df", "free", "uptime",
+    "whoami", "date", "ps", "kill", "tar", "make"
+])
+
+# Characters folded by NormalizationProfile / الحروف المستخدمة في التطبيع
+ARABIC_DIACRITICS = [*range(0x0617, 0x061B), *range(0x064B, 0x0653), 0x0670]
+ALEF_VARIANTS = "إأآٱ"
+TEH_MARBUTA = "ة"
+ALEF_MAKSURA = "ى"
+TATWEEL = "ـ"
+ARABIC_INDIC_DIGITS = "٠١٢٣٤٥٦٧٨٩"
+EASTERN_ARABIC_INDIC_DIGITS = "۰۱۲۳۴۵۶۷۸۹"
+
+
+@dataclass(frozen=True)
+class NormalizationProfile:
+    """
+    Steps applied by ArabicProcessor.normalize_text
+    خطوات تطبيع النص العربي
+    """
+    remove_diacritics: bool = True
+    fold_alef: bool = True
+    fold_teh_marbuta: bool = True
+    fold_yeh: bool = True
+    remove_tatweel: bool = True
+    fold_digits: bool = True
+    collapse_whitespace: bool = True
+    
+    def translation_table(self) -> Tuple[Optional[str], ...]:
+        """Build the str.translate table for this profile"""
+        table: Dict[int, Optional[str]] = {}
+        
+        if self.remove_diacritics:
+            table.update(dict.fromkeys(ARABIC_DIACRITICS))
+        if self.fold_alef:
+            table.update({ord(char): "ا" for char in ALEF_VARIANTS})
+        if self.fold_teh_marbuta:
+            table[ord(TEH_MARBUTA)] = "ه"
+        if self.fold_yeh:
+            table[ord(ALEF_MAKSURA)] = "ي"
+        if self.remove_tatweel:
+            table[ord(TATWEEL)] = None
+        if self.fold_digits:
+            for digits in (ARABIC_INDIC_DIGITS, EASTERN_ARABIC_INDIC_DIGITS):
+                table.update({ord(char): str(value) for value, char in enumerate(digits)})
+        
+        return dense_translation_table(table)
+
+
+def dense_translation_table(mapping: Dict[int, Optional[str]]) -> Tuple[Optional[str], ...]:
+    """
+    Turn a translate mapping into a tuple indexed by code point
+    
+    str.translate looks a tuple up several times faster than a dict.
+    Unmapped code points map to themselves, and code points past the end
+    of the tuple are left unchanged.
+    """
+    table: List = [chr(code) for code in range(max(mapping, default=-1) + 1)]
+    for code, replacement in mapping.items():
+        table[code] = replacement
+    return tuple(table)
+
+
 class ArabicProcessor:
     """
     Advanced Arabic language processor
     معالج متقدم للغة العربية
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        normalization: Optional[NormalizationProfile] = None,
+        cache_size: int = 0,
+        cache_max_bytes: int = 8 * 1024 * 1024
+    ):
+        # Opt-in memoization of normalize_text/detect_intent/extract_entities
+        self.cache = LRUCache(cache_size, cache_max_bytes) if cache_size > 0 else None
+        # Worker processes for analyze_many, started by the first parallel batch
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        
+        # Normalization profile, compiled to one translate table
+        self.normalization = normalization or NormalizationProfile()
+        self.normalization_table = self.normalization.translation_table()
+        self.diacritics_table = dense_translation_table(dict.fromkeys(ARABIC_DIACRITICS))
+        
         # Arabic intent keywords / كلمات مفتاحية للنوايا
         self.intent_keywords = {
             IntentType.SEARCH: [
@@ -57,33 +157,77 @@ class ArabicProcessor:
             ]
         }
         
-        # Arabic diacritics / التشكيل العربي
-        self.arabic_diacritics = re.compile(r'[\u0617-\u061A\u064B-\u0652]')
+        # English intent keywords (ranked after all Arabic keywords)
+        self.english_intent_keywords = {
+            IntentType.SEARCH: ['search', 'find', 'look for'],
+            IntentType.GENERATE_CODE: ['code', 'program', 'script', 'generate'],
+            IntentType.EXECUTE_COMMAND: ['execute', 'run', 'command'],
+            IntentType.CREATE_FILE: ['create file', 'write file', 'save to'],
+            IntentType.READ_FILE: ['read file', 'open file', 'file content'],
+            IntentType.ANALYZE: ['analyze', 'analysis', 'examine']
+        }
         
         # Arabic letters range
         self.arabic_range = re.compile(r'[\u0600-\u06FF]')
+        
+        # Master entity pattern: one finditer pass, dispatched on lastgroup.
+        # Every branch starts with a literal so the scanner can skip ahead;
+        # file names are anchored on their extension and the stem is
+        # recovered by walking back from the dot.
+        self.entity_pattern = re.compile(r"""
+            (?P<url>https?://[^\s<>"{}|\\^`\[\]]+)
+          | ```(?P<language>[\w+\#.\-]*)
+          | \$[ \t]+(?P<prompt>[^\n]*[^\s])
+          | "(?P<double_quoted>[^"]+)"
+          | '(?P<single_quoted>[^']+)'
+          | `(?P<backquoted>[^`]+)`
+          | \.(?P<extension>(?i:py|js|ts|txt|md|json|html|css|sh|yml|yaml|env|csv|log))\b
+        """, re.VERBOSE)
+        
+        # All keyword tables compiled into one matcher / مطابق الكلمات المفتاحية
+        keyword_table = {}
+        for table in (self.intent_keywords, self.english_intent_keywords):
+            for intent, keywords in table.items():
+                for keyword, entry in self._intent_entries(intent, keywords):
+                    if keyword not in keyword_table or entry[0] < keyword_table[keyword][0]:
+                        keyword_table[keyword] = entry
+        self.intent_matcher = KeywordMatcher(keyword_table)
+        
+        # Inverted token index for ranked intent scoring / فهرس الكلمات للتصنيف
+        self.word_pattern = re.compile(r'\w+')
+        self.arabic_proclitics = ('و', 'ف', 'ب', 'ل')
+        self.intent_order = {intent: order for order, intent in enumerate(IntentType)}
+        self.intent_index: Dict[Tuple[str, ...], List[Tuple[IntentType, float]]] = {}
+        self.max_keyword_tokens = 1
+        for table in (self.intent_keywords, self.english_intent_keywords):
+            for intent, keywords in table.items():
+                self._index_keywords(intent, keywords)
     
     def is_arabic(self, text: str) -> bool:
         """Check if text contains Arabic characters"""
-        return bool(self.arabic_range.search(text))
+        return not text.isascii() and bool(self.arabic_range.search(text))
     
     def remove_diacritics(self, text: str) -> str:
         """Remove Arabic diacritics/تشكيل"""
-        return self.arabic_diacritics.sub('', text)
+        return text.translate(self.diacritics_table)
     
     def normalize_text(self, text: str) -> str:
-        """Normalize Arabic text"""
-        # Remove diacritics
-        text = self.remove_diacritics(text)
-        
-        # Normalize Alef variations
-        text = re.sub(r'[إأآا]', 'ا', text)
+        """Normalize Arabic text (memoized when the cache is enabled)"""
+        return self._memoize("normalize", text, self._normalize_text)
+    
+    def _normalize_text(self, text: str) -> str:
+        """
+        Normalize Arabic text in a single translate pass
         
-        # Normalize Teh Marbuta
-        text = re.sub(r'ة', 'ه', text)
+        Diacritics, alef/teh marbuta/yeh variants, tatweel and Arabic-Indic
+        digits are folded according to the normalization profile. Pure
+        ASCII text has nothing to fold and skips straight to whitespace.
+        """
+        if not text.isascii():
+            text = text.translate(self.normalization_table)
         
-        # Remove extra spaces
-        text = re.sub(r'\s+', ' ', text).strip()
+        if self.normalization.collapse_whitespace:
+            text = ' '.join(text.split())
         
         return text
     
@@ -92,55 +236,473 @@ class ArabicProcessor:
         Detect user intent from Arabic or English text
         كشف نية المستخدم من النص
         """
-        text_normalized = self.normalize_text(text.lower())
-        
-        # Check Arabic keywords
-        for intent, keywords in self.intent_keywords.items():
-            for keyword in keywords:
-                if keyword in text_normalized:
-                    return intent
-        
-        # Check English keywords
-        if any(word in text.lower() for word in ['search', 'find', 'look for']):
-            return IntentType.SEARCH
-        elif any(word in text.lower() for word in ['code', 'program', 'script', 'generate']):
-            return IntentType.GENERATE_CODE
-        elif any(word in text.lower() for word in ['execute', 'run', 'command']):
-            return IntentType.EXECUTE_COMMAND
-        elif any(word in text.lower() for word in ['create file', 'write file', 'save to']):
-            return IntentType.CREATE_FILE
-        elif any(word in text.lower() for word in ['read file', 'open file', 'file content']):
-            return IntentType.READ_FILE
-        elif any(word in text.lower() for word in ['analyze', 'analysis', 'examine']):
-            return IntentType.ANALYZE
-        
-        return IntentType.UNKNOWN
+        return self._memoize(
+            "intent",
+            text,
+            lambda text: self._match_intent(self._normalize_text(text.lower()))
+        )
+    
+    def _match_intent(self, text_normalized: str) -> IntentType:
+        """Detect intent from already lowercased, normalized text"""
+        # Single scan over every Arabic and English keyword; Arabic
+        # keywords outrank English ones, then IntentType order applies
+        match = self.intent_matcher.best_match(text_normalized)
+        
+        return match[1] if match else IntentType.UNKNOWN
+    
+    def add_intent_keywords(self, intent: IntentType, keywords: List[str]):
+        """
+        Register extra keywords for an intent at runtime
+        إضافة كلمات مفتاحية لنية أثناء التشغيل
+        
+        Only the new keywords are compiled; the existing tables are reused.
+        Memoized results are dropped, since they may depend on the old
+        keywords.
+        """
+        for keyword in keywords:
+            table = self.intent_keywords if self.is_arabic(keyword) else self.english_intent_keywords
+            table.setdefault(intent, []).append(keyword)
+        self.intent_matcher.add_keywords(dict(self._intent_entries(intent, keywords)))
+        self._index_keywords(intent, keywords)
+        if self.cache is not None:
+            self.cache.clear()
+        # Workers hold copies with the old keywords; a batch still using
+        # the pool keeps it until done, and it shuts down once dropped
+        with self._pool_lock:
+            self._pool = None
+    
+    def rank_intents(self, text: str) -> List[Tuple[IntentType, float]]:
+        """
+        Score every intent mentioned in the text
+        تقييم جميع النوايا المذكورة في النص
+        
+        Tokenizes the normalized text once and looks each token n-gram up
+        in the inverted keyword index, so compound requests such as
+        "ابحث ثم اكتب كود" yield several intents. Returns (intent, confidence)
+        pairs, best first, with confidences summing to 1; an empty list
+        means no intent was recognized. Memoized when the cache is enabled.
+        """
+        return list(self._memoize(
+            "rank",
+            text,
+            lambda text: tuple(self._score_intents(self._normalize_text(text.lower())))
+        ))
+    
+    def _score_intents(self, text_normalized: str) -> List[Tuple[IntentType, float]]:
+        """Rank intents for already lowercased, normalized text"""
+        tokens = self.word_pattern.findall(text_normalized)
+        scores: Dict[IntentType, float] = {}
+        
+        position = 0
+        while position < len(tokens):
+            postings, width = self._lookup_tokens(tokens, position)
+            for intent, weight in postings:
+                scores[intent] = scores.get(intent, 0.0) + weight
+            position += width
+        
+        total = sum(scores.values())
+        if not total:
+            return []
+        
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (-item[1], self.intent_order[item[0]])
+        )
+        return [(intent, score / total) for intent, score in ranked]
+    
+    def _lookup_tokens(
+        self,
+        tokens: Sequence[str],
+        position: int
+    ) -> Tuple[List[Tuple[IntentType, float]], int]:
+        """Find the longest indexed keyword starting at position"""
+        longest = min(self.max_keyword_tokens, len(tokens) - position)
+        for width in range(longest, 1, -1):
+            postings = self.intent_index.get(tuple(tokens[position:position + width]))
+            if postings:
+                return postings, width
+        
+        # Single token, retrying without a leading proclitic or article
+        token = tokens[position]
+        candidates = [token]
+        if len(token) > 3 and token[0] in self.arabic_proclitics:
+            candidates.append(token[1:])
+        for candidate in list(candidates):
+            if len(candidate) > 4 and candidate.startswith('ال'):
+                candidates.append(candidate[2:])
+        
+        for candidate in candidates:
+            postings = self.intent_index.get((candidate,))
+            if postings:
+                return postings, 1
+        
+        return [], 1
+    
+    def _index_keywords(self, intent: IntentType, keywords: List[str]):
+        """Add keywords to the inverted token index"""
+        for keyword in keywords:
+            tokens = tuple(self.word_pattern.findall(self._normalize_text(keyword.lower())))
+            if not tokens:
+                continue
+            
+            # Longer phrases are more specific, so they weigh more
+            postings = self.intent_index.setdefault(tokens, [])
+            if all(existing != intent for existing, _ in postings):
+                postings.append((intent, float(len(tokens))))
+            self.max_keyword_tokens = max(self.max_keyword_tokens, len(tokens))
+    
+    def _intent_entries(self, intent: IntentType, keywords: List[str]):
+        """Yield (normalized keyword, (rank, intent)) matcher entries"""
+        order = list(IntentType).index(intent)
+        for keyword in keywords:
+            normalized = self._normalize_text(keyword.lower())
+            # Arabic keywords rank ahead of every English keyword
+            tier = 0 if self.is_arabic(normalized) else len(IntentType)
+            yield normalized, (tier + order, intent)
     
     def extract_entities(self, text: str) -> Dict[str, List[str]]:
         """
         Extract entities from text (file names, URLs, commands, etc.)
         استخراج الكيانات من النص
         """
+        if self.cache is None:
+            return self._extract_entities(text)
+        
+        # Cached as tuples; every caller gets its own lists
+        entities = self._memoize(
+            "entities",
+            text,
+            lambda text: {
+                kind: tuple(values) for kind, values in self._extract_entities(text).items()
+            }
+        )
+        return {kind: list(values) for kind, values in entities.items()}
+    
+    def _extract_entities(self, text: str) -> Dict[str, List[str]]:
+        """Extract entities without caching"""
         entities = {
             "files": [],
             "urls": [],
             "commands": [],
-            "keywords": []
+            "keywords": [],
+            "languages": []
+        }
+        
+        for entity in self.extract_entity_matches(text):
+            entities[entity.kind].append(entity.value)
+        
+        return entities
+    
+    def extract_entity_matches(self, text: str) -> List[EntityMatch]:
+        """
+        Extract entities with their character offsets in one scan
+        استخراج الكيانات مع مواقعها في النص
+        
+        ``text[entity.start:entity.end] == entity.value`` for every result,
+        so downstream tools can slice the original text without rescanning.
+        """
+        matches = []
+        floor = 0
+        for match in self.entity_pattern.finditer(text):
+            self._match_entities(text, match, 0, floor, matches)
+            floor = match.end()
+        return matches
+    
+    def _match_entities(
+        self,
+        text: str,
+        match: re.Match,
+        offset: int,
+        floor: int,
+        out: List[EntityMatch]
+    ):
+        """
+        Append the entities for one master-pattern match to out
+        
+        ``floor`` is where the previous match ended; a file stem never
+        reaches back past it. ``offset`` is added to reported positions.
+        """
+        group = match.lastgroup
+        
+        if group == "url":
+            out.append(EntityMatch("urls", match.group(group), match.start() + offset, match.end() + offset))
+            return
+        
+        if group == "extension":
+            dot, end = match.span()
+            stem = self._file_stem_start(text, dot, floor)
+            if stem is not None:
+                out.append(EntityMatch("files", text[stem:end], stem + offset, end + offset))
+            return
+        
+        start, end = match.span(group)
+        value = match.group(group)
+        
+        if group == "language":
+            if value:
+                out.append(EntityMatch("languages", value, start + offset, end + offset))
+            return
+        
+        if group == "prompt":
+            if self._at_line_start(text, match.start(), offset):
+                out.append(EntityMatch("commands", value, start + offset, end + offset))
+        else:
+            # Quoted text is a keyword, and a command if it starts like one
+            out.append(EntityMatch("keywords", value, start + offset, end + offset))
+            words = value.split(None, 1)
+            if words and words[0] in SHELL_COMMANDS:
+                out.append(EntityMatch("commands", value, start + offset, end + offset))
+        
+        # Commands and quoted text may contain files or URLs of their own
+        inner_floor = start
+        for inner in self.entity_pattern.finditer(text, start, end):
+            self._match_entities(text, inner, offset, inner_floor, out)
+            inner_floor = inner.end()
+    
+    @staticmethod
+    def _file_stem_start(text: str, dot: int, floor: int) -> Optional[int]:
+        """Walk back from an extension's dot to the start of the file name"""
+        start = dot
+        while start > floor and (text[start - 1].isalnum() or text[start - 1] in "_-./"):
+            start -= 1
+        # Names start with a word character and end with one before the dot
+        while start < dot and text[start] in "-./":
+            start += 1
+        if start == dot or text[dot - 1] in "./":
+            return None
+        return start
+    
+    @staticmethod
+    def _at_line_start(text: str, index: int, offset: int) -> bool:
+        """Check that only spaces or tabs precede index on its line"""
+        while index > 0 and text[index - 1] in " \t":
+            index -= 1
+        if index == 0:
+            return offset == 0
+        return text[index - 1] == "\n"
+    
+    def normalize_stream(
+        self,
+        source: Union[str, os.PathLike, Iterable[str]],
+        chunk_size: int = 64 * 1024
+    ) -> Iterator[str]:
+        """
+        Normalize a large document chunk by chunk
+        تطبيع مستند كبير على دفعات
+        
+        ``source`` is a file path or an iterable of text chunks. Joining the
+        yielded pieces gives the same result as ``normalize_text`` on the
+        whole document, while memory stays bounded by the chunk size.
+        Translation is per character, so only whitespace runs need to be
+        carried across chunk boundaries.
+        """
+        collapse = self.normalization.collapse_whitespace
+        emitted = False
+        pending_space = False
+        
+        for chunk in self._iter_chunks(source, chunk_size):
+            if not chunk.isascii():
+                chunk = chunk.translate(self.normalization_table)
+            
+            if not collapse:
+                yield chunk
+                continue
+            
+            piece = ' '.join(chunk.split())
+            if piece:
+                if emitted and (pending_space or chunk[0].isspace()):
+                    piece = ' ' + piece
+                emitted = True
+                pending_space = chunk[-1].isspace()
+                yield piece
+            elif chunk:
+                # Whitespace only (an all-diacritics chunk is now empty)
+                pending_space = True
+    
+    def extract_entities_stream(
+        self,
+        source: Union[str, os.PathLike, Iterable[str]],
+        chunk_size: int = 64 * 1024,
+        max_entity_length: int = 4096
+    ) -> Iterator[EntityMatch]:
+        """
+        Extract entities from a large document incrementally
+        استخراج الكيانات من مستند كبير تدريجياً
+        
+        Yields ``EntityMatch`` items in document order, with offsets into
+        the whole document. Matches that start within ``max_entity_length``
+        characters of the end of the buffered text wait for the next chunk,
+        so entities straddling a boundary are found once and whole. Memory
+        is bounded by ``chunk_size + max_entity_length``; longer entities
+        are cut at that length.
+        """
+        buffer = ""
+        base = 0
+        resume = 0
+        floor = 0
+        
+        chunks = self._iter_chunks(source, chunk_size)
+        chunk = next(chunks, None)
+        while chunk is not None:
+            buffer += chunk
+            chunk = next(chunks, None)
+            limit = base + len(buffer)
+            if chunk is not None:
+                limit -= max_entity_length
+            
+            found: List[EntityMatch] = []
+            position = resume
+            for match in self.entity_pattern.finditer(buffer, resume - base):
+                if base + match.start() >= limit:
+                    break
+                self._match_entities(buffer, match, base, max(floor - base, 0), found)
+                position = floor = base + match.end()
+            resume = max(position, limit)
+            yield from found
+            
+            # Keep enough text before the resume point to walk back over a
+            # file stem or a prompt's indentation
+            keep_from = max(base, min(resume, max(floor, resume - max_entity_length)))
+            buffer = buffer[keep_from - base:]
+            base = keep_from
+    
+    @staticmethod
+    def _iter_chunks(
+        source: Union[str, os.PathLike, Iterable[str]],
+        chunk_size: int
+    ) -> Iterator[str]:
+        """Yield non-empty text chunks from a file path or chunk iterable"""
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, encoding="utf-8", errors="replace") as handle:
+                while True:
+                    chunk = handle.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+        else:
+            for chunk in source:
+                if chunk:
+                    yield chunk
+    
+    def analyze(self, text: str) -> Dict:
+        """
+        Run language, intent and entity analysis on one text
+        تحليل اللغة والنية والكيانات لنص واحد
+        
+        Normalizes once and shares the result between intent detection and
+        ranking.
+        """
+        text_normalized = self._normalize_text(text.lower())
+        intent = self._memoize("intent", text, lambda text: self._match_intent(text_normalized))
+        ranked = self._memoize("rank", text, lambda text: tuple(self._score_intents(text_normalized)))
+        return {
+            "language": "ar" if self.is_arabic(text) else "en",
+            "intent": intent.value,
+            "intents": [
+                {"intent": intent.value, "confidence": round(confidence, 3)}
+                for intent, confidence in ranked
+            ],
+            "entities": self.extract_entities(text)
         }
+    
+    def analyze_many(
+        self,
+        texts: Iterable[str],
+        workers: int = 0,
+        chunk_size: int = 500
+    ) -> Iterator[Dict]:
+        """
+        Analyze many texts, yielding one ``analyze`` result per text in order
+        تحليل مجموعة من النصوص دفعة واحدة
         
-        # Extract file names (with extensions)
-        file_pattern = r'\b[\w\-]+\.(py|js|txt|md|json|html|css|sh|yml|yaml|env)\b'
-        entities["files"] = re.findall(file_pattern, text, re.IGNORECASE)
+        Texts are consumed lazily in chunks, so iterators of any length can
+        be streamed. With ``workers`` > 1 and more than one chunk of input,
+        chunks are fanned out to a process pool; smaller batches run in
+        this process, where they finish faster than the hand-off. The pool
+        is started by the first parallel batch with ``workers`` processes,
+        each holding a copy of this processor (including runtime
+        keywords), and is shared by later and concurrent batches until
+        ``close``. At most two chunks per worker are in flight per batch.
+        """
+        chunks = self._chunked(texts, chunk_size)
         
-        # Extract URLs
-        url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+'
-        entities["urls"] = re.findall(url_pattern, text)
+        first = next(chunks, None)
+        if first is None:
+            return
+        second = next(chunks, None)
         
-        # Extract quoted strings (potential commands or keywords)
-        quoted_pattern = r'["\']([^"\']+)["\']'
-        entities["keywords"] = re.findall(quoted_pattern, text)
+        if workers <= 1 or second is None:
+            for chunk in chain((first,), (second,) if second else (), chunks):
+                for text in chunk:
+                    yield self.analyze(text)
+            return
         
-        return entities
+        executor = self._worker_pool(workers)
+        pending = deque([
+            executor.submit(_analyze_batch, first),
+            executor.submit(_analyze_batch, second)
+        ])
+        for chunk in chunks:
+            pending.append(executor.submit(_analyze_batch, chunk))
+            while len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    
+    def _worker_pool(self, workers: int) -> ProcessPoolExecutor:
+        """The shared batch worker pool, started on first use"""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_init_batch_worker,
+                    initargs=(self,)
+                )
+            return self._pool
+    
+    def close(self):
+        """Shut down the batch worker processes"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+    
+    def __getstate__(self) -> Dict:
+        # Worker copies get neither the pool nor its lock
+        state = self.__dict__.copy()
+        del state["_pool"], state["_pool_lock"]
+        return state
+    
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+    
+    @staticmethod
+    def _chunked(texts: Iterable[str], size: int) -> Iterator[List[str]]:
+        """Split an iterable into lists of at most size items"""
+        iterator = iter(texts)
+        while True:
+            chunk = list(islice(iterator, size))
+            if not chunk:
+                return
+            yield chunk
+    
+    def _memoize(self, kind: str, text: str, compute):
+        """Look a (kind, text) result up in the cache, computing it on a miss"""
+        if self.cache is None:
+            return compute(text)
+        
+        key = (kind, text)
+        value = self.cache.get(key)
+        if value is None:
+            value = compute(text)
+            self.cache.put(key, value)
+        return value
+    
+    def get_cache_stats(self) -> Optional[Dict]:
+        """Get memoization counters, or None when caching is disabled"""
+        return self.cache.get_stats() if self.cache is not None else None
     
     def generate_response(self, intent: IntentType, context: Dict) -> str:
         """
@@ -171,3 +733,18 @@ class ArabicProcessor:
         text = re.sub(r'(\d)([ء-ي])', r'\1 \2', text)
         
         return text.strip()
+
+
+# Process pool workers for ArabicProcessor.analyze_many
+_batch_processor: Optional[ArabicProcessor] = None
+
+
+def _init_batch_worker(processor: ArabicProcessor):
+    """Install the processor copy used by this worker process"""
+    global _batch_processor
+    _batch_processor = processor
+
+
+def _analyze_batch(texts: List[str]) -> List[Dict]:
+    """Analyze one chunk of texts inside a worker process"""
+    return [_batch_processor.analyze(text) for text in texts]
@@ -3,31 +3,150 @@ Context Analyzer
 محلل السياق والذاكرة
 """
 
-from typing import Dict, List, Optional
+from collections import Counter, OrderedDict, deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
-from dataclasses import dataclass, field
+
+import numpy as np
+
+from .conversation_store import ConversationStore
+from .vector_index import VectorIndex
+from .prompt_context import ContextRenderer, truncate_to_tokens
 
 
-@dataclass
 class ConversationTurn:
-    """Represents a single turn in conversation"""
-    timestamp: datetime
-    user_message: str
-    agent_response: str
-    intent: str
-    entities: Dict[str, List[str]]
-    tools_used: List[str] = field(default_factory=list)
+    """
+    Represents a single turn in conversation
+    
+    Slotted and compact: messages are capped at ``max_chars``, empty entity
+    kinds are dropped and the rest are stored as tuples.
+    """
+    
+    __slots__ = (
+        "seq", "timestamp", "user_message", "agent_response", "intent", "entities", "tools_used",
+        "fragment"
+    )
+    
+    def __init__(
+        self,
+        timestamp: datetime,
+        user_message: str,
+        agent_response: str,
+        intent: str,
+        entities: Dict[str, List[str]],
+        tools_used: Optional[List[str]] = None,
+        max_chars: Optional[int] = None,
+        max_entities: Optional[int] = None,
+        seq: Optional[int] = None
+    ):
+        # Position of the turn within its session, assigned by ContextAnalyzer
+        self.seq = seq
+        self.timestamp = timestamp
+        self.user_message = user_message[:max_chars]
+        self.agent_response = agent_response[:max_chars]
+        self.intent = intent
+        self.entities: Dict[str, Tuple[str, ...]] = {
+            kind: tuple(values[:max_entities])
+            for kind, values in (entities or {}).items()
+            if values
+        }
+        self.tools_used: Tuple[str, ...] = tuple(tools_used or ())
+        # Rendered prompt fragment, filled in by ContextRenderer
+        self.fragment: Optional[Tuple[str, int]] = None
+    
+    @classmethod
+    def from_row(cls, row: Dict) -> "ConversationTurn":
+        """Rebuild a turn read from a ConversationStore"""
+        return cls(
+            timestamp=row["timestamp"],
+            user_message=row["user_message"],
+            agent_response=row["agent_response"],
+            intent=row["intent"],
+            entities=row["entities"],
+            tools_used=row["tools_used"],
+            seq=row["seq"]
+        )
+    
+    def to_dict(self) -> Dict:
+        """Plain, JSON-friendly representation"""
+        return {
+            "timestamp": self.timestamp.isoformat(),
+            "user_message": self.user_message,
+            "agent_response": self.agent_response,
+            "intent": self.intent,
+            "entities": {kind: list(values) for kind, values in self.entities.items()},
+            "tools_used": list(self.tools_used)
+        }
+    
+    def __repr__(self) -> str:
+        return (
+            f"ConversationTurn(intent={self.intent!r}, "
+            f"user_message={self.user_message[:30]!r}, tools_used={self.tools_used!r})"
+        )
 
 
 class ContextAnalyzer:
     """
     Analyzes and maintains conversation context
     يحلل ويحافظ على سياق المحادثة
+    
+    Memory per session is capped: the history is a ring buffer of at most
+    ``max_history`` turns, each holding messages of at most
+    ``max_message_chars`` characters and at most ``max_entities`` values
+    per entity kind; at most ``max_files`` mentioned files are remembered
+    (least recently mentioned dropped first), and tool usage is a counter
+    per tool name. With the defaults a session holds at most about 20 KB
+    per turn (Arabic text at the message cap), roughly 200 KB in total
+    however long it runs, and every update is O(1).
+    
+    With a ``store`` every turn is also persisted under ``session_id``.
+    The session is loaded lazily on first access, and only the last
+    ``max_history`` turns are kept in memory; exports stream the full
+    stored history page by page.
+    
+    With an ``embedder`` each user message also gets a float32 embedding
+    for ``search_history``. Only the hot turns' vectors are kept in
+    memory (``max_history`` rows). With a store and a ``vector_path``,
+    vectors cover the whole session instead and live in a memory-mapped
+    file, so they survive restarts and only turns stored after the file
+    was last written are embedded again.
     """
     
-    def __init__(self, max_history: int = 10):
+    def __init__(
+        self,
+        max_history: int = 10,
+        max_files: int = 50,
+        max_message_chars: int = 4000,
+        max_entities: int = 20,
+        store: Optional[ConversationStore] = None,
+        session_id: str = "default",
+        embedder=None,
+        vector_path: Optional[str] = None,
+        renderer: Optional[ContextRenderer] = None
+    ):
         self.max_history = max_history
-        self.conversation_history: List[ConversationTurn] = []
+        self.max_files = max_files
+        self.max_message_chars = max_message_chars
+        self.max_entities = max_entities
+        self.store = store
+        self.session_id = session_id
+        self._history: Deque[ConversationTurn] = deque(maxlen=max_history)
+        # (kind, value) -> hot turns with that intent / file / tool, oldest first
+        self._index: Dict[Tuple[str, str], Deque[ConversationTurn]] = {}
+        # Whether the store holds turns that are no longer hot
+        self._has_cold_turns = False
+        self._next_seq = 0
+        self.embedder = embedder
+        self.vector_path = vector_path
+        self._vectors: Optional[VectorIndex] = None
+        # Sequence number of the index's first vector
+        self._vector_base = 0
+        # Last embedded text: a request's prompt query becomes its turn
+        self._last_embedding: Optional[Tuple[str, np.ndarray]] = None
+        self.renderer = renderer or ContextRenderer()
+        self._loaded = store is None
+        if self._loaded:
+            self._open_vectors()
         self.context_memory: Dict[str, any] = {}
         self.user_preferences: Dict[str, any] = {
             "language": "ar",
@@ -35,6 +154,43 @@ class ContextAnalyzer:
             "code_style": "pythonic"
         }
     
+    @property
+    def conversation_history(self) -> Deque[ConversationTurn]:
+        """The hot (in-memory) turns, oldest first"""
+        if not self._loaded:
+            self._load()
+        return self._history
+    
+    def _load(self):
+        """Load the most recent stored turns of this session"""
+        self._loaded = True
+        rows = self.store.load_recent(self.session_id, self.max_history)
+        self._has_cold_turns = len(rows) >= self.max_history
+        for row in rows:
+            self._append_turn(ConversationTurn.from_row(row))
+        if rows:
+            self._next_seq = rows[-1]["seq"] + 1
+        self._open_vectors()
+    
+    def _open_vectors(self):
+        """Create the vector index, embedding the turns it is missing"""
+        if self.embedder is None:
+            return
+        
+        if self.store is None or self.vector_path is None:
+            # A ring over the hot turns only
+            self._vectors = VectorIndex(self.embedder.dim, max_rows=self.max_history)
+            self._vector_base = self._next_seq - len(self._history)
+            for turn in self._history:
+                self._vectors.add(self.embedder.embed(turn.user_message))
+            return
+        
+        self._vectors = VectorIndex(self.embedder.dim, path=self.vector_path, count=self._next_seq)
+        self._vector_base = 0
+        if len(self._vectors) < self._next_seq:
+            for row in self.store.iter_turns(self.session_id, from_seq=len(self._vectors)):
+                self._vectors.add(self.embedder.embed(row["user_message"]))
+    
     def add_turn(
         self,
         user_message: str,
@@ -50,64 +206,158 @@ class ContextAnalyzer:
             agent_response=agent_response,
             intent=intent,
             entities=entities,
-            tools_used=tools_used or []
+            tools_used=tools_used,
+            max_chars=self.max_message_chars,
+            max_entities=self.max_entities
         )
         
-        self.conversation_history.append(turn)
+        if not self._loaded:
+            self._load()
+        turn.seq = self._next_seq
+        self._next_seq += 1
+        self._append_turn(turn)
+        if self._vectors is not None:
+            self._vectors.add(self._embed(turn.user_message))
         
-        # Keep only recent history
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[-self.max_history:]
+        if self.store is not None:
+            self.store.append(self.session_id, turn)
+    
+    def _embed(self, text: str) -> np.ndarray:
+        """Embed text, reusing the previous vector for the same text"""
+        last = self._last_embedding
+        if last is not None and last[0] == text:
+            return last[1]
+        vector = self.embedder.embed(text)
+        self._last_embedding = (text, vector)
+        return vector
+    
+    def _append_turn(self, turn: ConversationTurn):
+        """Add a turn to the ring buffer, indexes and context memory"""
+        history = self._history
+        if len(history) == history.maxlen:
+            # The oldest turn is about to drop out of the ring buffer; it is
+            # also the oldest entry of every index bucket it is in
+            evicted = history[0]
+            for key in self._index_keys(evicted):
+                bucket = self._index[key]
+                bucket.popleft()
+                if not bucket:
+                    del self._index[key]
+            self._has_cold_turns = True
+        
+        history.append(turn)
+        for key in self._index_keys(turn):
+            bucket = self._index.get(key)
+            if bucket is None:
+                bucket = self._index[key] = deque()
+            bucket.append(turn)
         
         # Update context memory
         self._update_context_memory(turn)
     
+    @staticmethod
+    def _index_keys(turn: ConversationTurn) -> List[Tuple[str, str]]:
+        """Index keys of a turn, each listed once"""
+        keys = dict.fromkeys([("intent", turn.intent)])
+        keys.update(dict.fromkeys(("file", file) for file in turn.entities.get("files", ())))
+        keys.update(dict.fromkeys(("tool", tool) for tool in turn.tools_used))
+        return list(keys)
+    
     def _update_context_memory(self, turn: ConversationTurn):
         """Update context memory based on new turn"""
-        # Track mentioned files
-        if "files" in turn.entities and turn.entities["files"]:
-            if "mentioned_files" not in self.context_memory:
-                self.context_memory["mentioned_files"] = []
-            self.context_memory["mentioned_files"].extend(turn.entities["files"])
-            # Keep unique files only
-            self.context_memory["mentioned_files"] = list(set(
-                self.context_memory["mentioned_files"]
-            ))
+        # Track mentioned files, most recently mentioned last
+        files = turn.entities.get("files")
+        if files:
+            mentioned = self.context_memory.setdefault("mentioned_files", OrderedDict())
+            for file in files:
+                mentioned[file] = None
+                mentioned.move_to_end(file)
+            while len(mentioned) > self.max_files:
+                mentioned.popitem(last=False)
         
         # Track last intent
         self.context_memory["last_intent"] = turn.intent
         
         # Track tools usage
         if turn.tools_used:
-            if "tools_history" not in self.context_memory:
-                self.context_memory["tools_history"] = []
-            self.context_memory["tools_history"].extend(turn.tools_used)
+            self.context_memory.setdefault("tool_counts", Counter()).update(turn.tools_used)
+    
+    def _recent_turns(self, count: int) -> List[ConversationTurn]:
+        """The last ``count`` turns, oldest first"""
+        history = self.conversation_history
+        return [history[index] for index in range(max(0, len(history) - count), len(history))]
     
     def get_context_summary(self) -> Dict:
         """Get a summary of current context"""
-        recent_intents = [turn.intent for turn in self.conversation_history[-3:]]
+        recent_intents = [turn.intent for turn in self._recent_turns(3)]
+        tool_counts = self.context_memory.get("tool_counts", {})
         
         return {
             "conversation_length": len(self.conversation_history),
             "recent_intents": recent_intents,
-            "mentioned_files": self.context_memory.get("mentioned_files", []),
+            "mentioned_files": list(self.context_memory.get("mentioned_files", ())),
             "last_intent": self.context_memory.get("last_intent", "unknown"),
             "user_preferences": self.user_preferences,
-            "tools_used": list(set(self.context_memory.get("tools_history", [])))
+            "tools_used": list(tool_counts),
+            "tool_counts": dict(tool_counts)
         }
     
     def get_relevant_history(self, current_intent: str, limit: int = 3) -> List[ConversationTurn]:
         """Get relevant conversation history based on current intent"""
-        relevant_turns = []
+        return self._lookup("intent", current_intent, limit)
+    
+    def get_turns_for_file(self, file: str, limit: int = 3) -> List[ConversationTurn]:
+        """Get the most recent turns that mentioned a file"""
+        return self._lookup("file", file, limit)
+    
+    def get_turns_for_tool(self, tool: str, limit: int = 3) -> List[ConversationTurn]:
+        """Get the most recent turns that used a tool"""
+        return self._lookup("tool", tool, limit)
+    
+    def search_history(self, query: str, limit: int = 3) -> List[Tuple[ConversationTurn, float]]:
+        """
+        Find the turns whose user messages are most similar to a query
+        البحث الدلالي في سجل المحادثة
+        
+        Returns ``(turn, cosine similarity)`` pairs, most similar first.
+        Empty when the analyzer has no embedder.
+        """
+        if not self._loaded:
+            self._load()
+        if self._vectors is None:
+            return []
+        
+        base = self._vector_base
+        hits = [(base + number, score) for number, score in self._vectors.search(self._embed(query), limit)]
+        history = self._history
+        first_hot = self._next_seq - len(history)
+        cold = [seq for seq, _ in hits if seq < first_hot]
+        stored = self.store.get_turns_by_seq(self.session_id, cold) if cold else {}
         
-        # Get turns with similar intent
-        for turn in reversed(self.conversation_history):
-            if turn.intent == current_intent:
-                relevant_turns.append(turn)
-                if len(relevant_turns) >= limit:
-                    break
+        results = []
+        for seq, score in hits:
+            if seq >= first_hot:
+                results.append((history[seq - first_hot], score))
+            elif seq in stored:
+                results.append((ConversationTurn.from_row(stored[seq]), score))
+        return results
+    
+    def _lookup(self, kind: str, value: str, limit: int) -> List[ConversationTurn]:
+        """
+        Last ``limit`` turns under an index key, oldest first
+        
+        Served from the in-memory index in O(limit); only when the hot
+        turns are not enough and older turns exist does it ask the store.
+        """
+        if not self._loaded:
+            self._load()
         
-        return list(reversed(relevant_turns))
+        bucket = self._index.get((kind, value), ())
+        if len(bucket) >= limit or self.store is None or not self._has_cold_turns:
+            return [bucket[index] for index in range(max(0, len(bucket) - limit), len(bucket))]
+        
+        rows = self.store.find_turns(self.session_id, kind, value, limit)
+        return [ConversationTurn.from_row(row) for row in rows]
     
     def detect_context_switch(self, new_intent: str) -> bool:
         """Detect if there's a significant context switch"""
@@ -129,49 +379,90 @@ class ContextAnalyzer:
         
         return last_intent != new_intent
     
-    def get_context_for_prompt(self) -> str:
-        """Generate context string to include in AI prompt"""
-        if not self.conversation_history:
-            return "No previous context."
+    def get_context_for_prompt(
+        self,
+        max_tokens: int = 500,
+        query: Optional[str] = None,
+        intent: Optional[str] = None
+    ) -> str:
+        """
+        Generate context string to include in AI prompt
         
-        context_parts = []
+        Turns are packed into ``max_tokens`` (estimated) by relevance: the
+        latest turn, then turns similar to ``query``, then earlier turns
+        with the same ``intent``, then the rest from newest to oldest.
+        """
+        history = self.conversation_history
+        if not history:
+            return "No previous context."
         
-        # Add recent conversation summary
-        recent_turns = self.conversation_history[-3:]
-        if recent_turns:
-            context_parts.append("Recent conversation:")
-            for i, turn in enumerate(recent_turns, 1):
-                context_parts.append(
-                    f"{i}. User: {turn.user_message[:50]}... "
-                    f"Intent: {turn.intent}"
-                )
+        prioritized = [history[-1]]
+        if query:
+            prioritized.extend(turn for turn, _ in self.search_history(query, limit=3))
+        if intent:
+            prioritized.extend(reversed(self.get_relevant_history(intent, limit=3)))
+        prioritized.extend(reversed(history))
         
-        # Add mentioned files
-        mentioned_files = self.context_memory.get("mentioned_files", [])
+        footer = []
+        mentioned_files = self.context_memory.get("mentioned_files", ())
         if mentioned_files:
-            context_parts.append(f"Mentioned files: {', '.join(mentioned_files)}")
+            footer.append(truncate_to_tokens(
+                f"Mentioned files: {', '.join(reversed(mentioned_files))}",
+                max(1, max_tokens // 4)
+            ))
         
         # Add user preferences
         lang = self.user_preferences.get("language", "ar")
-        context_parts.append(f"User prefers: {lang} language")
+        footer.append(f"User prefers: {lang} language")
         
-        return "\n".join(context_parts)
+        return self.renderer.render(prioritized, max_tokens, footer)
     
     def clear_context(self):
         """Clear conversation history and context memory"""
-        self.conversation_history = []
+        self._history.clear()
+        self._index = {}
+        self._has_cold_turns = False
         self.context_memory = {}
+        if self.store is not None:
+            self.store.delete_session(self.session_id)
+        self._loaded = True
+        self._next_seq = 0
+        self._open_vectors()
+    
+    def close(self):
+        """Write memory-mapped vectors to disk"""
+        if self._vectors is not None:
+            self._vectors.flush()
+    
+    def export_page(self, cursor: int = 0, limit: int = 100) -> Dict:
+        """
+        Export one page of the conversation, oldest first
+        
+        Pass the returned ``next_cursor`` back to get the following page; it
+        is None after the last page. With a store the full persisted
+        history is paged, otherwise the in-memory turns.
+        """
+        if self.store is not None:
+            rows = self.store.read_page(self.session_id, cursor, limit)
+            turns = [ConversationTurn.from_row(row).to_dict() for row in rows]
+            next_cursor = rows[-1]["id"] if len(rows) == limit else None
+        else:
+            history = self.conversation_history
+            end = min(cursor + limit, len(history))
+            turns = [history[index].to_dict() for index in range(cursor, end)]
+            next_cursor = end if end < len(history) else None
+        
+        return {"turns": turns, "next_cursor": next_cursor}
+    
+    def iter_conversation(self, page_size: int = 100) -> Iterator[Dict]:
+        """Stream the whole conversation without materializing it"""
+        cursor = 0
+        while cursor is not None:
+            page = self.export_page(cursor, page_size)
+            yield from page["turns"]
+            cursor = page["next_cursor"]
     
     def export_conversation(self) -> List[Dict]:
         """Export conversation history as list of dictionaries"""
-        return [
-            {
-                "timestamp": turn.timestamp.isoformat(),
-                "user_message": turn.user_message,
-                "agent_response": turn.agent_response,
-                "intent": turn.intent,
-                "entities": turn.entities,
-                "tools_used": turn.tools_used
-            }
-            for turn in self.conversation_history
-        ]
+        return list(self.iter_conversation())
+
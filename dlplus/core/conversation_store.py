@@ -0,0 +1,288 @@
+"""
+Conversation Store
+مخزن المحادثات الدائم
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL DEFAULT 0,
+    timestamp TEXT NOT NULL,
+    user_message TEXT NOT NULL,
+    agent_response TEXT NOT NULL,
+    intent TEXT NOT NULL,
+    entities TEXT NOT NULL,
+    tools_used TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id);
+CREATE UNIQUE INDEX IF NOT EXISTS turns_session_seq ON turns (session_id, seq);
+CREATE INDEX IF NOT EXISTS turns_intent ON turns (session_id, intent, id);
+CREATE TABLE IF NOT EXISTS turn_refs (
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    turn_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turn_refs_lookup ON turn_refs (session_id, kind, value, turn_id);
+"""
+
+_COLUMNS = "id, seq, timestamp, user_message, agent_response, intent, entities, tools_used"
+
+
+class ConversationStore:
+    """
+    Append-only SQLite persistence for conversation turns
+    تخزين دائم لأدوار المحادثة باستخدام SQLite
+    
+    The database runs in WAL mode, so readers (including other worker
+    processes) never block the writer. Appends are queued and written in
+    one transaction per event-loop tick, in a worker thread so the loop
+    never waits on SQLite; outside an event loop they are written
+    immediately. Reads flush the queue first, so a session always sees
+    its own writes.
+    
+    Each turn's ``seq`` is assigned inside the insert, one past the
+    session's highest stored seq, and is unique per session. Several
+    worker processes can therefore append to one session safely, though
+    each process's in-memory turns and vectors only reflect its own
+    writes until the session is reloaded.
+    """
+    
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        if str(path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._conn.executescript(SCHEMA)
+        
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[Tuple, List[Tuple[str, str]]]] = []
+        self._flush_loop = None
+        # Scheduled flushes still running, kept so they are not collected
+        self._flush_tasks: Set[asyncio.Task] = set()
+        
+        self.turns_written = 0
+        self.batches_written = 0
+    
+    def append(self, session_id: str, turn) -> None:
+        """Queue a turn for writing"""
+        row = (
+            session_id,
+            turn.timestamp.isoformat(),
+            turn.user_message,
+            turn.agent_response,
+            turn.intent,
+            json.dumps(turn.entities, ensure_ascii=False),
+            json.dumps(turn.tools_used, ensure_ascii=False)
+        )
+        # Secondary index entries, written alongside the turn
+        refs = list(dict.fromkeys(
+            [("file", file) for file in turn.entities.get("files", ())]
+            + [("tool", tool) for tool in turn.tools_used]
+        ))
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        
+        with self._lock:
+            self._pending.append((row, refs))
+            if loop is not None:
+                # One flush per tick; a flush scheduled on a loop that has
+                # since gone away is replaced
+                if self._flush_loop is loop:
+                    return
+                self._flush_loop = loop
+        
+        if loop is None:
+            self.flush()
+        else:
+            loop.call_soon(self._flush_in_thread)
+    
+    def _flush_in_thread(self):
+        task = asyncio.ensure_future(asyncio.to_thread(self.flush))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+    
+    def flush(self) -> int:
+        """Write all queued turns in one transaction; returns how many"""
+        with self._lock:
+            self._flush_loop = None
+            rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            # IMMEDIATE takes the write lock up front, so the highest seq
+            # read by each insert is current across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row, refs in rows:
+                    turn_id = self._conn.execute(
+                        "INSERT INTO turns (session_id, seq, timestamp, user_message, agent_response, "
+                        "intent, entities, tools_used) "
+                        "SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ?, ?, ?, ?, ? FROM turns WHERE session_id = ?",
+                        (*row, row[0])
+                    ).lastrowid
+                    if refs:
+                        self._conn.executemany(
+                            "INSERT INTO turn_refs (session_id, kind, value, turn_id) VALUES (?, ?, ?, ?)",
+                            [(row[0], kind, value, turn_id) for kind, value in refs]
+                        )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            self.turns_written += len(rows)
+            self.batches_written += 1
+            return len(rows)
+    
+    def load_recent(self, session_id: str, limit: int) -> List[Dict]:
+        """The last ``limit`` turns of a session, oldest first"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        return [self._row_to_dict(row) for row in reversed(rows)]
+    
+    def read_page(self, session_id: str, after_id: int = 0, limit: int = 100, from_seq: int = 0) -> List[Dict]:
+        """Up to ``limit`` turns with id greater than ``after_id`` (and seq from ``from_seq``), oldest first"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM turns WHERE session_id = ? AND id > ? AND seq >= ? ORDER BY id LIMIT ?",
+                (session_id, after_id, from_seq, limit)
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+    
+    def iter_turns(self, session_id: str, page_size: int = 100, from_seq: int = 0) -> Iterator[Dict]:
+        """Stream the turns of a session from ``from_seq`` on, one page at a time"""
+        after_id = 0
+        while True:
+            page = self.read_page(session_id, after_id, page_size, from_seq)
+            yield from page
+            if len(page) < page_size:
+                return
+            after_id = page[-1]["id"]
+    
+    def find_turns(self, session_id: str, kind: str, value: str, limit: int = 3) -> List[Dict]:
+        """
+        The last ``limit`` turns with an intent, file or tool, oldest first
+        
+        ``kind`` is "intent", "file" or "tool"; each is an indexed lookup.
+        """
+        self.flush()
+        if kind == "intent":
+            query = (
+                f"SELECT {_COLUMNS} FROM turns WHERE session_id = ? AND intent = ? "
+                "ORDER BY id DESC LIMIT ?"
+            )
+            params = (session_id, value, limit)
+        else:
+            query = (
+                f"SELECT {_COLUMNS} FROM turns WHERE id IN ("
+                "SELECT turn_id FROM turn_refs WHERE session_id = ? AND kind = ? AND value = ? "
+                "ORDER BY turn_id DESC LIMIT ?) ORDER BY id DESC"
+            )
+            params = (session_id, kind, value, limit)
+        
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_dict(row) for row in reversed(rows)]
+    
+    def get_turns_by_seq(self, session_id: str, seqs: List[int]) -> Dict[int, Dict]:
+        """Turns of a session by sequence number, as ``{seq: row}``"""
+        if not seqs:
+            return {}
+        self.flush()
+        placeholders = ", ".join("?" * len(seqs))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM turns WHERE session_id = ? AND seq IN ({placeholders})",
+                (session_id, *seqs)
+            ).fetchall()
+        return {row[1]: self._row_to_dict(row) for row in rows}
+    
+    def count(self, session_id: str) -> int:
+        """Number of stored turns for a session"""
+        self.flush()
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM turns WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+    
+    def delete_session(self, session_id: str) -> None:
+        """Remove every stored turn of a session"""
+        self.flush()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM turn_refs WHERE session_id = ?", (session_id,))
+            self._conn.execute("COMMIT")
+    
+    def close(self) -> None:
+        """Flush queued turns and close the database"""
+        self.flush()
+        with self._lock:
+            self._conn.close()
+    
+    def _migrate(self):
+        """Add columns and constraints introduced after a database was created"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(turns)")}
+        if not columns:
+            return
+        if "seq" not in columns:
+            self._conn.execute("ALTER TABLE turns ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            self._renumber()
+        indexes = {row[1] for row in self._conn.execute("PRAGMA index_list(turns)")}
+        if "turns_session_seq" not in indexes:
+            # Seqs were assigned per process and could collide
+            duplicate = self._conn.execute(
+                "SELECT 1 FROM turns GROUP BY session_id, seq HAVING COUNT(*) > 1 LIMIT 1"
+            ).fetchone()
+            if duplicate is not None:
+                self._renumber()
+            self._conn.execute("DROP INDEX IF EXISTS turns_seq")
+    
+    def _renumber(self):
+        """Number every session's turns from 0 in insertion order"""
+        self._conn.execute(
+            "UPDATE turns SET seq = (SELECT COUNT(*) FROM turns AS earlier "
+            "WHERE earlier.session_id = turns.session_id AND earlier.id < turns.id)"
+        )
+    
+    def get_stats(self) -> Dict:
+        """Get write counters"""
+        return {
+            "path": str(self.path),
+            "turns_written": self.turns_written,
+            "batches_written": self.batches_written,
+            "pending": len(self._pending)
+        }
+    
+    @staticmethod
+    def _row_to_dict(row: Tuple) -> Dict:
+        return {
+            "id": row[0],
+            "seq": row[1],
+            "timestamp": datetime.fromisoformat(row[2]),
+            "user_message": row[3],
+            "agent_response": row[4],
+            "intent": row[5],
+            "entities": json.loads(row[6]),
+            "tools_used": json.loads(row[7])
+        }
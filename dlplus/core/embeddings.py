@@ -0,0 +1,106 @@
+"""
+Text Embeddings
+تمثيلات النصوص المتجهية
+"""
+
+from typing import Optional
+
+import numpy as np
+
+# 64-bit mixing constants (splitmix64 finalizer) and the rolling-hash base
+_BASE = np.uint64(0x100000001B3)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+class HashingEmbedder:
+    """
+    Local character n-gram embedder using the hashing trick
+    مولد تمثيلات محلي يعتمد على تجزئة مقاطع الحروف
+    
+    Every character n-gram of the casefolded text is hashed into one of
+    ``dim`` buckets with a ±1 sign, and the result is L2-normalized. The
+    hashes are computed with NumPy over the code points, need no model or
+    network, and are stable across processes, so stored vectors stay valid
+    after a restart. Works the same for Arabic and English text.
+    """
+    
+    def __init__(self, dim: int = 128, ngram_range: tuple = (3, 4)):
+        if dim & (dim - 1):
+            raise ValueError(f"dim must be a power of two, got {dim}")
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self._mask = np.uint64(dim - 1)
+    
+    def embed(self, text: str) -> np.ndarray:
+        """Embed one text as a unit-length float32 vector"""
+        padded = " %s " % " ".join(text.casefold().split())
+        codes = np.frombuffer(padded.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        
+        vector = np.zeros(self.dim, dtype=np.float32)
+        low, high = self.ngram_range
+        with np.errstate(over="ignore"):
+            for n in range(low, high + 1):
+                count = len(codes) - n + 1
+                if count <= 0:
+                    break
+                hashes = codes[:count] + np.uint64(n)
+                for offset in range(1, n):
+                    hashes = hashes * _BASE + codes[offset:offset + count]
+                hashes ^= hashes >> np.uint64(31)
+                hashes *= _MIX_1
+                hashes ^= hashes >> np.uint64(29)
+                hashes *= _MIX_2
+                hashes ^= hashes >> np.uint64(32)
+                
+                signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)
+                vector += np.bincount(
+                    (hashes & self._mask).astype(np.intp),
+                    weights=signs,
+                    minlength=self.dim
+                ).astype(np.float32)
+        
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+
+class SentenceTransformerEmbedder:
+    """
+    Embedder backed by a sentence-transformers model (optional dependency)
+    مولد تمثيلات يعتمد على نموذج sentence-transformers
+    """
+    
+    def __init__(self, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "sentence-transformers is not installed; use the 'hashing' embedder "
+                "or pip install sentence-transformers"
+            ) from e
+        
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+    
+    def embed(self, text: str) -> np.ndarray:
+        """Embed one text as a unit-length float32 vector"""
+        return self.model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+def create_embedder(name: str, dim: int = 128, model_name: Optional[str] = None):
+    """
+    Build an embedder by name: "hashing", "sentence-transformers" or "none"
+    
+    Returns None for "none".
+    """
+    if name == "none":
+        return None
+    if name == "hashing":
+        return HashingEmbedder(dim=dim)
+    if name == "sentence-transformers":
+        if model_name:
+            return SentenceTransformerEmbedder(model_name)
+        return SentenceTransformerEmbedder()
+    raise ValueError(f"Unknown embedder: {name}")
@@ -0,0 +1,74 @@
+"""
+Event Stream
+بث أحداث معالجة الطلب
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+_CLOSED = object()
+
+
+class EventStream:
+    """
+    Buffer of progress events between the pipeline and a streaming response
+    مخزن مؤقت لأحداث التقدم بين خط المعالجة والاستجابة المتدفقة
+    
+    ``emit`` never blocks, so the pipeline and plan executor can report
+    progress from synchronous code. Producers of many events (LLM tokens)
+    use ``send`` instead, which waits while ``high_water`` events are
+    unread: a slow client then slows generation down instead of growing
+    the buffer. After ``close`` (or once the reader goes away) further
+    events are dropped.
+    """
+    
+    def __init__(self, high_water: int = 64):
+        self.high_water = high_water
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self.closed = False
+        self.emitted = 0
+    
+    def emit(self, event: str, data: Dict):
+        """Queue an event without waiting"""
+        if self.closed:
+            return
+        self._queue.put_nowait((event, data))
+        self.emitted += 1
+        if self._queue.qsize() >= self.high_water:
+            self._writable.clear()
+    
+    async def send(self, event: str, data: Dict):
+        """Queue an event, then wait until the reader has caught up"""
+        self.emit(event, data)
+        if not self.closed:
+            await self._writable.wait()
+    
+    def close(self):
+        """End the stream once queued events have been read"""
+        if not self.closed:
+            self.closed = True
+            self._queue.put_nowait(_CLOSED)
+        # Never leave a writer waiting on a stream nobody will read
+        self._writable.set()
+    
+    async def __aiter__(self) -> AsyncIterator[Tuple[str, Dict]]:
+        while True:
+            item = await self._queue.get()
+            if self._queue.qsize() <= self.high_water // 2:
+                self._writable.set()
+            if item is _CLOSED:
+                return
+            yield item
+    
+    @staticmethod
+    def format_sse(event: str, data: Dict, event_id: Optional[int] = None) -> str:
+        """Encode an event in the Server-Sent Events wire format"""
+        lines = []
+        if event_id is not None:
+            lines.append(f"id: {event_id}")
+        lines.append(f"event: {event}")
+        lines.append("data: " + json.dumps(data, ensure_ascii=False, default=str))
+        return "\n".join(lines) + "\n\n"
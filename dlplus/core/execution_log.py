@@ -0,0 +1,205 @@
+"""
+Execution Log
+سجل التنفيذ المنظم
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+# (timestamp, level, template, args)
+Record = Tuple[float, int, str, tuple]
+
+
+def render(record: Record) -> Dict:
+    """Format a record for reading; templates use %-style placeholders"""
+    timestamp, level, template, args = record
+    return {
+        "timestamp": datetime.fromtimestamp(timestamp).isoformat(),
+        "level": logging.getLevelName(level),
+        "message": template % args if args else template
+    }
+
+
+class JsonlSink:
+    """
+    Writes log records to daily JSON-lines files in the background
+    يكتب سجلات التنفيذ إلى ملفات JSON Lines في الخلفية
+    
+    ``submit`` only queues a record. A task on the event loop wakes every
+    ``flush_interval`` seconds, or once ``batch_size`` records are queued,
+    and formats and appends the batch in a worker thread. The task starts
+    with the first record submitted from a running loop; records
+    submitted before that wait for it. If more than ``max_pending``
+    records are waiting the oldest are dropped and counted.
+    """
+    
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: Deque[Record] = deque(maxlen=max_pending)
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+    
+    def submit(self, record: Record):
+        """Queue a record for writing"""
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append(record)
+        
+        if self._task is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        elif len(self._pending) >= self.batch_size:
+            self._wake.set()
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+    
+    async def flush(self):
+        """Write every queued record"""
+        batch = self._take()
+        if batch:
+            await asyncio.to_thread(self._write, batch)
+    
+    def _take(self) -> List[Record]:
+        batch = list(self._pending)
+        self._pending.clear()
+        return batch
+    
+    def _write(self, batch: List[Record]):
+        # One file per day, named by the batch's first record
+        day = datetime.fromtimestamp(batch[0][0]).strftime("%Y%m%d")
+        lines = "".join(json.dumps(render(record), ensure_ascii=False, default=str) + "\n" for record in batch)
+        with open(self.directory / f"execution-{day}.jsonl", "a", encoding="utf-8") as handle:
+            handle.write(lines)
+        self.written += len(batch)
+        self.batches += 1
+    
+    async def aclose(self):
+        """Stop the background task and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+    
+    def close(self):
+        """Stop the background task and write what is left, from sync code"""
+        if self._task is not None:
+            try:
+                self._task.cancel()
+            except RuntimeError:
+                # Its event loop has already been closed
+                pass
+            self._task = None
+        batch = self._take()
+        if batch:
+            self._write(batch)
+    
+    def get_stats(self) -> Dict:
+        """Sink counters"""
+        return {
+            "directory": str(self.directory),
+            "pending": len(self._pending),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped
+        }
+
+
+class ExecutionLog:
+    """
+    Ring buffer of structured execution log records
+    مخزن دائري لسجلات التنفيذ المنظمة
+    
+    Records hold a %-style template and its arguments and are only
+    formatted when read (``recent``) or written by the sink, so logging
+    costs a level check and a tuple append. Records below ``level``
+    (a ``logging`` level number or name) are discarded before anything
+    else happens; the oldest records fall out once ``capacity`` is
+    reached.
+    """
+    
+    def __init__(
+        self,
+        capacity: int = 100,
+        level: Union[int, str] = logging.INFO,
+        sink: Optional[JsonlSink] = None
+    ):
+        self._records: Deque[Record] = deque(maxlen=capacity)
+        self.level = level if isinstance(level, int) else logging.getLevelName(level.upper())
+        if not isinstance(self.level, int):
+            raise ValueError(f"Unknown log level: {level}")
+        self.sink = sink
+    
+    def __len__(self) -> int:
+        return len(self._records)
+    
+    def enabled(self, level: int) -> bool:
+        """Whether records at ``level`` are kept"""
+        return level >= self.level
+    
+    def log(self, level: int, template: str, *args):
+        """Record a message; ``args`` fill the template when it is read"""
+        if level < self.level:
+            return
+        record = (time.time(), level, template, args)
+        self._records.append(record)
+        if self.sink is not None:
+            self.sink.submit(record)
+    
+    def recent(self, count: Optional[int] = None) -> List[Dict]:
+        """The last ``count`` records (all by default), formatted, oldest first"""
+        records = self._records
+        if count is not None:
+            records = list(records)[-count:] if count > 0 else []
+        return [render(record) for record in records]
+    
+    def clear(self):
+        self._records.clear()
+    
+    async def aclose(self):
+        """Write out anything the sink still holds"""
+        if self.sink is not None:
+            await self.sink.aclose()
+    
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+    
+    def get_stats(self) -> Dict:
+        """Level, buffer occupancy and sink counters"""
+        return {
+            "level": logging.getLevelName(self.level),
+            "buffered": len(self._records),
+            "capacity": self._records.maxlen,
+            "sink": self.sink.get_stats() if self.sink is not None else None
+        }
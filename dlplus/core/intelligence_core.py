@@ -4,13 +4,32 @@ DL+ Intelligence Core
 """
 
 import asyncio
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Any, Tuple
 
 from ..config.settings import settings
 from ..config.models_config import get_model_config, get_models_by_capability
+from ..providers import PROVIDER_CLASSES, ProviderError, ProviderRegistry
+from .admission import AdmissionController
 from .arabic_processor import ArabicProcessor, IntentType
 from .context_analyzer import ContextAnalyzer
+from .conversation_store import ConversationStore
+from .embeddings import create_embedder
+from .event_stream import EventStream
+from .execution_log import ExecutionLog, JsonlSink
+from .metrics import MetricsRegistry, StageTimer
+from .model_caller import ModelCaller
+from .model_router import ModelRouter
+from .prompt_context import estimate_tokens
+from .response_cache import ResponseCache, request_key
+from .plan_executor import PlanExecutor
+from .session_store import SessionStore
+from .single_flight import SingleFlight
+from .tool_runtime import ToolRuntime
+from .url_guard import resolve_public, url_rejection
 
 
 class IntelligenceCore:
@@ -20,111 +39,532 @@ class IntelligenceCore:
     """
     
     def __init__(self):
-        self.arabic_processor = ArabicProcessor()
-        self.context_analyzer = ContextAnalyzer()
-        self.tools_registry = {}
+        self.arabic_processor = ArabicProcessor(
+            cache_size=settings.processor_cache_size,
+            cache_max_bytes=settings.processor_cache_max_bytes
+        )
+        self.conversation_store = None
+        if settings.conversation_persistence:
+            self.conversation_store = ConversationStore(
+                settings.conversation_db_path or settings.cache_dir / "conversations.db"
+            )
+        
+        self.embedder = create_embedder(
+            settings.context_embedder,
+            dim=settings.context_embedding_dim,
+            model_name=settings.context_embedding_model
+        )
+        
+        # Shared context for callers that do not pass a session ID
+        self.context_analyzer = self._create_context("default")
+        self.sessions = SessionStore(
+            max_sessions=settings.session_max_count,
+            ttl_seconds=settings.session_ttl_seconds,
+            num_shards=settings.session_shards,
+            factory=self._create_context
+        )
+        self.tool_runtime = ToolRuntime(
+            max_threads=settings.tool_thread_workers,
+            max_processes=settings.tool_process_workers,
+            default_concurrency=settings.tool_max_concurrency,
+            default_timeout=settings.tool_timeout
+        )
+        self.tools_registry = self.tool_runtime.tools
         self.agents_registry = {}
+        # Pooled LLM clients, one per provider
+        self.providers = ProviderRegistry()
+        self.router = ModelRouter(
+            providers=PROVIDER_CLASSES,
+            alpha=settings.router_ewma_alpha,
+            error_threshold=settings.router_error_threshold,
+            cooldown_seconds=settings.router_cooldown_seconds
+        )
+        self.model_caller = ModelCaller(
+            self.providers,
+            self.router,
+            budget_ratio=settings.hedge_budget_ratio,
+            percentile=settings.hedge_percentile,
+            min_samples=settings.hedge_min_samples,
+            default_delay_ms=settings.hedge_default_delay_ms
+        )
+        self.plan_executor = PlanExecutor(default_timeout=settings.plan_step_timeout)
         
-        # Initialize logging
-        self.execution_logs = []
+        self.response_cache = None
+        if settings.response_cache_size > 0:
+            self.response_cache = ResponseCache(
+                max_entries=settings.response_cache_size,
+                max_bytes=settings.response_cache_max_bytes,
+                default_ttl=settings.response_cache_ttl,
+                ttls=settings.response_cache_ttls,
+                mode=settings.response_cache_mode,
+                normalize=self.arabic_processor.normalize_text,
+                disk_dir=settings.cache_dir / "responses" if settings.response_cache_disk else None,
+                disk_max_bytes=settings.response_cache_disk_max_bytes
+            )
+        # Identical concurrent requests share one plan execution
+        self.single_flight = SingleFlight()
+        # Bounded concurrency and load shedding in front of process_request
+        self.admission = None
+        if settings.admission_control:
+            self.admission = AdmissionController(
+                max_in_flight=settings.admission_max_in_flight,
+                max_queue=settings.admission_max_queue,
+                max_queue_wait=settings.admission_queue_timeout,
+                priorities=settings.admission_priorities,
+                rate=settings.admission_rate,
+                burst=settings.admission_burst
+            )
+        
+        # Secondary intents below this confidence do not add tools
+        self.min_intent_confidence = 0.2
+        # Tool output included when a model writes the response
+        self.max_tool_result_chars = 4000
+        
+        # Stage latency histograms and counters for /metrics
+        self.metrics = None
+        if settings.metrics_enabled:
+            self.metrics = MetricsRegistry()
+            self.metrics.histogram(
+                "stage_duration_seconds", "Time spent in each request processing stage", ("stage",)
+            )
+            self.metrics.histogram("step_duration_seconds", "Duration of plan steps by action", ("action",))
+            self.metrics.histogram("agent_duration_seconds", "Duration of agent calls", ("agent",))
+            self.metrics.counter(
+                "requests_total", "Processed requests", ("intent", "source", "success")
+            )
+            self.metrics.counter("plan_steps_total", "Plan steps by outcome", ("action", "status"))
+            self.metrics.counter("agent_calls_total", "Agent calls by outcome", ("agent", "status"))
+        
+        # Structured execution log, formatted only when read
+        self.execution_log = ExecutionLog(
+            capacity=settings.log_buffer_size,
+            level=settings.log_level,
+            sink=JsonlSink(settings.logs_dir, flush_interval=settings.log_flush_interval)
+            if settings.log_sink else None
+        )
     
-    def register_tool(self, name: str, tool_func: callable, description: str):
-        """Register a tool function"""
-        self.tools_registry[name] = {
-            "function": tool_func,
-            "description": description
-        }
-        self._log(f"Tool registered: {name}")
+    def register_tool(
+        self,
+        name: str,
+        tool_func: callable,
+        description: str,
+        cpu_bound: bool = False,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        """
+        Register a tool function
+        
+        Sync functions run in a thread pool, or a process pool when
+        ``cpu_bound``; see ToolRuntime.
+        """
+        self.tool_runtime.register(
+            name,
+            tool_func,
+            description,
+            cpu_bound=cpu_bound,
+            max_concurrency=max_concurrency,
+            timeout=timeout
+        )
+        self._log("Tool registered: %s", name)
     
     def register_agent(self, name: str, agent_instance: Any):
         """Register an AI agent"""
         self.agents_registry[name] = agent_instance
-        self._log(f"Agent registered: {name}")
+        self._log("Agent registered: %s", name)
     
     async def process_request(
         self,
         user_input: str,
-        context: Optional[Dict] = None
+        context: Optional[Dict] = None,
+        session_id: Optional[str] = None,
+        latency_slo_ms: Optional[float] = None,
+        events: Optional[EventStream] = None,
+        include_logs: bool = False,
+        include_stages: bool = False
     ) -> Dict:
         """
         Main entry point for processing user requests
         نقطة الدخول الرئيسية لمعالجة طلبات المستخدم
+        
+        Conversation context is kept per ``session_id``; requests without
+        one share the core's default context. ``latency_slo_ms`` overrides
+        the router's default latency target for this request.
+        
+        With ``events``, progress is reported as it happens: "analysis",
+        "model", "plan", "step_start"/"step_finish" and, when a model
+        writes the response, "token". Such requests may be answered from
+        the response cache but never join another request's execution,
+        whose events they would not see. ``include_logs`` adds the most
+        recent execution log records to the result, ``include_stages``
+        the milliseconds spent in each stage.
         """
-        start_time = datetime.now()
-        self._log(f"Processing request: {user_input[:50]}...")
+        timer = StageTimer()
+        context_analyzer = self.get_context(session_id)
+        self._log("Processing request: %.50s...", user_input, level=logging.DEBUG)
         
         # Step 1: Detect language and intent
         is_arabic = self.arabic_processor.is_arabic(user_input)
+        timer.lap("language")
         intent = self.arabic_processor.detect_intent(user_input)
+        ranked_intents = self.arabic_processor.rank_intents(user_input)
+        timer.lap("intent")
         entities = self.arabic_processor.extract_entities(user_input)
+        timer.lap("entities")
         
-        self._log(f"Detected - Language: {'Arabic' if is_arabic else 'English'}, Intent: {intent.value}")
+        self._log(
+            "Detected - Language: %s, Intent: %s",
+            "Arabic" if is_arabic else "English", intent.value,
+            level=logging.DEBUG
+        )
+        if events is not None:
+            events.emit("analysis", {
+                "language": "ar" if is_arabic else "en",
+                "intent": intent.value,
+                "intents": [
+                    {"intent": ranked.value, "confidence": round(confidence, 3)}
+                    for ranked, confidence in ranked_intents
+                ],
+                "entities": entities
+            })
         
         # Step 2: Get context
-        context_summary = self.context_analyzer.get_context_summary()
-        context_switch = self.context_analyzer.detect_context_switch(intent.value)
+        context_summary = context_analyzer.get_context_summary()
+        context_switch = context_analyzer.detect_context_switch(intent.value)
         
         if context_switch:
-            self._log("Context switch detected")
+            self._log("Context switch detected", level=logging.DEBUG)
+        timer.lap("context")
         
         # Step 3: Select appropriate model and tools
-        model_name = self._select_model(intent, is_arabic)
-        tools_to_use = self._select_tools(intent, entities)
+        model_decision = self._select_model(intent, is_arabic, user_input, latency_slo_ms)
+        model_name = model_decision["model"]
+        intents = self._confident_intents(intent, ranked_intents)
+        tools_to_use = self._select_tools(intent, entities, ranked_intents)
+        timer.lap("model_selection")
         
-        self._log(f"Selected model: {model_name}, Tools: {tools_to_use}")
+        self._log("Selected model: %s, Tools: %s", model_name, tools_to_use, level=logging.DEBUG)
+        if events is not None:
+            events.emit("model", {"model_decision": model_decision, "tools": tools_to_use})
         
-        # Step 4: Plan execution steps
-        execution_plan = self._create_execution_plan(
-            intent, entities, tools_to_use, context_summary
+        # Fit the conversation context into what the model can take
+        context_budget = self._context_budget(model_name, user_input)
+        prompt_context = context_analyzer.get_context_for_prompt(
+            max_tokens=context_budget,
+            query=user_input,
+            intent=intent.value
         )
+        timer.lap("prompt_context")
         
-        # Step 5: Execute plan
-        result = await self._execute_plan(
-            execution_plan,
-            user_input,
-            model_name,
-            is_arabic
-        )
+        # Steps 4-5: Plan and execute, unless an identical request is
+        # cached or already running
+        request_id = None
+        result = None
+        if self._reusable(intent.value):
+            request_id = self._request_key(
+                user_input,
+                intent.value,
+                model_name,
+                ResponseCache.fingerprint(prompt_context, context)
+            )
+            if self.response_cache is not None:
+                result = await self.response_cache.aget(request_id)
+            timer.lap("cache_lookup")
+        cached = result is not None
+        coalesced = False
+        
+        if result is None:
+            async def compute() -> Dict:
+                outcome = await self._plan_and_execute(
+                    intent, entities, tools_to_use, context_summary,
+                    prompt_context, user_input, model_name, is_arabic, events, timer, intents
+                )
+                if self.response_cache is not None and request_id is not None and outcome["success"]:
+                    await self.response_cache.aput(request_id, intent.value, outcome)
+                return outcome
+            
+            if request_id is not None and settings.request_coalescing and events is None:
+                result, coalesced = await self.single_flight.run(request_id, compute)
+            else:
+                result = await compute()
+            timer.lap("execution")
         
         # Step 6: Update context
-        self.context_analyzer.add_turn(
+        context_analyzer.add_turn(
             user_message=user_input,
             agent_response=result.get("response", ""),
             intent=intent.value,
             entities=entities,
             tools_used=tools_to_use
         )
+        timer.lap("context_update")
         
-        # Calculate execution time
-        execution_time = (datetime.now() - start_time).total_seconds()
+        if self.metrics is not None:
+            self.metrics.observe_stages("stage_duration_seconds", timer)
+            self.metrics.inc("requests_total", (
+                intent.value,
+                "cache" if cached else "coalesced" if coalesced else "computed",
+                "true" if result["success"] else "false"
+            ))
         
-        return {
-            "success": True,
+        response = {
+            "success": result["success"],
+            "session_id": session_id,
             "response": result.get("response", ""),
             "intent": intent.value,
+            "intents": [
+                {"intent": ranked.value, "confidence": round(confidence, 3)}
+                for ranked, confidence in ranked_intents
+            ],
             "entities": entities,
             "tools_used": tools_to_use,
+            "steps": result["steps"],
             "model_used": model_name,
-            "execution_time": execution_time,
-            "logs": self.execution_logs[-10:],  # Last 10 logs
+            "model_decision": model_decision,
+            "cached": cached,
+            "coalesced": coalesced,
+            "prompt_tokens": estimate_tokens(user_input) + estimate_tokens(prompt_context),
+            "execution_time": timer.elapsed_ns() / 1e9,
             "context": context_summary
         }
+        if include_stages:
+            response["stages"] = timer.breakdown()
+        if include_logs:
+            response["logs"] = self.execution_log.recent(10)
+        return response
     
-    def _select_model(self, intent: IntentType, is_arabic: bool) -> str:
-        """Select the best model based on intent and language"""
-        # For code generation, use code-specialized models
-        if intent == IntentType.GENERATE_CODE:
-            return "deepseek-coder"
+    async def admit(self, user_input: str, key: Optional[str] = None):
+        """
+        Wait for a processing slot for a request
+        انتظار دور الطلب في المعالجة
         
-        # For Arabic tasks, prefer Arabic models
-        if is_arabic:
-            return settings.default_arabic_model or "qwen-arabic"
+        The queue priority comes from the request's intent and ``key``
+        (the caller's API key) selects its rate limit. Returns a ticket to
+        hand to ``self.admission.release`` once the request is done, or
+        None when admission control is off; raises AdmissionRejected when
+        the request is shed.
+        """
+        if self.admission is None:
+            return None
+        intent = self.arabic_processor.detect_intent(user_input)
+        return await self.admission.acquire(key, self.admission.priority(intent.value))
+    
+    def _reusable(self, intent: str) -> bool:
+        """Whether results for an intent may be cached or shared (not commands)"""
+        if self.response_cache is not None:
+            return self.response_cache.cacheable(intent)
+        if not settings.request_coalescing:
+            return False
+        return settings.response_cache_ttls.get(intent, settings.response_cache_ttl) != 0
+    
+    def _request_key(self, user_input: str, intent: str, model_name: str, fingerprint: str) -> str:
+        """Key for caching and coalescing, matching the response cache's mode"""
+        if self.response_cache is not None:
+            return self.response_cache.key(user_input, intent, model_name, fingerprint)
+        normalize = self.arabic_processor.normalize_text if settings.response_cache_mode == "normalized" else None
+        return request_key(user_input, intent, model_name, fingerprint, normalize)
+    
+    async def _plan_and_execute(
+        self,
+        intent: IntentType,
+        entities: Dict,
+        tools_to_use: List[str],
+        context_summary: Dict,
+        prompt_context: str,
+        user_input: str,
+        model_name: str,
+        is_arabic: bool,
+        events: Optional[EventStream] = None,
+        timer: Optional[StageTimer] = None,
+        intents: Optional[List[IntentType]] = None
+    ) -> Dict:
+        """Plan and execute a request; returns success, response and step reports"""
+        execution_plan = self._create_execution_plan(
+            intent, entities, tools_to_use, context_summary, intents
+        )
+        execution_plan["prompt_context"] = prompt_context
+        if timer is not None:
+            timer.lap("planning")
+        if events is not None:
+            events.emit("plan", {
+                "expected_output": execution_plan["expected_output"],
+                "steps": [
+                    {key: step[key] for key in ("id", "action", "tool", "depends_on") if key in step}
+                    for step in execution_plan["steps"]
+                ]
+            })
+        
+        execution = await self._execute_plan(
+            execution_plan,
+            user_input,
+            model_name,
+            is_arabic,
+            events
+        )
+        return {
+            "success": execution["success"],
+            "response": execution.get("response", ""),
+            "steps": execution["steps"]
+        }
+    
+    def get_context(self, session_id: Optional[str] = None, create: bool = True) -> Optional[ContextAnalyzer]:
+        """
+        Get the conversation context for a session
+        الحصول على سياق المحادثة الخاص بجلسة
+        
+        Without a session ID the shared default context is returned. With
+        ``create=False`` only a live session, or one with persisted turns,
+        is returned; otherwise None.
+        """
+        if session_id is None:
+            return self.context_analyzer
+        if create:
+            return self.sessions.get(session_id)
+        context_analyzer = self.sessions.peek(session_id)
+        if context_analyzer is None and self.conversation_store is not None:
+            if self.conversation_store.count(session_id):
+                context_analyzer = self.sessions.get(session_id)
+        return context_analyzer
+    
+    def clear_context(self, session_id: Optional[str] = None):
+        """Clear the default context, or forget a session entirely"""
+        if session_id is None:
+            self.context_analyzer.clear_context()
+            return
+        
+        self.sessions.drop(session_id)
+        if self.conversation_store is not None:
+            self.conversation_store.delete_session(session_id)
+    
+    def _create_context(self, session_id: str) -> ContextAnalyzer:
+        """Build the context analyzer for a new session"""
+        vector_path = None
+        if self.conversation_store is not None and settings.context_vector_memmap:
+            digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+            vector_path = settings.cache_dir / "vectors" / f"{digest}.f32"
+        
+        return ContextAnalyzer(
+            max_history=settings.context_max_history,
+            store=self.conversation_store,
+            session_id=session_id,
+            embedder=self.embedder,
+            vector_path=vector_path
+        )
+    
+    async def aclose(self):
+        """Close provider connections and flush the log sink, then everything ``close`` does"""
+        await self.providers.close()
+        await self.execution_log.aclose()
+        self.close()
+    
+    def close(self):
+        """Stop tool workers and flush and close persistent storage"""
+        self.tool_runtime.shutdown()
+        self.arabic_processor.close()
+        self.execution_log.close()
+        self.context_analyzer.close()
+        self.sessions.close()
+        if self.conversation_store is not None:
+            self.conversation_store.close()
+    
+    def _select_model(
+        self,
+        intent: IntentType,
+        is_arabic: bool,
+        user_input: str = "",
+        latency_slo_ms: Optional[float] = None
+    ) -> Dict:
+        """
+        Select a model for the request; returns the router's decision
+        
+        The router needs room for the input plus a response. With routing
+        turned off the configured default models are used.
+        """
+        if not settings.model_routing:
+            model_name = settings.default_model
+            if intent == IntentType.GENERATE_CODE:
+                model_name = "deepseek-coder"
+            elif is_arabic:
+                model_name = settings.default_arabic_model or "qwen-arabic"
+            return {"model": model_name, "reason": "routing disabled, configured default", "fallbacks": []}
         
-        # Default model
-        return settings.default_model
+        if latency_slo_ms is None:
+            latency_slo_ms = settings.router_latency_slo_ms
+        return self.router.route(
+            arabic=is_arabic,
+            code=intent == IntentType.GENERATE_CODE,
+            required_tokens=estimate_tokens(user_input) + settings.router_response_tokens,
+            latency_slo_ms=latency_slo_ms
+        )
+    
+    async def call_model(
+        self,
+        model_key: str,
+        messages: List[Dict[str, str]],
+        fallbacks: Optional[List[str]] = None,
+        hedge: Optional[bool] = None,
+        **kwargs
+    ) -> Dict:
+        """
+        Call a model through its provider, with fallbacks and hedging
+        
+        ``fallbacks`` defaults to the router's alternatives with the same
+        capabilities (pass ``[]`` for none); ``hedge`` defaults to
+        ``settings.hedge_requests``. Latency and failures feed the router,
+        so later routing avoids slow or failing models.
+        """
+        if fallbacks is None:
+            fallbacks = self.router.alternatives(model_key)
+        if hedge is None:
+            hedge = settings.hedge_requests
+        return await self.model_caller.call([model_key] + list(fallbacks), messages, hedge=hedge, **kwargs)
     
-    def _select_tools(self, intent: IntentType, entities: Dict) -> List[str]:
-        """Select tools needed based on intent and entities"""
+    def _context_budget(self, model_name: str, user_input: str) -> int:
+        """
+        Tokens available for conversation context with this model
+        
+        The model's ``max_tokens`` minus room for the response and the
+        user input, capped by ``settings.context_max_tokens``.
+        """
+        limit = get_model_config(model_name).max_tokens
+        response_reserve = min(settings.max_tokens, limit // 2)
+        available = limit - response_reserve - estimate_tokens(user_input)
+        return max(0, min(settings.context_max_tokens, available))
+    
+    def _select_tools(
+        self,
+        intent: IntentType,
+        entities: Dict,
+        ranked_intents: Optional[List[Tuple[IntentType, float]]] = None
+    ) -> List[str]:
+        """
+        Select tools needed based on intent and entities
+        
+        Confident secondary intents from ``rank_intents`` contribute their
+        tools too, so compound requests get every tool they need.
+        """
+        tools = []
+        for candidate in self._confident_intents(intent, ranked_intents):
+            for tool in self._tools_for_intent(candidate, entities):
+                if tool not in tools:
+                    tools.append(tool)
+        
+        return tools
+    
+    def _confident_intents(
+        self,
+        intent: IntentType,
+        ranked_intents: Optional[List[Tuple[IntentType, float]]] = None
+    ) -> List[IntentType]:
+        """The primary intent followed by confident secondary intents"""
+        intents = [intent]
+        for candidate, confidence in ranked_intents or []:
+            if confidence >= self.min_intent_confidence and candidate not in intents:
+                intents.append(candidate)
+        return intents
+    
+    def _tools_for_intent(self, intent: IntentType, entities: Dict) -> List[str]:
+        """Tools needed for a single intent"""
         tools = []
         
         if intent == IntentType.SEARCH:
@@ -157,38 +597,91 @@ class IntelligenceCore:
         intent: IntentType,
         entities: Dict,
         tools: List[str],
-        context: Dict
+        context: Dict,
+        intents: Optional[List[IntentType]] = None
     ) -> Dict:
-        """Create a step-by-step execution plan"""
+        """
+        Create an execution plan as a dependency graph of steps
+        
+        Gathering steps (web search, one fetch per URL, one read per file)
+        have no dependencies and run concurrently; the intent's own chain
+        runs alongside them, and the response is formatted once they all
+        finish. Only ``format_response`` is critical. ``intents`` are the
+        request's confident intents (the primary one by default); a web
+        search is planned when any of them is a search. URLs are fetched
+        only with ``ENABLE_URL_FETCH``, and only those that pass the URL
+        guard (http(s), public address, allow-list).
+        """
         plan = {
             "intent": intent.value,
             "steps": [],
             "expected_output": ""
         }
+        steps = plan["steps"]
+        
+        # Gather information in parallel
+        if "run_web_search" in tools:
+            if IntentType.SEARCH in (intents or [intent]):
+                steps.append({"id": "web_search", "action": "web_search", "tool": "run_web_search"})
+            urls = entities.get("urls", []) if settings.enable_url_fetch else []
+            for index, url in enumerate(urls):
+                reason = url_rejection(url, settings.url_fetch_allowed_hosts)
+                if reason is not None:
+                    self._log("Not fetching %s: %s", url, reason, level=logging.WARNING)
+                    continue
+                steps.append({
+                    "id": f"fetch_url_{index}", "action": "fetch_url", "tool": "fetch_url",
+                    "args": {"url": url}
+                })
+        
+        if "read_from_file" in tools:
+            for index, path in enumerate(entities.get("files", [])):
+                steps.append({
+                    "id": f"read_file_{index}", "action": "read_file", "tool": "read_from_file",
+                    "args": {"path": path}
+                })
+        
+        # Intent-specific chains
+        if "code_generator" in tools:
+            steps.append({"id": "understand_requirements", "action": "understand_requirements",
+                          "tool": "intelligence_core"})
+            steps.append({"id": "generate_code", "action": "generate_code", "tool": "code_generator",
+                          "depends_on": ["understand_requirements"],
+                          "requires": ["understand_requirements"]})
+            if "write_to_file" in tools and entities.get("files"):
+                steps.append({"id": "save_to_file", "action": "save_to_file", "tool": "write_to_file",
+                              "args": {"path": entities["files"][0]},
+                              "depends_on": ["generate_code"], "requires": ["generate_code"]})
+        
+        elif "write_to_file" in tools and entities.get("files"):
+            steps.append({"id": "create_file", "action": "create_file", "tool": "write_to_file",
+                          "args": {"path": entities["files"][0], "content": ""}})
+        
+        if "run_shell" in tools:
+            command = (entities.get("commands") or entities.get("keywords") or [""])[0]
+            steps.append({"id": "validate_command", "action": "validate_command",
+                          "tool": "intelligence_core", "args": {"command": command}})
+            steps.append({"id": "execute", "action": "execute", "tool": "run_shell",
+                          "args": {"command": command},
+                          "depends_on": ["validate_command"], "requires": ["validate_command"]})
+        
+        # Combine the ends of every branch, then respond
+        response_deps = []
+        if steps:
+            branch_ends = [step["id"] for step in steps if not any(
+                step["id"] in other.get("depends_on", ()) for other in steps
+            )]
+            steps.append({"id": "analyze_results", "action": "analyze_results",
+                          "tool": "intelligence_core", "depends_on": branch_ends})
+            response_deps = ["analyze_results"]
+        steps.append({"id": "format_response", "action": "format_response", "tool": "arabic_processor",
+                      "depends_on": response_deps, "critical": True})
         
-        # Build steps based on intent
         if intent == IntentType.SEARCH:
-            plan["steps"] = [
-                {"action": "web_search", "tool": "run_web_search"},
-                {"action": "analyze_results", "tool": "intelligence_core"},
-                {"action": "format_response", "tool": "arabic_processor"}
-            ]
             plan["expected_output"] = "Search results with analysis"
-        
         elif intent == IntentType.GENERATE_CODE:
-            plan["steps"] = [
-                {"action": "understand_requirements", "tool": "intelligence_core"},
-                {"action": "generate_code", "tool": "code_generator"},
-                {"action": "save_to_file", "tool": "write_to_file"}
-            ]
             plan["expected_output"] = "Generated code file"
-        
         elif intent == IntentType.EXECUTE_COMMAND:
-            plan["steps"] = [
-                {"action": "validate_command", "tool": "intelligence_core"},
-                {"action": "execute", "tool": "run_shell"},
-                {"action": "format_results", "tool": "intelligence_core"}
-            ]
             plan["expected_output"] = "Command execution results"
         
         return plan
@@ -198,50 +691,230 @@ class IntelligenceCore:
         plan: Dict,
         user_input: str,
         model_name: str,
-        is_arabic: bool
+        is_arabic: bool,
+        events: Optional[EventStream] = None
     ) -> Dict:
-        """Execute the planned steps"""
-        results = {
-            "response": "",
-            "steps_completed": [],
-            "outputs": {}
+        """
+        Execute the planned steps concurrently along their dependencies
+        تنفيذ خطوات الخطة بالتوازي حسب الاعتماديات
+        """
+        intent = IntentType(plan["intent"])
+        prompt_context = plan.get("prompt_context", "")
+        
+        async def run_step(step: Dict, inputs: Dict) -> Any:
+            return await self._run_step(
+                step, inputs, user_input, intent, is_arabic,
+                model_name=model_name, prompt_context=prompt_context, events=events
+            )
+        
+        execution = await self.plan_executor.execute(
+            plan["steps"],
+            run_step,
+            on_event=events.emit if events is not None else None
+        )
+        
+        if self.metrics is not None:
+            reports = execution["steps"]
+            self.metrics.inc_many("plan_steps_total", [(report["action"], report["status"]) for report in reports])
+            self.metrics.observe_many("step_duration_seconds", [
+                (report["action"], int(report["duration_ms"] * 1e6))
+                for report in reports if report["status"] in ("ok", "failed", "timeout")
+            ])
+        
+        for report in execution["steps"]:
+            if report["status"] != "ok":
+                self._log(
+                    "Step %s %s: %s", report["id"], report["status"], report.get("error", ""),
+                    level=logging.WARNING
+                )
+        
+        return {
+            "success": execution["success"],
+            "response": execution["results"].get("format_response", ""),
+            "steps_completed": [
+                report["action"] for report in execution["steps"] if report["status"] == "ok"
+            ],
+            "outputs": {
+                step_id: output for step_id, output in execution["results"].items()
+                if step_id != "format_response"
+            },
+            "steps": execution["steps"],
+            "duration_ms": execution["duration_ms"]
         }
+    
+    async def _run_step(
+        self,
+        step: Dict,
+        inputs: Dict,
+        user_input: str,
+        intent: IntentType,
+        is_arabic: bool,
+        model_name: Optional[str] = None,
+        prompt_context: str = "",
+        events: Optional[EventStream] = None
+    ) -> Any:
+        """Perform one plan step"""
+        tool = step["tool"]
+        args = dict(step.get("args", {}))
         
-        # For now, generate a simple response
-        # In full implementation, this would execute each step
-        intent = plan["intent"]
+        if tool == "arabic_processor":
+            if settings.llm_responses and model_name is not None:
+                return await self._generate_response(
+                    user_input, inputs, model_name, prompt_context, is_arabic, events
+                )
+            if is_arabic:
+                return self.arabic_processor.generate_response(intent, {})
+            return f"Processing your request with intent: {intent.value}"
         
-        if is_arabic:
-            response = self.arabic_processor.generate_response(
-                IntentType(intent),
-                {}
-            )
+        if tool == "intelligence_core":
+            if step["action"] == "validate_command" and args["command"] not in settings.allowed_commands:
+                raise PermissionError(f"Command not allowed: {args['command']!r}")
+            # Pass the outputs of the steps it waited for along
+            return inputs
+        
+        if tool in ("run_web_search", "fetch_url") and not settings.enable_web_search:
+            raise PermissionError("Web search is disabled")
+        if tool == "fetch_url":
+            if not settings.enable_url_fetch:
+                raise PermissionError("URL fetching is disabled")
+            # Hostnames are resolved here, off the planning path
+            await resolve_public(args["url"], settings.url_fetch_allowed_hosts)
+        if tool == "code_generator" and not settings.enable_code_generation:
+            raise PermissionError("Code generation is disabled")
+        if tool == "run_shell" and not settings.enable_shell_execution:
+            raise PermissionError("Shell execution is disabled")
+        if tool == "write_to_file" and not settings.enable_file_writes:
+            raise PermissionError("File writes are disabled")
+        
+        if step["action"] == "save_to_file":
+            args["content"] = inputs["generate_code"].get("code", "")
+        
+        # Explicitly registered tools take precedence over agents
+        if tool in self.tool_runtime:
+            return await self.tool_runtime.invoke(tool, **args)
+        
+        if tool == "run_web_search" and "web_retrieval" in self.agents_registry:
+            result = await self.call_agent("web_retrieval", user_input)
+        elif tool == "fetch_url" and "web_retrieval" in self.agents_registry:
+            result = await self.call_agent("web_retrieval", args["url"], method="fetch_url")
+        elif tool == "code_generator" and "code_generator" in self.agents_registry:
+            result = await self.call_agent("code_generator", user_input)
         else:
-            response = f"Processing your request with intent: {intent}"
+            raise LookupError(f"Tool not available: {tool}")
         
-        results["response"] = response
-        results["steps_completed"] = [step["action"] for step in plan["steps"]]
+        if isinstance(result, dict) and result.get("success") is False:
+            raise RuntimeError(result.get("error", f"{tool} failed"))
+        return result
+    
+    async def call_agent(self, name: str, *args, method: str = "execute") -> Any:
+        """
+        Call a registered agent, timing it for the metrics
         
-        return results
+        Methods other than ``execute`` are reported as ``<agent>.<method>``.
+        A result with ``success`` False counts as a failure.
+        """
+        agent = self.agents_registry[name]
+        label = name if method == "execute" else f"{name}.{method}"
+        started = time.perf_counter_ns()
+        status = "error"
+        try:
+            result = await getattr(agent, method)(*args)
+            status = "failed" if isinstance(result, dict) and result.get("success") is False else "ok"
+            return result
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe("agent_duration_seconds", label, time.perf_counter_ns() - started)
+                self.metrics.inc("agent_calls_total", (label, status))
     
-    def _log(self, message: str):
-        """Add log entry"""
-        log_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "message": message
-        }
-        self.execution_logs.append(log_entry)
+    async def _generate_response(
+        self,
+        user_input: str,
+        inputs: Dict,
+        model_name: str,
+        prompt_context: str,
+        is_arabic: bool,
+        events: Optional[EventStream] = None
+    ) -> str:
+        """
+        Have the routed model write the response
+        توليد الاستجابة بواسطة النموذج المختار
+        
+        With ``events`` the response is streamed and each piece of text is
+        sent as a "token" event, waiting whenever the client falls behind.
+        If the stream fails before any text arrives, the response comes
+        from the model's alternatives in one piece instead.
+        """
+        messages = self._response_messages(user_input, inputs, prompt_context, is_arabic)
+        options = {"max_tokens": settings.router_response_tokens, "temperature": settings.temperature}
+        if events is None:
+            return (await self.call_model(model_name, messages, **options))["content"]
+        
+        parts = []
+        started = time.perf_counter()
+        try:
+            async for text in self.providers.stream(model_name, messages, **options):
+                parts.append(text)
+                await events.send("token", {"text": text})
+        except ProviderError as e:
+            self.router.record(model_name, (time.perf_counter() - started) * 1000, success=False)
+            alternatives = self.router.alternatives(model_name)
+            if parts or not alternatives:
+                raise
+            self._log("Streaming from %s failed, falling back: %s", model_name, e, level=logging.WARNING)
+            result = await self.call_model(alternatives[0], messages, fallbacks=alternatives[1:], **options)
+            await events.send("token", {"text": result["content"]})
+            return result["content"]
         
-        # Keep only recent logs
-        if len(self.execution_logs) > 100:
-            self.execution_logs = self.execution_logs[-100:]
+        self.router.record(model_name, (time.perf_counter() - started) * 1000, success=True)
+        return "".join(parts)
+    
+    def _response_messages(
+        self,
+        user_input: str,
+        inputs: Dict,
+        prompt_context: str,
+        is_arabic: bool
+    ) -> List[Dict[str, str]]:
+        """Chat messages asking a model to answer from the gathered results"""
+        system = "You are DL+, an AI agent. Answer the user's request using the results provided."
+        if is_arabic:
+            system += " Answer in Arabic."
+        if prompt_context:
+            system += f"\n\nConversation so far:\n{prompt_context}"
+        results = inputs.get("analyze_results", inputs)
+        if results:
+            encoded = json.dumps(results, ensure_ascii=False, default=str)
+            system += f"\n\nResults:\n{encoded[:self.max_tool_result_chars]}"
+        return [{"role": "system", "content": system}, {"role": "user", "content": user_input}]
+    
+    def _log(self, template: str, *args, level: int = logging.INFO):
+        """Add log entry; ``args`` are only formatted into ``template`` when read"""
+        self.execution_log.log(level, template, *args)
+    
+    @property
+    def execution_logs(self) -> List[Dict]:
+        """Buffered log entries, formatted, oldest first"""
+        return self.execution_log.recent()
     
     def get_status(self) -> Dict:
         """Get system status"""
         return {
             "tools_registered": len(self.tools_registry),
+            "tools": self.tool_runtime.get_stats(),
+            "providers": self.providers.get_stats(),
+            "router": self.router.get_stats(),
+            "model_calls": self.model_caller.get_stats(),
+            "response_cache": self.response_cache.get_stats() if self.response_cache is not None else None,
+            "coalescing": self.single_flight.get_stats(),
+            "admission": self.admission.get_stats() if self.admission is not None else None,
             "agents_registered": len(self.agents_registry),
             "conversation_turns": len(self.context_analyzer.conversation_history),
             "context_memory_keys": list(self.context_analyzer.context_memory.keys()),
-            "recent_logs": self.execution_logs[-5:]
+            "processor_cache": self.arabic_processor.get_cache_stats(),
+            "sessions": self.sessions.get_stats(),
+            "conversation_store": (
+                self.conversation_store.get_stats() if self.conversation_store is not None else None
+            ),
+            "logging": self.execution_log.get_stats(),
+            "recent_logs": self.execution_log.recent(5)
         }
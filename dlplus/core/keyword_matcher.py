@@ -0,0 +1,127 @@
+"""
+Keyword Matcher
+مطابق الكلمات المفتاحية
+"""
+
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class KeywordMatcher:
+    """
+    Multi-keyword matcher compiled into a single-scan automaton
+    مطابق كلمات مفتاحية متعددة مُجمّع في مسح واحد
+    
+    Each keyword carries a ``(rank, value)`` pair; lower ranks win in
+    ``best_match``. Keywords are compiled into a trie-shaped regular
+    expression, so one ``finditer`` pass reports the longest keyword at
+    every position, and the shorter keywords on the same trie path are
+    resolved from precomputed tables.
+    
+    Keywords added later are compiled into a new segment, leaving existing
+    segments untouched. Segments are merged once there are more than
+    ``max_segments`` of them.
+    """
+    
+    max_segments = 8
+    
+    def __init__(self, keywords: Optional[Dict[str, Tuple[int, Any]]] = None):
+        self._keywords: Dict[str, Tuple[int, Any]] = {}
+        self._segments: List[Tuple[re.Pattern, Dict[str, list]]] = []
+        if keywords:
+            self.add_keywords(keywords)
+    
+    def __len__(self) -> int:
+        return len(self._keywords)
+    
+    def __contains__(self, keyword: str) -> bool:
+        return keyword in self._keywords
+    
+    def add_keywords(self, keywords: Dict[str, Tuple[int, Any]]):
+        """Add keywords as a new segment without recompiling existing ones"""
+        segment = {}
+        for keyword, (rank, value) in keywords.items():
+            if not keyword:
+                continue
+            current = self._keywords.get(keyword)
+            if current is None or rank < current[0]:
+                self._keywords[keyword] = (rank, value)
+                segment[keyword] = (rank, value)
+        
+        if not segment:
+            return
+        
+        if len(self._segments) >= self.max_segments:
+            # Fold everything back into one segment
+            self._segments = [self._compile(self._keywords)]
+        else:
+            self._segments.append(self._compile(segment))
+    
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str, int, Any]]:
+        """
+        Yield ``(start, keyword, rank, value)`` for every keyword occurrence,
+        including overlapping ones
+        """
+        for pattern, prefixes in self._segments:
+            for match in pattern.finditer(text):
+                start = match.start()
+                for keyword, rank, value in prefixes[match.group(1)]:
+                    yield start, keyword, rank, value
+    
+    def best_match(self, text: str) -> Optional[Tuple[int, Any]]:
+        """Return the lowest-ranked ``(rank, value)`` found in text, or None"""
+        best = None
+        for pattern, prefixes in self._segments:
+            for match in pattern.finditer(text):
+                candidate = prefixes[match.group(1)][0]
+                if best is None or candidate[1] < best[0]:
+                    best = (candidate[1], candidate[2])
+        return best
+    
+    @staticmethod
+    def _compile(keywords: Dict[str, Tuple[int, Any]]) -> Tuple[re.Pattern, Dict[str, list]]:
+        """Compile keywords into a trie regex plus a prefix table"""
+        trie: Dict[str, dict] = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = True
+        
+        # For each keyword, every keyword that is a prefix of it (itself
+        # included), best rank first. The regex reports only the longest
+        # keyword at a position; its prefixes match there as well.
+        prefixes = {}
+        for keyword in keywords:
+            found = [
+                (keyword[:i], *keywords[keyword[:i]])
+                for i in range(1, len(keyword) + 1)
+                if keyword[:i] in keywords
+            ]
+            found.sort(key=lambda item: item[1])
+            prefixes[keyword] = found
+        
+        pattern = re.compile("(?=(%s))" % KeywordMatcher._trie_to_regex(trie))
+        return pattern, prefixes
+    
+    @staticmethod
+    def _trie_to_regex(node: Dict[str, dict]) -> str:
+        """Render a trie node as a greedy regular expression"""
+        terminal = "" in node
+        branches = [
+            re.escape(char) + KeywordMatcher._trie_to_regex(child)
+            for char, child in sorted(node.items())
+            if char != ""
+        ]
+        
+        if not branches:
+            return ""
+        
+        if len(branches) == 1:
+            body = branches[0]
+        else:
+            body = "(?:%s)" % "|".join(branches)
+        
+        if terminal:
+            return "(?:%s)?" % body
+        return body
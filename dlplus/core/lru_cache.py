@@ -0,0 +1,135 @@
+"""
+Bounded LRU Cache
+ذاكرة تخزين مؤقت محدودة الحجم
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def approximate_size(value: Any) -> int:
+    """Rough deep size in bytes of strings, numbers and simple containers"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item) for item in value)
+    return size
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by entries and bytes
+    ذاكرة تخزين مؤقت LRU محدودة بعدد العناصر والحجم
+    
+    Entries larger than ``max_entry_bytes`` are never stored, so one huge
+    input cannot push everything else out or pin memory. Hit, miss and
+    eviction counters are reported by ``get_stats``.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 8 * 1024 * 1024,
+        max_entry_bytes: Optional[int] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 16
+        self._init_storage()
+    
+    def _init_storage(self):
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+    
+    def __getstate__(self) -> Dict:
+        # Copies (e.g. sent to worker processes) start empty
+        return {
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "max_entry_bytes": self.max_entry_bytes
+        }
+    
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._init_storage()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value and mark it recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> bool:
+        """Store a value, evicting old entries; returns False if it is too large"""
+        if size is None:
+            size = approximate_size(key) + approximate_size(value)
+        
+        with self._lock:
+            if size > self.max_entry_bytes:
+                self.rejected += 1
+                return False
+            
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            
+            while self._entries and (
+                len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+            
+            return True
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove an entry and return its value"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.current_bytes -= entry[1]
+            return entry[0]
+    
+    def clear(self):
+        """Drop all entries, keeping counters"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+    
+    def get_stats(self) -> Dict:
+        """Get cache counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,270 @@
+"""
+Metrics
+مقاييس الأداء بصيغة Prometheus
+"""
+
+import time
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_clock = time.perf_counter_ns
+
+# Upper bounds in seconds, from tens of microseconds (text analysis)
+# up to tens of seconds (web search, model calls)
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+# Pending durations or clock readings in one list before a family is
+# bucketed
+DEFAULT_FOLD_EVERY = 4096
+
+
+class _Histogram:
+    """Counts per fixed bucket for one label set; durations in nanoseconds"""
+    
+    __slots__ = ("counts", "sum", "count")
+    
+    def __init__(self, size: int):
+        # One count per bucket plus the overflow (+Inf) bucket, not cumulative
+        self.counts = [0] * size
+        self.sum = 0
+        self.count = 0
+
+
+class StageTimer:
+    """
+    Splits a request into consecutive stages timed with ``perf_counter_ns``
+    
+    Each ``lap`` ends a stage that began at the previous lap (or when the
+    timer was created). Laps only append the stage name and the raw clock
+    reading to two flat lists; durations are worked out when the stages
+    are folded into histograms or read.
+    """
+    
+    __slots__ = ("names", "marks")
+    
+    def __init__(self):
+        self.names: List[str] = []
+        # Clock readings: when the timer started, then the end of each stage
+        self.marks: List[int] = [_clock()]
+    
+    def lap(self, stage: str):
+        self.names.append(stage)
+        self.marks.append(_clock())
+    
+    @property
+    def started(self) -> int:
+        return self.marks[0]
+    
+    @property
+    def stages(self) -> List[Tuple[str, int]]:
+        """(stage, nanoseconds) pairs"""
+        marks = self.marks
+        return [(stage, marks[i + 1] - marks[i]) for i, stage in enumerate(self.names)]
+    
+    def elapsed_ns(self) -> int:
+        """Time since the timer was created"""
+        return _clock() - self.marks[0]
+    
+    def breakdown(self) -> Dict[str, float]:
+        """Milliseconds per stage, plus ``total``"""
+        stages = {}
+        for stage, ns in self.stages:
+            stages[stage] = round(stages.get(stage, 0.0) + ns / 1e6, 3)
+        stages["total"] = round(self.elapsed_ns() / 1e6, 3)
+        return stages
+
+
+class MetricsRegistry:
+    """
+    Fixed-bucket histograms and counters in Prometheus text format
+    مدرجات تكرارية وعدادات بصيغة Prometheus النصية
+    
+    Families are declared once with ``histogram`` or ``counter`` and their
+    label names; series are created the first time a label combination is
+    recorded. Durations are recorded as integer nanoseconds (from
+    ``time.perf_counter_ns``). On the request path a histogram only
+    appends them, or a timer's raw clock readings, to a pending list;
+    every ``fold_every`` entries, and before ``value`` or ``render`` read
+    the family, they are bucketed in one numpy pass. Seconds and label
+    strings are only produced by ``render``. A family with one label may
+    be keyed by the bare label value instead of a 1-tuple.
+    """
+    
+    def __init__(
+        self,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        prefix: str = "dlplus",
+        fold_every: int = DEFAULT_FOLD_EVERY
+    ):
+        self.buckets = tuple(sorted(buckets))
+        self._bounds = np.array([int(round(bound * 1e9)) for bound in self.buckets], dtype=np.int64)
+        self.prefix = prefix
+        self.fold_every = max(1, fold_every)
+        # name -> (help, label names, {label values: series})
+        self._histograms: Dict[str, Tuple[str, Tuple[str, ...], Dict[Hashable, _Histogram]]] = {}
+        self._counters: Dict[str, Tuple[str, Tuple[str, ...], Dict[Hashable, int]]] = {}
+        # Not bucketed yet, per histogram family: durations by label set,
+        # and the clock readings of timers by their sequence of stage
+        # names, one row of len(names) + 1 readings per timer. Only ints
+        # are kept, so pending data holds no per-request objects
+        self._samples: Dict[str, Dict[Hashable, List[int]]] = {}
+        self._runs: Dict[str, Dict[Tuple[str, ...], List[int]]] = {}
+    
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        """Declare a histogram family (durations in seconds)"""
+        self._histograms.setdefault(name, (help_text, tuple(labels), {}))
+        self._samples.setdefault(name, {})
+        self._runs.setdefault(name, {})
+    
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        """Declare a counter family"""
+        self._counters.setdefault(name, (help_text, tuple(labels), {}))
+    
+    def observe(self, name: str, labels: Hashable, ns: int):
+        """Record one duration, in nanoseconds"""
+        samples = self._samples[name]
+        durations = samples.get(labels)
+        if durations is None:
+            durations = samples[labels] = []
+        durations.append(ns)
+        if len(durations) >= self.fold_every:
+            self._fold(name)
+    
+    def observe_many(self, name: str, samples: Iterable[Tuple[Hashable, int]]):
+        """Record several ``(labels, ns)`` durations in one family"""
+        pending = self._samples[name]
+        full = False
+        for labels, ns in samples:
+            durations = pending.get(labels)
+            if durations is None:
+                durations = pending[labels] = []
+            durations.append(ns)
+            full = full or len(durations) >= self.fold_every
+        if full:
+            self._fold(name)
+    
+    def observe_stages(self, name: str, timer: StageTimer):
+        """Record each stage of a timer, labelled by stage name"""
+        runs = self._runs[name]
+        names = tuple(timer.names)
+        readings = runs.get(names)
+        if readings is None:
+            readings = runs[names] = []
+        readings += timer.marks
+        if len(readings) >= self.fold_every:
+            self._fold(name)
+    
+    def _fold(self, name: str):
+        """Bucket a family's pending durations"""
+        series = self._histograms[name][2]
+        size = len(self._bounds) + 1
+        
+        samples = self._samples[name]
+        for labels, durations in samples.items():
+            durations = np.fromiter(durations, dtype=np.int64, count=len(durations))
+            buckets = np.searchsorted(self._bounds, durations, side="left")
+            self._add(series, labels, np.bincount(buckets, minlength=size), int(durations.sum()))
+        samples.clear()
+        
+        runs = self._runs[name]
+        for names, readings in runs.items():
+            # One row per timer and one column per stage; column offsets
+            # let a single bincount fill every stage's buckets
+            width = len(names)
+            readings = np.fromiter(readings, dtype=np.int64, count=len(readings)).reshape(-1, width + 1)
+            durations = np.diff(readings, axis=1)
+            buckets = np.searchsorted(self._bounds, durations, side="left") + np.arange(width) * size
+            counts = np.bincount(buckets.ravel(), minlength=width * size).reshape(width, size)
+            sums = durations.sum(axis=0).tolist()
+            for column, stage in enumerate(names):
+                self._add(series, stage, counts[column], sums[column])
+        runs.clear()
+    
+    @staticmethod
+    def _add(series: Dict[Hashable, _Histogram], labels: Hashable, counts: np.ndarray, total: int):
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = _Histogram(len(counts))
+        counts = counts.tolist()
+        histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+        histogram.sum += total
+        histogram.count += sum(counts)
+    
+    def inc(self, name: str, labels: Hashable = (), amount: int = 1):
+        """Add to a counter"""
+        series = self._counters[name][2]
+        series[labels] = series.get(labels, 0) + amount
+    
+    def inc_many(self, name: str, labels: Iterable[Hashable]):
+        """Add one to a counter for each label set"""
+        series = self._counters[name][2]
+        for entry in labels:
+            series[entry] = series.get(entry, 0) + 1
+    
+    def value(self, name: str, labels: Hashable = ()) -> Optional[Dict]:
+        """A counter's value, or a histogram's count and sum (seconds), for tests and status"""
+        if name in self._counters:
+            return {"value": self._counters[name][2].get(labels, 0)}
+        self._fold(name)
+        histogram = self._histograms[name][2].get(labels)
+        if histogram is None:
+            return None
+        return {"count": histogram.count, "sum": histogram.sum / 1e9}
+    
+    def reset(self):
+        """Drop every recorded series, keeping the declared families"""
+        for _, _, series in list(self._histograms.values()) + list(self._counters.values()):
+            series.clear()
+        for pending in list(self._samples.values()) + list(self._runs.values()):
+            pending.clear()
+    
+    def render(self) -> str:
+        """Everything recorded, in the Prometheus text exposition format"""
+        lines: List[str] = []
+        les = [_format_float(bound) for bound in self.buckets] + ["+Inf"]
+        
+        for name, (help_text, label_names, series) in sorted(self._histograms.items()):
+            self._fold(name)
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, histogram in sorted(series.items()):
+                base = _labels(label_names, labels)
+                cumulative = 0
+                for le, count in zip(les, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{{{base}{',' if base else ''}le=\"{le}\"}} {cumulative}")
+                lines.append(f"{metric}_sum{_braces(base)} {_format_float(histogram.sum / 1e9)}")
+                lines.append(f"{metric}_count{_braces(base)} {histogram.count}")
+        
+        for name, (help_text, label_names, series) in sorted(self._counters.items()):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for labels, value in sorted(series.items()):
+                base = _labels(label_names, labels)
+                lines.append(f"{metric}{_braces(base)} {value}")
+        
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names: Tuple[str, ...], values: Hashable) -> str:
+    if not isinstance(values, tuple):
+        values = (values,)
+    return ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+
+
+def _braces(labels: str) -> str:
+    return f"{{{labels}}}" if labels else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_float(value: float) -> str:
+    return repr(float(value))
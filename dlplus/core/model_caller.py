@@ -0,0 +1,188 @@
+"""
+Model Caller
+استدعاء النماذج مع الطلبات الاحتياطية والمتحوطة
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from ..config.models_config import get_model_config
+from .model_router import ModelRouter
+
+
+class ModelCallError(RuntimeError):
+    """Every model in the fallback chain failed"""
+    
+    def __init__(self, errors: Dict[str, str]):
+        super().__init__("All models failed: " + "; ".join(f"{model}: {error}" for model, error in errors.items()))
+        self.errors = errors
+
+
+class ModelCaller:
+    """
+    Calls models with hedging and a fallback chain
+    يستدعي النماذج مع طلبات متحوطة وسلسلة بدائل
+    
+    The first model in the chain is called; if it has not answered by its
+    observed p95 latency, a hedged duplicate goes to the next model
+    (preferring another provider) and whichever answers first wins; the
+    other call is cancelled. When a call fails, the next model in the
+    chain takes over, so a request only fails when every model has.
+    
+    Hedges are limited by ``budget_ratio``: at most that fraction of
+    calls may send an extra request. Until a model has ``min_samples``
+    latencies, ``default_delay_ms`` stands in for its p95.
+    """
+    
+    def __init__(
+        self,
+        providers,
+        router: Optional[ModelRouter] = None,
+        budget_ratio: float = 0.1,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        default_delay_ms: float = 2000.0,
+        window: int = 256
+    ):
+        self.providers = providers
+        self.router = router
+        self.budget_ratio = budget_ratio
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay_ms = default_delay_ms
+        self.window = window
+        # model key -> recent successful latencies (ms)
+        self._latencies: Dict[str, Deque[float]] = {}
+        
+        self.calls = 0
+        self.failures = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        self.hedges_over_budget = 0
+        self.fallbacks_used = 0
+        self.cancelled = 0
+    
+    def hedge_delay_ms(self, model_key: str) -> float:
+        """How long to wait for a model before hedging: its observed p95"""
+        latencies = self._latencies.get(model_key)
+        if not latencies or len(latencies) < self.min_samples:
+            return self.default_delay_ms
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+    
+    async def call(
+        self,
+        chain: List[str],
+        messages: List[Dict[str, str]],
+        hedge: bool = True,
+        **kwargs
+    ) -> Dict:
+        """
+        Call the first model in ``chain`` that answers
+        
+        Returns the provider result plus ``model``, ``hedged`` (a hedge
+        was sent), ``fallback`` (the answer did not come from the first
+        model) and ``errors`` from models that failed along the way.
+        Raises ModelCallError when every model fails.
+        """
+        self.calls += 1
+        remaining = list(dict.fromkeys(chain))
+        errors: Dict[str, str] = {}
+        hedged = False
+        
+        while remaining:
+            primary = remaining.pop(0)
+            running = {self._start(primary, messages, kwargs): primary}
+            
+            try:
+                if hedge and remaining:
+                    done, _ = await asyncio.wait(running, timeout=self.hedge_delay_ms(primary) / 1000)
+                    if not done:
+                        if self.hedges_sent + 1 <= self.budget_ratio * self.calls:
+                            backup = self._pick_hedge(primary, remaining)
+                            remaining.remove(backup)
+                            running[self._start(backup, messages, kwargs)] = backup
+                            self.hedges_sent += 1
+                            hedged = True
+                        else:
+                            self.hedges_over_budget += 1
+                
+                while running:
+                    done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        model_key = running.pop(task)
+                        if task.exception() is not None:
+                            errors[model_key] = str(task.exception())
+                            continue
+                        
+                        result = dict(task.result())
+                        if model_key != primary:
+                            self.hedge_wins += 1
+                        if model_key != chain[0]:
+                            self.fallbacks_used += 1
+                        result.update({
+                            "model": model_key,
+                            "hedged": hedged,
+                            "fallback": model_key != chain[0],
+                            "errors": errors
+                        })
+                        return result
+            finally:
+                # The loser of a hedge, or everything if we were cancelled
+                for task in running:
+                    task.cancel()
+                    self.cancelled += 1
+                if running:
+                    await asyncio.gather(*running, return_exceptions=True)
+        
+        self.failures += 1
+        raise ModelCallError(errors)
+    
+    def _pick_hedge(self, primary: str, remaining: List[str]) -> str:
+        """Next model in the chain, preferring a different provider"""
+        provider = get_model_config(primary).provider
+        for model_key in remaining:
+            if get_model_config(model_key).provider != provider:
+                return model_key
+        return remaining[0]
+    
+    def _start(self, model_key: str, messages: List[Dict[str, str]], kwargs: Dict) -> asyncio.Task:
+        return asyncio.ensure_future(self._attempt(model_key, messages, kwargs))
+    
+    async def _attempt(self, model_key: str, messages: List[Dict[str, str]], kwargs: Dict) -> Dict:
+        """One model call, recorded for hedging delays and routing"""
+        started = time.perf_counter()
+        try:
+            result = await self.providers.chat(model_key, messages, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if self.router is not None:
+                self.router.record(model_key, (time.perf_counter() - started) * 1000, success=False)
+            raise
+        
+        latency_ms = (time.perf_counter() - started) * 1000
+        latencies = self._latencies.get(model_key)
+        if latencies is None:
+            latencies = self._latencies[model_key] = deque(maxlen=self.window)
+        latencies.append(latency_ms)
+        if self.router is not None:
+            self.router.record(model_key, latency_ms, success=True)
+        return result
+    
+    def get_stats(self) -> Dict:
+        """Hedging and fallback counters"""
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "hedges_sent": self.hedges_sent,
+            "hedge_wins": self.hedge_wins,
+            "hedges_over_budget": self.hedges_over_budget,
+            "hedge_ratio": round(self.hedges_sent / self.calls, 4) if self.calls else 0.0,
+            "hedge_budget_ratio": self.budget_ratio,
+            "fallbacks_used": self.fallbacks_used,
+            "cancelled": self.cancelled,
+            "hedge_delay_ms": {model: round(self.hedge_delay_ms(model), 3) for model in self._latencies}
+        }
@@ -0,0 +1,187 @@
+"""
+Model Router
+موجه النماذج حسب التكلفة وزمن الاستجابة
+"""
+
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from ..config.models_config import ALL_MODELS, ModelConfig
+
+
+class _ModelHealth:
+    """Smoothed latency and error rate observed for one model"""
+    
+    __slots__ = ("latency_ms", "error_rate", "samples", "degraded_until")
+    
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+        self.error_rate = 0.0
+        self.samples = 0
+        self.degraded_until = 0.0
+
+
+class ModelRouter:
+    """
+    Picks the cheapest model that fits a request
+    يختار أرخص نموذج يلبي متطلبات الطلب
+    
+    Models are indexed once by (Arabic, code) capability, cheapest first.
+    A request is routed to the first model in its capability list that
+    has enough context for ``required_tokens``, is not degraded and whose
+    observed latency meets the request's SLO.
+    
+    Latency and error rate are exponentially weighted moving averages of
+    ``record`` calls. A model whose error rate reaches ``error_threshold``
+    is degraded for ``cooldown_seconds``; after that it is tried again,
+    and one success clears it if its error rate has come back down.
+    """
+    
+    def __init__(
+        self,
+        models: Optional[Dict[str, ModelConfig]] = None,
+        providers: Optional[Iterable[str]] = None,
+        alpha: float = 0.2,
+        error_threshold: float = 0.5,
+        min_samples: int = 3,
+        cooldown_seconds: float = 30.0,
+        latency_prior_ms: float = 1000.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        models = models if models is not None else ALL_MODELS
+        if providers is not None:
+            # Only route to models something can actually call
+            providers = set(providers)
+            models = {key: model for key, model in models.items() if model.provider in providers}
+        self.models = models
+        self.alpha = alpha
+        self.error_threshold = error_threshold
+        self.min_samples = min_samples
+        self.cooldown_seconds = cooldown_seconds
+        self.clock = clock
+        
+        # (arabic, code) -> model keys, cheapest first, larger context on ties
+        self._index: Dict[Tuple[bool, bool], List[str]] = {}
+        for arabic in (False, True):
+            for code in (False, True):
+                keys = [
+                    key for key, model in models.items()
+                    if (model.supports_arabic or not arabic) and (model.supports_code or not code)
+                ]
+                keys.sort(key=lambda key: (models[key].cost_per_1k_tokens, -models[key].max_tokens, key))
+                self._index[(arabic, code)] = keys
+        
+        self._health = {key: _ModelHealth(latency_prior_ms) for key in models}
+    
+    def record(self, model_key: str, latency_ms: float, success: bool):
+        """Fold one observed call into a model's latency and error rate"""
+        health = self._health.get(model_key)
+        if health is None:
+            return
+        alpha = self.alpha
+        if success:
+            # Failed calls often return early, so only successes count for latency
+            health.latency_ms += alpha * (latency_ms - health.latency_ms)
+        health.error_rate += alpha * ((0.0 if success else 1.0) - health.error_rate)
+        health.samples += 1
+        
+        if health.error_rate >= self.error_threshold and health.samples >= self.min_samples:
+            health.degraded_until = self.clock() + self.cooldown_seconds
+        elif success:
+            health.degraded_until = 0.0
+    
+    def is_degraded(self, model_key: str) -> bool:
+        """Whether a model is currently being avoided"""
+        health = self._health.get(model_key)
+        return health is not None and health.degraded_until > self.clock()
+    
+    def route(
+        self,
+        arabic: bool = False,
+        code: bool = False,
+        required_tokens: int = 0,
+        latency_slo_ms: Optional[float] = None,
+        exclude: Iterable[str] = ()
+    ) -> Dict:
+        """
+        Choose a model; returns the decision and the reason for it
+        
+        The decision also lists ``fallbacks``: the other candidates in the
+        order they would have been chosen.
+        """
+        exclude = set(exclude)
+        capable = [key for key in self._index[(arabic, code)] if key not in exclude]
+        if not capable:
+            raise LookupError("No model available with the required capabilities")
+        
+        candidates = [key for key in capable if self.models[key].max_tokens >= required_tokens]
+        notes = []
+        if not candidates:
+            candidates = sorted(capable, key=lambda key: -self.models[key].max_tokens)
+            notes.append(f"no capable model fits {required_tokens} tokens, largest context first")
+        
+        now = self.clock()
+        health = self._health
+        healthy = [key for key in candidates if health[key].degraded_until <= now]
+        degraded = [key for key in candidates if health[key].degraded_until > now]
+        if degraded:
+            notes.append(f"skipped degraded: {', '.join(degraded)}")
+        
+        if not healthy:
+            ordered = sorted(degraded, key=lambda key: health[key].error_rate)
+            reason = "all capable models degraded, lowest error rate"
+        elif latency_slo_ms is None:
+            ordered = healthy + degraded
+            reason = "cheapest capable model"
+        else:
+            within = [key for key in healthy if health[key].latency_ms <= latency_slo_ms]
+            slower = sorted(
+                (key for key in healthy if health[key].latency_ms > latency_slo_ms),
+                key=lambda key: health[key].latency_ms
+            )
+            ordered = within + slower + degraded
+            if within:
+                reason = f"cheapest model within {latency_slo_ms:g}ms SLO"
+            else:
+                reason = f"no model meets {latency_slo_ms:g}ms SLO, fastest healthy model"
+        
+        model_key = ordered[0]
+        model = self.models[model_key]
+        return {
+            "model": model_key,
+            "provider": model.provider,
+            "reason": "; ".join([reason] + notes),
+            "cost_per_1k_tokens": model.cost_per_1k_tokens,
+            "expected_latency_ms": round(health[model_key].latency_ms, 3),
+            "required_tokens": required_tokens,
+            "fallbacks": ordered[1:]
+        }
+    
+    def alternatives(self, model_key: str, required_tokens: int = 0) -> List[str]:
+        """Other models with at least the capabilities of ``model_key``, best first"""
+        model = self.models.get(model_key)
+        if model is None:
+            return []
+        try:
+            decision = self.route(
+                arabic=model.supports_arabic,
+                code=model.supports_code,
+                required_tokens=required_tokens,
+                exclude=[model_key]
+            )
+        except LookupError:
+            return []
+        return [decision["model"]] + decision["fallbacks"]
+    
+    def get_stats(self) -> Dict:
+        """Observed latency, error rate and state per model"""
+        now = self.clock()
+        return {
+            key: {
+                "latency_ewma_ms": round(health.latency_ms, 3),
+                "error_rate": round(health.error_rate, 4),
+                "samples": health.samples,
+                "degraded": health.degraded_until > now
+            }
+            for key, health in self._health.items()
+        }
@@ -0,0 +1,212 @@
+"""
+Plan Executor
+منفذ خطط التنفيذ
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+StepRunner = Callable[[Dict, Dict[str, Any]], Awaitable[Any]]
+EventCallback = Callable[[str, Dict], None]
+
+
+class PlanExecutor:
+    """
+    Runs execution plan steps as a dependency graph
+    ينفذ خطوات الخطة كرسم بياني للاعتماديات
+    
+    Each step is a dict with an ``id`` and optionally:
+    
+    - ``depends_on``: ids that must finish first; their successful results
+      are passed to the step as ``inputs``
+    - ``requires``: subset of ``depends_on`` that must succeed, otherwise
+      the step is skipped
+    - ``critical``: if the step fails, running steps are cancelled and the
+      plan fails; other failures only leave a gap in the results
+    - ``timeout``: seconds, defaulting to ``default_timeout``
+    
+    Steps start as soon as their dependencies finish, so independent
+    steps run concurrently and the total time is the critical path.
+    """
+    
+    def __init__(self, default_timeout: float = 30.0):
+        self.default_timeout = default_timeout
+    
+    @staticmethod
+    def validate(steps: List[Dict]):
+        """Raise ValueError for duplicate ids, unknown dependencies or cycles"""
+        ids = [step["id"] for step in steps]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate step ids in plan")
+        
+        known = set(ids)
+        remaining = {}
+        for step in steps:
+            deps = set(step.get("depends_on", ()))
+            unknown = deps - known
+            if unknown:
+                raise ValueError(f"Step {step['id']} depends on unknown steps: {sorted(unknown)}")
+            if not set(step.get("requires", ())) <= deps:
+                raise ValueError(f"Step {step['id']} requires steps it does not depend on")
+            remaining[step["id"]] = deps
+        
+        # Kahn's algorithm: anything left over is on a cycle
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        while ready:
+            done = ready.pop()
+            del remaining[done]
+            for step_id, deps in remaining.items():
+                if done in deps:
+                    deps.discard(done)
+                    if not deps:
+                        ready.append(step_id)
+        if remaining:
+            raise ValueError(f"Plan has a dependency cycle through: {sorted(remaining)}")
+    
+    async def execute(
+        self,
+        steps: List[Dict],
+        run_step: StepRunner,
+        on_event: Optional[EventCallback] = None
+    ) -> Dict:
+        """
+        Execute the plan; returns per-step reports and results
+        
+        ``run_step(step, inputs)`` performs one step. The result has
+        ``success`` (False only when a critical step failed),
+        ``duration_ms``, ``steps`` (reports in plan order) and ``results``
+        (successful step results by id). ``on_event(event, data)`` is
+        called with "step_start" as each step starts and "step_finish"
+        with its report as it finishes, is skipped or is cancelled.
+        """
+        self.validate(steps)
+        by_id = {step["id"]: step for step in steps}
+        waiting = {step["id"]: set(step.get("depends_on", ())) for step in steps}
+        dependents = defaultdict(list)
+        for step in steps:
+            for dep in step.get("depends_on", ()):
+                dependents[dep].append(step["id"])
+        
+        reports: Dict[str, Dict] = {}
+        results: Dict[str, Any] = {}
+        running: Dict[asyncio.Task, Tuple[str, float, asyncio.TimerHandle]] = {}
+        timed_out = set()
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        failed_critical = None
+        
+        def finish(step_id: str, report: Dict):
+            reports[step_id] = report
+            if on_event is not None:
+                on_event("step_finish", report)
+        
+        def release(step_id: str) -> List[str]:
+            """Release dependents of a finished step; returns newly ready ids"""
+            ready, queue = [], [step_id]
+            while queue:
+                finished = queue.pop()
+                for dependent in dependents[finished]:
+                    waiting[dependent].discard(finished)
+                    if waiting[dependent]:
+                        continue
+                    step = by_id[dependent]
+                    missing = [dep for dep in step.get("requires", ()) if dep not in results]
+                    if missing:
+                        finish(dependent, self._report(
+                            step, "skipped", started, started, error=f"Required steps did not succeed: {missing}"
+                        ))
+                        queue.append(dependent)
+                    else:
+                        ready.append(dependent)
+            return ready
+        
+        ready = [step_id for step_id, deps in waiting.items() if not deps]
+        try:
+            while ready or running:
+                for step_id in ready:
+                    step = by_id[step_id]
+                    inputs = {dep: results[dep] for dep in step.get("depends_on", ()) if dep in results}
+                    task = loop.create_task(run_step(step, inputs))
+                    # A timer rather than wait_for, which would add a task per step
+                    timer = loop.call_later(
+                        step.get("timeout", self.default_timeout), self._expire, task, timed_out
+                    )
+                    running[task] = (step_id, time.perf_counter(), timer)
+                    if on_event is not None:
+                        on_event("step_start", {"id": step_id, "action": step.get("action"), "tool": step.get("tool")})
+                ready = []
+                
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step_id, step_started, timer = running.pop(task)
+                    timer.cancel()
+                    step = by_id[step_id]
+                    
+                    if task in timed_out:
+                        report = self._report(
+                            step, "timeout", started, step_started,
+                            error=f"Timed out after {step.get('timeout', self.default_timeout)}s"
+                        )
+                    elif task.cancelled():
+                        report = self._report(step, "cancelled", started, step_started)
+                    elif task.exception() is not None:
+                        report = self._report(step, "failed", started, step_started, error=str(task.exception()))
+                    else:
+                        report = self._report(step, "ok", started, step_started)
+                        results[step_id] = task.result()
+                    finish(step_id, report)
+                    
+                    if step_id not in results and step.get("critical"):
+                        failed_critical = step_id
+                    ready.extend(release(step_id))
+                
+                if failed_critical is not None:
+                    break
+        finally:
+            # Critical failure, or the caller itself was cancelled
+            for task, (_, _, timer) in running.items():
+                timer.cancel()
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        
+        for step in steps:
+            if step["id"] not in reports:
+                finish(step["id"], self._report(step, "cancelled", started, started))
+        
+        return {
+            "success": failed_critical is None,
+            "failed_step": failed_critical,
+            "duration_ms": (time.perf_counter() - started) * 1000,
+            "steps": [reports[step["id"]] for step in steps],
+            "results": results
+        }
+    
+    @staticmethod
+    def _expire(task: asyncio.Task, timed_out: set):
+        if not task.done():
+            timed_out.add(task)
+            task.cancel()
+    
+    @staticmethod
+    def _report(
+        step: Dict,
+        status: str,
+        plan_started: float,
+        step_started: float,
+        error: Optional[str] = None
+    ) -> Dict:
+        now = time.perf_counter()
+        report = {
+            "id": step["id"],
+            "action": step.get("action"),
+            "tool": step.get("tool"),
+            "status": status,
+            "started_ms": round((step_started - plan_started) * 1000, 3),
+            "duration_ms": round((now - step_started) * 1000, 3) if status in ("ok", "failed", "timeout") else 0.0
+        }
+        if error is not None:
+            report["error"] = error
+        return report
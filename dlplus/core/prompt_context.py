@@ -0,0 +1,114 @@
+"""
+Prompt Context Rendering
+بناء سياق الأوامر ضمن ميزانية الرموز
+"""
+
+from typing import Iterable, List, Optional, Tuple
+
+# Rough characters per token for common BPE tokenizers. Arabic script is
+# split into far more tokens per character than English, so it is
+# estimated separately (and conservatively).
+ASCII_CHARS_PER_TOKEN = 4
+NON_ASCII_CHARS_PER_TOKEN = 2
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast, slightly pessimistic token count for mixed Arabic/English text
+    تقدير سريع لعدد الرموز في نص عربي أو إنجليزي
+    
+    Runs in C: the UTF-8 length minus the character count is the number of
+    extra bytes, one per Arabic letter.
+    """
+    if not text:
+        return 0
+    length = len(text)
+    non_ascii = min(length, len(text.encode("utf-8")) - length)
+    ascii_chars = length - non_ascii
+    return (
+        -(-ascii_chars // ASCII_CHARS_PER_TOKEN)
+        + -(-non_ascii // NON_ASCII_CHARS_PER_TOKEN)
+    )
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text so its estimate fits ``max_tokens``, marking the cut with '...'"""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    if max_tokens <= 1:
+        return ""
+    # Shrink proportionally, then trim any remaining overshoot
+    cut = text[:max(0, len(text) * (max_tokens - 1) // tokens)]
+    while cut and estimate_tokens(cut) > max_tokens - 1:
+        cut = cut[:-max(1, len(cut) // 20)]
+    return cut.rstrip() + "..."
+
+
+class ContextRenderer:
+    """
+    Packs conversation turns into a prompt context within a token budget
+    يجمع أدوار المحادثة في سياق ضمن ميزانية محددة من الرموز
+    
+    Each turn is rendered once into a fragment (message capped at
+    ``max_fragment_tokens``) that is cached on the turn, so new turns are
+    rendered incrementally and repeated calls only pay for packing.
+    """
+    
+    def __init__(self, max_fragment_tokens: int = 200):
+        self.max_fragment_tokens = max_fragment_tokens
+    
+    def fragment(self, turn) -> Tuple[str, int]:
+        """Rendered text and token estimate of a turn, cached on the turn"""
+        cached = turn.fragment
+        if cached is None:
+            message = truncate_to_tokens(" ".join(turn.user_message.split()), self.max_fragment_tokens)
+            text = f"User: {message} | Intent: {turn.intent}"
+            # Numbering added at render time costs about two more tokens
+            cached = turn.fragment = (text, estimate_tokens(text) + 2)
+        return cached
+    
+    def render(
+        self,
+        turns: Iterable,
+        budget: int,
+        footer: Optional[List[str]] = None
+    ) -> str:
+        """
+        Render the highest-priority turns that fit, in conversation order
+        
+        ``turns`` is in priority order (duplicates are skipped); a turn that
+        does not fit is skipped so smaller ones can still be packed.
+        ``footer`` lines (files, preferences) are reserved first; when even
+        they do not fit, the first ones are dropped.
+        """
+        footer = list(footer or [])
+        footer_tokens = [estimate_tokens(line) + 1 for line in footer]
+        while footer and sum(footer_tokens) > budget:
+            footer.pop(0)
+            footer_tokens.pop(0)
+        remaining = budget - sum(footer_tokens)
+        
+        heading = "Recent conversation:"
+        remaining -= estimate_tokens(heading) + 1
+        
+        chosen = {}
+        for turn in turns:
+            if remaining <= 0:
+                break
+            key = turn.seq if turn.seq is not None else id(turn)
+            if key in chosen:
+                continue
+            text, tokens = self.fragment(turn)
+            if tokens <= remaining:
+                chosen[key] = (turn, text)
+                remaining -= tokens
+        
+        lines = []
+        if chosen:
+            lines.append(heading)
+            ordered = sorted(chosen.values(), key=lambda item: (item[0].seq or 0, item[0].timestamp))
+            for number, (_, text) in enumerate(ordered, 1):
+                lines.append(f"{number}. {text}")
+        lines.extend(footer)
+        return "\n".join(lines)
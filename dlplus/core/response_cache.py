@@ -0,0 +1,336 @@
+"""
+Response Cache
+ذاكرة تخزين الاستجابات المؤقتة
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from .lru_cache import LRUCache
+
+# Every disk entry starts with this, so its expiry can be read from the
+# first bytes of the file
+_DISK_PREFIX = b'{"expires_at": '
+
+
+def request_key(
+    text: str,
+    intent: str,
+    model: str,
+    fingerprint: str = "",
+    normalize: Optional[Callable[[str], str]] = None
+) -> str:
+    """
+    Key identifying a request's result
+    
+    With ``normalize`` the text is folded through it and case and
+    whitespace are ignored; without it the text is used as given.
+    """
+    if normalize is not None:
+        text = " ".join(normalize(text).casefold().split())
+    return hashlib.sha256("\x1f".join((text, intent, model, fingerprint)).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of plan results keyed on the request
+    ذاكرة مؤقتة من طبقتين لنتائج تنفيذ الطلبات
+    
+    Keys combine the input text, intent, model and a fingerprint of the
+    conversation context. In "normalized" mode the text is passed
+    through ``normalize`` (diacritics and letter variants folded, case
+    and whitespace ignored) so trivially different prompts share an
+    entry; "exact" mode uses the text as given.
+    
+    Entries live in a bounded in-memory LRU and, with ``disk_dir``, in
+    JSON files that survive restarts and are promoted to memory on a
+    hit. Both tiers hold values JSON-encoded, so every hit returns a
+    fresh copy and callers may modify what they get. Each intent has
+    its own TTL; a TTL of 0 means the intent is never cached (commands
+    have side effects), None means no expiry.
+    
+    The disk tier holds at most ``disk_max_bytes``, dropping the oldest
+    files first. Expired files are swept every ``sweep_interval`` seconds
+    and when the cache is created; a sweep rescans the directory, so
+    files written by other processes are counted too. ``aget`` and
+    ``aput`` do their file work in a thread so the event loop is never
+    blocked on disk.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        default_ttl: Optional[float] = 3600.0,
+        ttls: Optional[Dict[str, Optional[float]]] = None,
+        mode: str = "normalized",
+        normalize: Optional[Callable[[str], str]] = None,
+        disk_dir: Optional[Union[str, Path]] = None,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+        sweep_interval: float = 300.0,
+        clock: Callable[[], float] = time.time
+    ):
+        if mode not in ("exact", "normalized"):
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.mode = mode
+        self.normalize = normalize or (lambda text: text)
+        self.disk_dir = Path(disk_dir) if disk_dir is not None else None
+        self.disk_max_bytes = disk_max_bytes
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        # Disk entries, oldest first: key -> (file size, expires_at)
+        self._disk: "OrderedDict[str, Tuple[int, Optional[float]]]" = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        self._last_sweep = 0.0
+        
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.bytes_saved = 0
+        self.disk_evicted = 0
+        
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self.sweep()
+    
+    def key(self, text: str, intent: str, model: str, fingerprint: str = "") -> str:
+        """Cache key for a request"""
+        return request_key(text, intent, model, fingerprint, self.normalize if self.mode == "normalized" else None)
+    
+    @staticmethod
+    def fingerprint(*parts) -> str:
+        """Short stable digest of the context a response depended on"""
+        encoded = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+    
+    def ttl_for(self, intent: str) -> Optional[float]:
+        return self.ttls.get(intent, self.default_ttl)
+    
+    def cacheable(self, intent: str) -> bool:
+        return self.ttl_for(intent) != 0
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached value for a key, or None when missing or expired"""
+        now = self.clock()
+        entry = self._get_memory(key, now)
+        if entry is None and self.disk_dir is not None:
+            entry = self._promote(key, self._read_disk(key, now))
+        return self._found(entry)
+    
+    async def aget(self, key: str) -> Optional[Dict]:
+        """``get`` with the disk tier read in a thread"""
+        now = self.clock()
+        entry = self._get_memory(key, now)
+        if entry is None and self.disk_dir is not None:
+            entry = self._promote(key, await asyncio.to_thread(self._read_disk, key, now))
+        return self._found(entry)
+    
+    def put(self, key: str, intent: str, value: Dict) -> bool:
+        """Store a JSON-serializable value under the intent's TTL"""
+        entry = self._put_memory(key, intent, value)
+        if entry is None:
+            return False
+        if self.disk_dir is not None:
+            self._write_disk(key, entry[0], entry[1])
+        return True
+    
+    async def aput(self, key: str, intent: str, value: Dict) -> bool:
+        """``put`` with the disk tier written in a thread"""
+        entry = self._put_memory(key, intent, value)
+        if entry is None:
+            return False
+        if self.disk_dir is not None:
+            await asyncio.to_thread(self._write_disk, key, entry[0], entry[1])
+        return True
+    
+    def _get_memory(self, key: str, now: float) -> Optional[tuple]:
+        entry = self.memory.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= now:
+            self.memory.pop(key)
+            self.expired += 1
+            entry = None
+        return entry
+    
+    def _promote(self, key: str, entry: Optional[tuple]) -> Optional[tuple]:
+        if entry is not None:
+            self.disk_hits += 1
+            self.memory.put(key, entry, size=entry[2])
+        return entry
+    
+    def _found(self, entry: Optional[tuple]) -> Optional[Dict]:
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_saved += entry[2]
+        return json.loads(entry[1])
+    
+    def _put_memory(self, key: str, intent: str, value: Dict) -> Optional[tuple]:
+        ttl = self.ttl_for(intent)
+        if ttl == 0:
+            return None
+        encoded = json.dumps(value, ensure_ascii=False, default=str)
+        size = len(encoded.encode("utf-8"))
+        expires_at = self.clock() + ttl if ttl is not None else None
+        
+        entry = (expires_at, encoded, size)
+        self.memory.put(key, entry, size=size)
+        self.stores += 1
+        return entry
+    
+    def clear(self):
+        """Drop every entry from both tiers"""
+        self.memory.clear()
+        if self.disk_dir is not None:
+            with self._disk_lock:
+                for path in self.disk_dir.glob("*/*.json"):
+                    path.unlink(missing_ok=True)
+                self._disk.clear()
+                self._disk_bytes = 0
+    
+    def sweep(self) -> int:
+        """
+        Rescan the disk tier, deleting expired files and any beyond
+        ``disk_max_bytes``; returns how many files were deleted
+        """
+        if self.disk_dir is None:
+            return 0
+        now = self.clock()
+        found = []
+        for path in self.disk_dir.glob("*/*"):
+            try:
+                stat = path.stat()
+                if path.suffix == ".tmp":
+                    # Left by a writer that died before renaming
+                    if time.time() - stat.st_mtime > 60:
+                        path.unlink(missing_ok=True)
+                    continue
+                if path.suffix != ".json":
+                    continue
+                with open(path, "rb") as file:
+                    head = file.read(64)
+            except OSError:
+                continue
+            found.append((stat.st_mtime, path.stem, stat.st_size, _expiry(head)))
+        found.sort()
+        
+        removed = 0
+        with self._disk_lock:
+            self._last_sweep = now
+            self._disk.clear()
+            self._disk_bytes = 0
+            for _, key, size, expires_at in found:
+                if expires_at is False or (expires_at is not None and expires_at <= now):
+                    self._path(key).unlink(missing_ok=True)
+                    if expires_at is not False:
+                        self.expired += 1
+                    removed += 1
+                    continue
+                self._disk[key] = (size, expires_at)
+                self._disk_bytes += size
+            removed += self._trim_disk()
+        return removed
+    
+    def _trim_disk(self) -> int:
+        """Delete the oldest files until the tier fits (lock held)"""
+        removed = 0
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            key, (size, _) = self._disk.popitem(last=False)
+            self._path(key).unlink(missing_ok=True)
+            self._disk_bytes -= size
+            self.disk_evicted += 1
+            removed += 1
+        return removed
+    
+    def _forget_disk(self, key: str):
+        with self._disk_lock:
+            stored = self._disk.pop(key, None)
+            if stored is not None:
+                self._disk_bytes -= stored[0]
+    
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+    
+    def _read_disk(self, key: str, now: float) -> Optional[tuple]:
+        path = self._path(key)
+        try:
+            raw = path.read_bytes()
+            stored = json.loads(raw)
+        except (OSError, ValueError):
+            return None
+        expires_at = stored.get("expires_at")
+        if expires_at is not None and expires_at <= now:
+            path.unlink(missing_ok=True)
+            self._forget_disk(key)
+            self.expired += 1
+            return None
+        return (expires_at, json.dumps(stored["value"], ensure_ascii=False), len(raw))
+    
+    def _write_disk(self, key: str, expires_at: Optional[float], encoded_value: str):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = _DISK_PREFIX + b'%s, "value": %s}' % (
+            json.dumps(expires_at).encode("utf-8"), encoded_value.encode("utf-8")
+        )
+        # Write then rename, so readers never see a partial file
+        temporary = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+        
+        with self._disk_lock:
+            stored = self._disk.pop(key, None)
+            if stored is not None:
+                self._disk_bytes -= stored[0]
+            self._disk[key] = (len(data), expires_at)
+            self._disk_bytes += len(data)
+            self._trim_disk()
+        if self.clock() - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+    
+    def get_stats(self) -> Dict:
+        """Hit ratio, bytes saved and tier occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "entries": len(self.memory),
+            "bytes": self.memory.current_bytes,
+            "disk": str(self.disk_dir) if self.disk_dir is not None else None,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+            "disk_evicted": self.disk_evicted,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "stores": self.stores,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "bytes_saved": self.bytes_saved
+        }
+
+
+def _expiry(head: bytes):
+    """
+    A disk entry's expiry from its first bytes: a timestamp, None for no
+    expiry, or False when the file is not a cache entry
+    """
+    if not head.startswith(_DISK_PREFIX):
+        return False
+    value, _, _ = head[len(_DISK_PREFIX):].partition(b",")
+    try:
+        expires_at = json.loads(value)
+    except ValueError:
+        return False
+    return expires_at if expires_at is None or isinstance(expires_at, (int, float)) else False
@@ -0,0 +1,153 @@
+"""
+Session Store
+مخزن سياقات الجلسات
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from .context_analyzer import ContextAnalyzer
+
+
+class _Shard:
+    """One lock-protected slice of the session table, kept in LRU order"""
+    
+    __slots__ = ("lock", "sessions")
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        # session_id -> [analyzer, last_access]
+        self.sessions: "OrderedDict[str, list]" = OrderedDict()
+
+
+class SessionStore:
+    """
+    Sharded in-memory store of per-session ContextAnalyzer instances
+    مخزن مجزأ لسياقات المحادثة لكل جلسة
+    
+    Sessions are spread over ``num_shards`` shards by hash, each with its
+    own lock, so concurrent requests for different sessions rarely
+    contend. Each shard holds at most ``max_sessions / num_shards``
+    sessions; the least recently used one is evicted when a shard is
+    full, and sessions idle for longer than ``ttl_seconds`` expire. Both
+    checks run on access, so memory stays flat however many short-lived
+    sessions come and go. Analyzers are closed when their session is
+    evicted, expires or is dropped, which writes out their vectors.
+    """
+    
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        ttl_seconds: float = 1800.0,
+        num_shards: int = 16,
+        factory: Optional[Callable[[str], ContextAnalyzer]] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.num_shards = num_shards
+        self.shard_capacity = max(1, -(-max_sessions // num_shards))
+        # Called with the session ID to build a new session's analyzer
+        self.factory = factory or (lambda session_id: ContextAnalyzer())
+        self.clock = clock
+        self._shards: List[_Shard] = [_Shard() for _ in range(num_shards)]
+        
+        self.created = 0
+        self.evicted = 0
+        self.expired = 0
+    
+    def _shard(self, session_id: str) -> _Shard:
+        return self._shards[hash(session_id) % self.num_shards]
+    
+    def get(self, session_id: str) -> ContextAnalyzer:
+        """Get the analyzer for a session, creating it if needed"""
+        shard = self._shard(session_id)
+        now = self.clock()
+        
+        with shard.lock:
+            self._expire(shard, now)
+            
+            entry = shard.sessions.get(session_id)
+            if entry is not None:
+                entry[1] = now
+                shard.sessions.move_to_end(session_id)
+                return entry[0]
+            
+            while len(shard.sessions) >= self.shard_capacity:
+                _, (evicted, _) = shard.sessions.popitem(last=False)
+                evicted.close()
+                self.evicted += 1
+            
+            analyzer = self.factory(session_id)
+            shard.sessions[session_id] = [analyzer, now]
+            self.created += 1
+            return analyzer
+    
+    def peek(self, session_id: str) -> Optional[ContextAnalyzer]:
+        """Get the analyzer for a live session without creating or touching it"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            entry = shard.sessions.get(session_id)
+            if entry is None or self.clock() - entry[1] > self.ttl_seconds:
+                return None
+            return entry[0]
+    
+    def drop(self, session_id: str) -> bool:
+        """Forget a session; returns True if it existed"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            entry = shard.sessions.pop(session_id, None)
+        if entry is None:
+            return False
+        entry[0].close()
+        return True
+    
+    def sweep(self) -> int:
+        """Expire idle sessions in every shard; returns how many were removed"""
+        now = self.clock()
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                removed += self._expire(shard, now)
+        return removed
+    
+    def _expire(self, shard: _Shard, now: float) -> int:
+        """Drop idle sessions from the LRU end of a shard (lock held)"""
+        removed = 0
+        sessions = shard.sessions
+        while sessions:
+            _, (_, last_access) = next(iter(sessions.items()))
+            if now - last_access <= self.ttl_seconds:
+                break
+            _, (analyzer, _) = sessions.popitem(last=False)
+            analyzer.close()
+            removed += 1
+        self.expired += removed
+        return removed
+    
+    def close(self):
+        """Close every live session's analyzer (writing out its vectors)"""
+        for shard in self._shards:
+            with shard.lock:
+                for analyzer, _ in shard.sessions.values():
+                    analyzer.close()
+    
+    def __len__(self) -> int:
+        return sum(len(shard.sessions) for shard in self._shards)
+    
+    def __contains__(self, session_id: str) -> bool:
+        return self.peek(session_id) is not None
+    
+    def get_stats(self) -> Dict:
+        """Get session counts and eviction counters"""
+        return {
+            "active_sessions": len(self),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "shards": self.num_shards,
+            "created": self.created,
+            "evicted": self.evicted,
+            "expired": self.expired
+        }
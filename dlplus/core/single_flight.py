@@ -0,0 +1,81 @@
+"""
+Single-Flight Request Coalescing
+دمج الطلبات المتطابقة المتزامنة
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Runs one computation per key for all concurrent callers
+    ينفذ عملية واحدة لكل مفتاح لجميع الطلبات المتزامنة
+    
+    The first caller for a key starts the computation as its own task;
+    callers that arrive while it is running wait for the same task and
+    get the same result or exception. Each caller waits through
+    ``asyncio.shield``, so a caller that is cancelled (e.g. its client
+    disconnected) does not cancel the work for the others. Only when
+    every caller has gone is the computation cancelled.
+    """
+    
+    def __init__(self):
+        # key -> [task, number of callers still waiting]
+        self._flights: Dict[Hashable, list] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+    
+    def __len__(self) -> int:
+        return len(self._flights)
+    
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Result of ``compute()`` for ``key``, shared with concurrent callers
+        
+        Returns ``(result, shared)``; ``shared`` is True when this call
+        attached to a computation another caller started.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(compute())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.leaders += 1
+        
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if not task.done() and flight[1] == 1:
+                # Nobody is left to receive the result. Callers arriving
+                # before the task has wound down start a fresh flight
+                task.cancel()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                self.abandoned += 1
+            raise
+        finally:
+            flight[1] -= 1
+    
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        flight = self._flights.get(key)
+        if flight is not None and flight[0] is task:
+            del self._flights[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller has gone
+            task.exception()
+    
+    def get_stats(self) -> Dict:
+        """Coalescing counters"""
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned
+        }
@@ -0,0 +1,210 @@
+"""
+Tool Runtime
+بيئة تشغيل الأدوات
+"""
+
+import asyncio
+import functools
+import inspect
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+def _is_async(function: Callable) -> bool:
+    """Whether calling ``function`` returns a coroutine"""
+    while isinstance(function, functools.partial):
+        function = function.func
+    return inspect.iscoroutinefunction(function) or inspect.iscoroutinefunction(
+        getattr(function, "__call__", None)
+    )
+
+
+class _ToolState:
+    """Concurrency limit and counters of one registered tool"""
+    
+    __slots__ = (
+        "max_concurrency", "semaphore", "loop", "waiting", "running",
+        "calls", "failures", "timeouts", "latencies", "wait_total"
+    )
+    
+    def __init__(self, max_concurrency: int, window: int):
+        self.max_concurrency = max_concurrency
+        # Built on first use inside the loop that awaits it: tools are
+        # registered before the server's loop exists
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.waiting = 0
+        self.running = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        # Recent call durations in seconds, for percentiles
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.wait_total = 0.0
+    
+    def loop_semaphore(self) -> asyncio.Semaphore:
+        """The concurrency semaphore for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.loop = loop
+        return self.semaphore
+
+
+class ToolRuntime:
+    """
+    Runs registered tools without blocking the event loop
+    يشغل الأدوات المسجلة دون حجب حلقة الأحداث
+    
+    Coroutine functions are awaited directly. Plain functions run in a
+    bounded thread pool, or in a process pool when registered with
+    ``cpu_bound=True`` (the function and its arguments must then be
+    picklable). Each tool has its own semaphore, so a slow tool queues
+    its own calls instead of taking every worker, and its own timeout.
+    
+    A timed-out call is abandoned rather than stopped: a thread keeps
+    running until the function returns, so pools should be sized for
+    the slowest tools.
+    """
+    
+    def __init__(
+        self,
+        max_threads: int = 8,
+        max_processes: int = 2,
+        default_concurrency: int = 4,
+        default_timeout: float = 30.0,
+        latency_window: int = 256
+    ):
+        self.max_threads = max_threads
+        self.max_processes = max_processes
+        self.default_concurrency = default_concurrency
+        self.default_timeout = default_timeout
+        self.latency_window = latency_window
+        # name -> {"function", "description", "is_async", "cpu_bound",
+        #          "max_concurrency", "timeout", "state"}
+        self.tools: Dict[str, Dict] = {}
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+    
+    def register(
+        self,
+        name: str,
+        function: Callable,
+        description: str = "",
+        cpu_bound: bool = False,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> Dict:
+        """Register (or replace) a tool; returns its entry"""
+        max_concurrency = max_concurrency or self.default_concurrency
+        is_async = _is_async(function)
+        if is_async and cpu_bound:
+            raise ValueError(f"Tool {name} is a coroutine function and cannot run in a process pool")
+        
+        self.tools[name] = {
+            "function": function,
+            "description": description,
+            "is_async": is_async,
+            "cpu_bound": cpu_bound,
+            "max_concurrency": max_concurrency,
+            "timeout": timeout if timeout is not None else self.default_timeout,
+            "state": _ToolState(max_concurrency, self.latency_window)
+        }
+        return self.tools[name]
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self.tools
+    
+    async def invoke(self, name: str, **kwargs) -> Any:
+        """
+        Call a tool with keyword arguments and return its result
+        
+        Raises LookupError for unknown tools and asyncio.TimeoutError when
+        the call (not counting time queued for the semaphore) takes longer
+        than the tool's timeout; other exceptions propagate unchanged.
+        """
+        tool = self.tools.get(name)
+        if tool is None:
+            raise LookupError(f"Tool not registered: {name}")
+        state = tool["state"]
+        semaphore = state.loop_semaphore()
+        
+        queued = time.perf_counter()
+        state.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            state.waiting -= 1
+        
+        started = time.perf_counter()
+        state.wait_total += started - queued
+        state.running += 1
+        state.calls += 1
+        try:
+            return await asyncio.wait_for(self._call(tool, kwargs), tool["timeout"])
+        except asyncio.TimeoutError:
+            state.timeouts += 1
+            raise
+        except Exception:
+            state.failures += 1
+            raise
+        finally:
+            state.latencies.append(time.perf_counter() - started)
+            state.running -= 1
+            semaphore.release()
+    
+    async def _call(self, tool: Dict, kwargs: Dict) -> Any:
+        function = tool["function"]
+        if tool["is_async"]:
+            return await function(**kwargs)
+        
+        loop = asyncio.get_running_loop()
+        call = functools.partial(function, **kwargs) if kwargs else function
+        if tool["cpu_bound"]:
+            result = await loop.run_in_executor(self._process_pool(), call)
+        else:
+            result = await loop.run_in_executor(self._thread_pool(), call)
+        # A plain function may still hand back an awaitable
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+    
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="dlplus-tool")
+        return self._threads
+    
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self.max_processes)
+        return self._processes
+    
+    def shutdown(self, wait: bool = False):
+        """Stop the worker pools; they are recreated on the next call"""
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=wait)
+        self._threads = self._processes = None
+    
+    def get_stats(self) -> Dict:
+        """Queue depth, concurrency and latency per tool"""
+        stats = {}
+        for name, tool in self.tools.items():
+            state = tool["state"]
+            latencies = sorted(state.latencies)
+            stats[name] = {
+                "mode": "async" if tool["is_async"] else ("process" if tool["cpu_bound"] else "thread"),
+                "max_concurrency": tool["max_concurrency"],
+                "queue_depth": state.waiting,
+                "running": state.running,
+                "calls": state.calls,
+                "failures": state.failures,
+                "timeouts": state.timeouts,
+                "avg_wait_ms": round(state.wait_total / state.calls * 1000, 3) if state.calls else 0.0,
+                "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3) if latencies else 0.0,
+                "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 3) if latencies else 0.0,
+                "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0
+            }
+        return stats
@@ -0,0 +1,78 @@
+"""
+URL Guard
+حماية جلب الروابط
+"""
+
+import asyncio
+import ipaddress
+import socket
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+ALLOWED_SCHEMES = ("http", "https")
+
+
+def _public_address(address: str) -> bool:
+    """Whether an IP address is publicly routable"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def url_rejection(url: str, allowed_hosts: Iterable[str] = ()) -> Optional[str]:
+    """
+    Why a URL may not be fetched, or None when it passes the static checks
+    
+    Only http(s) URLs with a host are accepted. A host given as an IP
+    address must be public; ``localhost`` names never are. With
+    ``allowed_hosts`` the host must be one of them or a subdomain of one.
+    Hostnames are only resolved by ``resolve_public``.
+    """
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").rstrip(".").lower()
+        parts.port  # Raises ValueError for an invalid port
+    except ValueError:
+        return "malformed URL"
+    if parts.scheme.lower() not in ALLOWED_SCHEMES:
+        return f"scheme not allowed: {parts.scheme or '(none)'}"
+    if not host:
+        return "no host"
+    if host == "localhost" or host.endswith(".localhost"):
+        return "host is not public"
+    
+    try:
+        if not _public_address(host):
+            return "address is not public"
+    except ValueError:
+        # A hostname, checked once resolved
+        pass
+    
+    allowed = [entry.rstrip(".").lower() for entry in allowed_hosts]
+    if allowed and not any(host == entry or host.endswith("." + entry) for entry in allowed):
+        return "host not in the allow-list"
+    return None
+
+
+async def resolve_public(url: str, allowed_hosts: Iterable[str] = ()):
+    """
+    Raise PermissionError unless the URL passes ``url_rejection`` and every
+    address its host resolves to is public
+    
+    Resolution goes through the event loop's resolver, so it does not block.
+    """
+    reason = url_rejection(url, allowed_hosts)
+    if reason is not None:
+        raise PermissionError(f"URL not allowed ({reason}): {url}")
+    
+    parts = urlsplit(url)
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, parts.port or (443 if parts.scheme.lower() == "https" else 80),
+            type=socket.SOCK_STREAM
+        )
+    except OSError as e:
+        raise PermissionError(f"URL not allowed (cannot resolve host): {url}") from e
+    if not addresses or not all(_public_address(info[4][0]) for info in addresses):
+        raise PermissionError(f"URL not allowed (address is not public): {url}")
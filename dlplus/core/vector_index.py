@@ -0,0 +1,150 @@
+"""
+Vector Index
+فهرس المتجهات
+"""
+
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+# File header: int64 dimension, then int64 number of valid rows
+_HEADER = 2
+_HEADER_BYTES = _HEADER * 8
+
+
+class VectorIndex:
+    """
+    Append-only top-k cosine search over a contiguous float32 matrix
+    بحث عن أقرب المتجهات باستخدام مصفوفة float32 متصلة
+    
+    Vectors are numbered in the order they are added. They are stored in
+    a preallocated matrix that doubles when full, so a search is a single
+    matrix-vector product plus ``argpartition`` over the filled rows. That
+    product reads every row once and is bound by memory bandwidth: 20,000
+    rows of 128 dimensions (10 MB) take about 0.5 ms per query.
+    
+    With ``path`` the matrix is a memory-mapped file: a small header with
+    the dimension and the number of valid rows, then raw float32 rows.
+    This keeps large sessions out of the Python heap, and pages are only
+    read when searched. Adding a row only writes to the mapping; rows are
+    synced to disk and the row count written after them by ``flush`` and
+    every ``flush_every`` added rows, so rows a crash left unwritten are
+    never treated as valid. Rows added since the last flush are lost on
+    a crash. ``count``, when given, further caps how many stored rows are
+    kept. A file written with another dimension is started afresh. With
+    ``max_rows`` the index is a ring that keeps only the most recent
+    vectors.
+    """
+    
+    def __init__(
+        self,
+        dim: int,
+        capacity: int = 1024,
+        path: Optional[Union[str, Path]] = None,
+        count: Optional[int] = None,
+        max_rows: Optional[int] = None,
+        flush_every: int = 1024
+    ):
+        self.dim = dim
+        self.path = Path(path) if path is not None else None
+        self.max_rows = max_rows
+        self.flush_every = flush_every
+        # Rows added since the row count was last written
+        self._unflushed = 0
+        if max_rows is not None:
+            capacity = max_rows
+        
+        self._header: Optional[np.memmap] = None
+        if self.path is None:
+            self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+            self.count = 0
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            stored = self._stored_rows()
+            if count is not None:
+                stored = min(stored, count)
+            self._matrix = self._open_memmap(max(capacity, stored))
+            self._header = np.memmap(self.path, dtype=np.int64, mode="r+", shape=(_HEADER,))
+            self._header[0] = dim
+            self.count = stored
+            self._write_count()
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def add(self, vector: np.ndarray) -> int:
+        """Append a unit-length vector; returns its number"""
+        rows = self._matrix.shape[0]
+        if self.max_rows is not None:
+            row = self.count % rows
+        else:
+            row = self.count
+            if row == rows:
+                self._grow(rows * 2)
+        self._matrix[row] = vector
+        self.count += 1
+        if self._header is not None:
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._write_count()
+        return self.count - 1
+    
+    def search(self, query: np.ndarray, k: int = 3) -> List[Tuple[int, float]]:
+        """Return ``(number, cosine)`` for the ``k`` closest vectors, best first"""
+        filled = min(self.count, self._matrix.shape[0])
+        if not filled or k <= 0:
+            return []
+        
+        scores = self._matrix[:filled] @ query.astype(np.float32, copy=False)
+        if k < filled:
+            top = np.argpartition(scores, -k)[-k:]
+            top = top[np.argsort(scores[top])[::-1]]
+        else:
+            top = np.argsort(scores)[::-1]
+        
+        # Map ring rows back to vector numbers
+        first = self.count - filled
+        return [(first + (int(row) - first) % filled, float(scores[row])) for row in top]
+    
+    def flush(self):
+        """Write a memory-mapped matrix and its row count to disk"""
+        if self._header is not None and self._unflushed:
+            self._write_count()
+    
+    def _write_count(self):
+        # Rows first, so the stored count never covers unwritten rows
+        self._matrix.flush()
+        self._header[1] = self.count
+        self._header.flush()
+        self._unflushed = 0
+    
+    def _stored_rows(self) -> int:
+        """Valid rows in an existing file; 0 when missing or of another dimension"""
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+        if size < _HEADER_BYTES:
+            return 0
+        dim, count = np.fromfile(self.path, dtype=np.int64, count=_HEADER)
+        if dim != self.dim:
+            return 0
+        return int(max(0, min(count, (size - _HEADER_BYTES) // (self.dim * 4))))
+    
+    def _grow(self, capacity: int):
+        if self.path is None:
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            matrix[:self.count] = self._matrix[:self.count]
+            self._matrix = matrix
+        else:
+            self._matrix.flush()
+            self._matrix = self._open_memmap(capacity)
+    
+    def _open_memmap(self, rows: int) -> np.memmap:
+        size = _HEADER_BYTES + rows * self.dim * 4
+        with open(self.path, "ab") as file:
+            if file.tell() < size:
+                os.truncate(self.path, size)
+        return np.memmap(self.path, dtype=np.float32, mode="r+", offset=_HEADER_BYTES, shape=(rows, self.dim))
@@ -3,23 +3,37 @@ FastAPI Main Application
 تطبيق FastAPI الرئيسي
 """
 
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Query, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, Dict
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, List
+from contextlib import asynccontextmanager
+import asyncio
+import math
 import uvicorn
 
-from dlplus.core import IntelligenceCore
+from dlplus.core import AdmissionRejected, EventStream, IntelligenceCore
 from dlplus.agents import WebRetrievalAgent, CodeGeneratorAgent
 from dlplus.config import settings
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Close provider connections and flush persisted conversations on shutdown"""
+    yield
+    await intelligence_core.aclose()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="DL+ AI Agent Platform",
     description="Advanced AI Agent Platform with Arabic Support",
     version="1.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -48,15 +62,105 @@ class AgentRequest(BaseModel):
     prompt: str
     context: Optional[Dict] = None
     language: Optional[str] = "auto"
+    session_id: Optional[str] = Field(default=None, max_length=128)
+    latency_slo_ms: Optional[float] = Field(default=None, gt=0)
+    include_logs: bool = False
+    include_stages: bool = False
+
+
+class BatchRequest(BaseModel):
+    """Request model for batch text analysis"""
+    prompts: List[str]
 
 
 class AgentResponse(BaseModel):
     """Response model for agent execution"""
     success: bool
     response: str
+    session_id: Optional[str] = None
     intent: Optional[str] = None
+    intents: Optional[list] = None
     tools_used: Optional[list] = None
+    model_used: Optional[str] = None
+    model_decision: Optional[Dict] = None
     execution_time: Optional[float] = None
+    logs: Optional[List[Dict]] = None
+    stages: Optional[Dict[str, float]] = None
+
+
+def resolve_session_id(body_session_id: Optional[str], header_session_id: Optional[str]) -> Optional[str]:
+    """Session ID from the request body, falling back to the X-Session-ID header"""
+    session_id = body_session_id or header_session_id
+    if session_id is not None and len(session_id) > 128:
+        raise HTTPException(status_code=422, detail="Session ID too long (max 128 characters)")
+    return session_id
+
+
+async def admit(http_request: Request, prompt: str):
+    """
+    Wait for a processing slot, or fail fast with 429 and Retry-After
+    
+    Rate limits apply per API key (``settings.api_key_header``), or per
+    client address when the request has none.
+    """
+    key = http_request.headers.get(settings.api_key_header)
+    if key is None and http_request.client is not None:
+        key = http_request.client.host
+    try:
+        return await intelligence_core.admit(prompt, key)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+
+
+def release(ticket):
+    """Give back a slot taken by ``admit``"""
+    if ticket is not None:
+        intelligence_core.admission.release(ticket)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Streaming response holding an admission slot until it is done
+    
+    The slot is released however the response ends, including when the
+    client disconnects before the body is first iterated.
+    """
+    
+    def __init__(self, *args, ticket=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ticket = ticket
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            release(self.ticket)
+
+
+def agent_response(result: Dict) -> AgentResponse:
+    """
+    Response model for a ``process_request`` result
+    
+    ``logs`` and ``stages`` are only set when the request asked for them,
+    so serializing with ``exclude_unset`` leaves them out otherwise.
+    """
+    extra = {key: result[key] for key in ("logs", "stages") if key in result}
+    return AgentResponse(
+        success=result["success"],
+        response=result["response"],
+        session_id=result.get("session_id"),
+        intent=result.get("intent"),
+        intents=result.get("intents"),
+        tools_used=result.get("tools_used"),
+        model_used=result.get("model_used"),
+        model_decision=result.get("model_decision"),
+        execution_time=result.get("execution_time"),
+        **extra
+    )
 
 
 # API Endpoints
@@ -82,28 +186,125 @@ async def health_check():
     }
 
 
-@app.post("/api/agent/execute", response_model=AgentResponse)
-async def execute_agent(request: AgentRequest):
+@app.post("/api/agent/execute", response_model=AgentResponse, response_model_exclude_unset=True)
+async def execute_agent(
+    request: AgentRequest,
+    http_request: Request,
+    x_session_id: Optional[str] = Header(default=None)
+):
     """
     Execute AI agent with given prompt
     تنفيذ الوكيل الذكي مع الأمر المعطى
     """
+    session_id = resolve_session_id(request.session_id, x_session_id)
+    ticket = await admit(http_request, request.prompt)
+    
     try:
         result = await intelligence_core.process_request(
             user_input=request.prompt,
-            context=request.context
+            context=request.context,
+            session_id=session_id,
+            latency_slo_ms=request.latency_slo_ms,
+            include_logs=request.include_logs,
+            include_stages=request.include_stages
         )
         
-        return AgentResponse(
-            success=result["success"],
-            response=result["response"],
-            intent=result.get("intent"),
-            tools_used=result.get("tools_used"),
-            execution_time=result.get("execution_time")
+        return agent_response(result)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        release(ticket)
+
+
+@app.post("/api/agent/stream")
+async def stream_agent(
+    request: AgentRequest,
+    http_request: Request,
+    x_session_id: Optional[str] = Header(default=None)
+):
+    """
+    Execute AI agent, streaming progress as server-sent events
+    تنفيذ الوكيل الذكي مع بث التقدم أثناء التنفيذ
+    
+    An "accepted" event is sent at once, then "analysis", "model",
+    "plan", "step_start"/"step_finish" and "token" events as they
+    happen, and finally "result" (the execute response) or "error".
+    Token output waits while the client is behind; if the client
+    disconnects the request is cancelled. Admission happens before the
+    stream starts, so a shed request gets a plain 429.
+    """
+    session_id = resolve_session_id(request.session_id, x_session_id)
+    ticket = await admit(http_request, request.prompt)
+    events = EventStream(high_water=settings.stream_high_water)
+    
+    async def produce():
+        try:
+            result = await intelligence_core.process_request(
+                user_input=request.prompt,
+                context=request.context,
+                session_id=session_id,
+                latency_slo_ms=request.latency_slo_ms,
+                events=events,
+                include_logs=request.include_logs,
+                include_stages=request.include_stages
+            )
+            events.emit("result", jsonable_encoder(agent_response(result), exclude_unset=True))
+        except Exception as e:
+            events.emit("error", {"detail": str(e)})
+        finally:
+            events.close()
+    
+    async def body():
+        yield EventStream.format_sse("accepted", {"session_id": session_id}, event_id=0)
+        producer = asyncio.create_task(produce())
+        try:
+            event_id = 0
+            async for event, data in events:
+                event_id += 1
+                yield EventStream.format_sse(event, data, event_id=event_id)
+        finally:
+            # Client gone (or stream finished): stop the work behind it
+            events.close()
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+    
+    return AdmittedStreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        ticket=ticket
+    )
+
+
+@app.post("/api/agent/batch")
+async def analyze_batch(request: BatchRequest):
+    """
+    Analyze language, intent and entities for many prompts at once
+    تحليل مجموعة من الأوامر دفعة واحدة
+    """
+    if len(request.prompts) > settings.batch_max_prompts:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many prompts: {len(request.prompts)} > {settings.batch_max_prompts}"
         )
     
+    try:
+        # Analysis is CPU-bound; keep it off the event loop. Large batches
+        # go to the processor's worker pool, shared by every request
+        results = await asyncio.to_thread(
+            lambda: list(intelligence_core.arabic_processor.analyze_many(
+                request.prompts,
+                workers=settings.batch_workers
+            ))
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    return {
+        "count": len(results),
+        "results": results
+    }
 
 
 @app.get("/api/agents/list")
@@ -142,7 +343,7 @@ async def web_search(query: str):
     تنفيذ بحث على الويب
     """
     try:
-        result = await web_agent.execute(query)
+        result = await intelligence_core.call_agent("web_retrieval", query)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -155,31 +356,73 @@ async def generate_code(request: AgentRequest):
     توليد كود برمجي بناءً على المتطلبات
     """
     try:
-        result = await code_agent.execute(request.prompt, request.context)
+        result = await intelligence_core.call_agent("code_generator", request.prompt, request.context)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/context/summary")
-async def get_context_summary():
+async def get_context_summary(
+    session_id: Optional[str] = None,
+    x_session_id: Optional[str] = Header(default=None)
+):
     """Get current context summary"""
-    return intelligence_core.context_analyzer.get_context_summary()
+    session_id = resolve_session_id(session_id, x_session_id)
+    context_analyzer = intelligence_core.get_context(session_id, create=False)
+    if context_analyzer is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return context_analyzer.get_context_summary()
 
 
 @app.post("/api/context/clear")
-async def clear_context():
+async def clear_context(
+    session_id: Optional[str] = None,
+    x_session_id: Optional[str] = Header(default=None)
+):
     """Clear conversation context"""
-    intelligence_core.context_analyzer.clear_context()
+    intelligence_core.clear_context(resolve_session_id(session_id, x_session_id))
     return {"message": "Context cleared successfully"}
 
 
+@app.get("/api/context/export")
+async def export_context(
+    session_id: Optional[str] = None,
+    cursor: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+    x_session_id: Optional[str] = Header(default=None)
+):
+    """
+    Export the conversation one page at a time
+    تصدير المحادثة صفحة بصفحة
+    """
+    session_id = resolve_session_id(session_id, x_session_id)
+    context_analyzer = intelligence_core.get_context(session_id, create=False)
+    if context_analyzer is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return context_analyzer.export_page(cursor, limit)
+
+
 @app.get("/api/status")
 async def get_status():
     """Get detailed system status"""
     return intelligence_core.get_status()
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Stage latency histograms and counters in Prometheus text format
+    مقاييس الأداء بصيغة Prometheus
+    """
+    if intelligence_core.metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(
+        intelligence_core.metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # Main entry point
 if __name__ == "__main__":
     uvicorn.run(
@@ -0,0 +1,21 @@
+"""DL+ LLM Providers Package"""
+
+from .clients import (
+    ChatProvider,
+    OpenAIProvider,
+    OpenRouterProvider,
+    AnthropicProvider,
+    ProviderError,
+    ProviderRegistry,
+    PROVIDER_CLASSES
+)
+
+__all__ = [
+    'ChatProvider',
+    'OpenAIProvider',
+    'OpenRouterProvider',
+    'AnthropicProvider',
+    'ProviderError',
+    'ProviderRegistry',
+    'PROVIDER_CLASSES'
+]
@@ -0,0 +1,414 @@
+"""
+LLM Provider Clients
+عملاء مزودي النماذج اللغوية
+"""
+
+import asyncio
+import json
+import random
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+from ..config.settings import settings
+from ..config.models_config import get_model_config
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504, 529})
+
+# Raised by _parse/_parse_delta for a body without the expected fields
+_MALFORMED = (KeyError, IndexError, TypeError, AttributeError)
+
+
+class ProviderError(Exception):
+    """A provider request that failed for good (after any retries)"""
+    
+    def __init__(self, provider: str, message: str, status: Optional[int] = None, attempts: int = 1):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+        self.attempts = attempts
+
+
+class ChatProvider:
+    """
+    Base chat-completion client with a long-lived connection pool
+    عميل أساسي لواجهات المحادثة مع مجمع اتصالات دائم
+    
+    One ``httpx.AsyncClient`` is created on first use and kept for the
+    life of the provider, so requests reuse keep-alive connections (and
+    HTTP/2 streams when the ``h2`` package is installed) instead of paying
+    a TCP and TLS handshake each time. Requests that hit 429/5xx or a
+    connection error are retried with full-jitter exponential backoff,
+    honouring ``Retry-After`` up to ``backoff_max``.
+    
+    Subclasses define the wire format in ``_payload`` and ``_parse``.
+    """
+    
+    name = "base"
+    default_base_url = ""
+    path = ""
+    
+    def __init__(
+        self,
+        api_key: str = "",
+        base_url: Optional[str] = None,
+        timeout: float = 60.0,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        http2: bool = True
+    ):
+        self.api_key = api_key
+        self.base_url = (base_url or self.default_base_url).rstrip("/")
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive
+        )
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._client: Optional[httpx.AsyncClient] = None
+        
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.latency_total = 0.0
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The shared client, created on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self._headers(),
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2
+            )
+        return self._client
+    
+    async def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 1024,
+        temperature: Optional[float] = None
+    ) -> Dict:
+        """
+        Send a chat completion request
+        إرسال طلب محادثة
+        
+        ``messages`` use the OpenAI shape (``role`` and ``content``).
+        Returns content, model, usage (prompt/completion tokens), latency
+        and the number of attempts; raises ProviderError on failure.
+        """
+        payload = self._payload(model, messages, max_tokens, temperature)
+        started = time.perf_counter()
+        self.requests += 1
+        try:
+            data, attempts = await self._post(payload)
+            try:
+                result = self._parse(data)
+            except _MALFORMED as e:
+                raise ProviderError(self.name, f"Malformed response: {type(e).__name__}: {e}", attempts=attempts) from e
+        except ProviderError:
+            self.failures += 1
+            raise
+        latency = time.perf_counter() - started
+        self.latency_total += latency
+        
+        result.update({
+            "provider": self.name,
+            "latency_ms": round(latency * 1000, 3),
+            "attempts": attempts
+        })
+        return result
+    
+    async def stream(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 1024,
+        temperature: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion, yielding text as it arrives
+        بث نص الاستجابة أثناء توليده
+        
+        Failures before the response starts are retried like ``chat``;
+        once text has been yielded an error is raised as ProviderError.
+        Closing the generator early closes the connection, which stops
+        generation at the provider.
+        """
+        payload = self._payload(model, messages, max_tokens, temperature)
+        payload["stream"] = True
+        started = time.perf_counter()
+        self.requests += 1
+        try:
+            response, _ = await self._send(payload, stream=True)
+        except ProviderError:
+            self.failures += 1
+            raise
+        
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                text = self._parse_delta(json.loads(data))
+                if text:
+                    yield text
+        except (httpx.TransportError, ValueError) + _MALFORMED as e:
+            self.failures += 1
+            raise ProviderError(self.name, f"Stream interrupted: {type(e).__name__}: {e}") from e
+        finally:
+            await response.aclose()
+        self.latency_total += time.perf_counter() - started
+    
+    async def _post(self, payload: Dict):
+        """POST with retries; returns the decoded body and attempt count"""
+        response, attempts = await self._send(payload)
+        try:
+            return response.json(), attempts
+        except ValueError as e:
+            raise ProviderError(
+                self.name,
+                f"Malformed response body: {e}",
+                status=response.status_code,
+                attempts=attempts
+            ) from e
+    
+    async def _send(self, payload: Dict, stream: bool = False):
+        """
+        POST with retries; returns a successful response and attempt count
+        
+        With ``stream`` the body is left unread for the caller, who must
+        close the response.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_after = None
+            try:
+                request = self.client.build_request("POST", self.path, json=payload)
+                response = await self.client.send(request, stream=stream)
+                if stream and response.status_code >= 400:
+                    try:
+                        await response.aread()
+                    finally:
+                        await response.aclose()
+            except httpx.TransportError as e:
+                error = ProviderError(self.name, f"{type(e).__name__}: {e}", attempts=attempt)
+            else:
+                if response.status_code < 400:
+                    return response, attempt
+                error = ProviderError(
+                    self.name,
+                    f"HTTP {response.status_code}: {response.text[:200]}",
+                    status=response.status_code,
+                    attempts=attempt
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    raise error
+                retry_after = response.headers.get("retry-after")
+            
+            if attempt > self.max_retries:
+                raise error
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+    
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full-jitter exponential delay, or the server's Retry-After"""
+        if retry_after is not None:
+            try:
+                return min(self.backoff_max, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+    
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+    
+    def _payload(self, model: str, messages: List[Dict], max_tokens: int, temperature: Optional[float]) -> Dict:
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens}
+        if temperature is not None:
+            payload["temperature"] = temperature
+        return payload
+    
+    def _parse(self, data: Dict) -> Dict:
+        usage = data.get("usage") or {}
+        return {
+            "content": data["choices"][0]["message"]["content"],
+            "model": data.get("model"),
+            "usage": {
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0)
+            }
+        }
+    
+    def _parse_delta(self, event: Dict) -> str:
+        """Text carried by one streamed event"""
+        if "error" in event:
+            raise ValueError(event["error"].get("message", "error event"))
+        choices = event.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content") or ""
+    
+    async def close(self):
+        """Close the pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def get_stats(self) -> Dict:
+        """Request counters for this provider"""
+        succeeded = self.requests - self.failures
+        return {
+            "base_url": self.base_url,
+            "http2": self.http2,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "avg_latency_ms": round(self.latency_total / succeeded * 1000, 3) if succeeded else 0.0
+        }
+
+
+class OpenAIProvider(ChatProvider):
+    """OpenAI chat completions API"""
+    
+    name = "openai"
+    default_base_url = "https://api.openai.com/v1"
+    path = "/chat/completions"
+
+
+class OpenRouterProvider(OpenAIProvider):
+    """OpenRouter (OpenAI-compatible) chat completions API"""
+    
+    name = "openrouter"
+    default_base_url = "https://openrouter.ai/api/v1"
+    
+    def _headers(self) -> Dict[str, str]:
+        headers = super()._headers()
+        headers["X-Title"] = "DL+"
+        return headers
+
+
+class AnthropicProvider(ChatProvider):
+    """Anthropic messages API"""
+    
+    name = "anthropic"
+    default_base_url = "https://api.anthropic.com/v1"
+    path = "/messages"
+    api_version = "2023-06-01"
+    
+    def _headers(self) -> Dict[str, str]:
+        headers = {"anthropic-version": self.api_version}
+        if self.api_key:
+            headers["x-api-key"] = self.api_key
+        return headers
+    
+    def _payload(self, model: str, messages: List[Dict], max_tokens: int, temperature: Optional[float]) -> Dict:
+        # System prompts are a top-level field rather than a message
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        payload = {
+            "model": model,
+            "messages": [m for m in messages if m["role"] != "system"],
+            "max_tokens": max_tokens
+        }
+        if system:
+            payload["system"] = system
+        if temperature is not None:
+            payload["temperature"] = temperature
+        return payload
+    
+    def _parse(self, data: Dict) -> Dict:
+        usage = data.get("usage") or {}
+        return {
+            "content": "".join(block.get("text", "") for block in data["content"] if block.get("type") == "text"),
+            "model": data.get("model"),
+            "usage": {
+                "prompt_tokens": usage.get("input_tokens", 0),
+                "completion_tokens": usage.get("output_tokens", 0)
+            }
+        }
+    
+    def _parse_delta(self, event: Dict) -> str:
+        if event.get("type") == "error":
+            raise ValueError(event.get("error", {}).get("message", "error event"))
+        if event.get("type") != "content_block_delta":
+            return ""
+        return event["delta"].get("text", "")
+
+
+PROVIDER_CLASSES = {
+    provider.name: provider
+    for provider in (OpenAIProvider, OpenRouterProvider, AnthropicProvider)
+}
+
+
+class ProviderRegistry:
+    """
+    One pooled client per provider, created on first use
+    عميل واحد مشترك لكل مزود
+    
+    Clients are built from settings (API key, base URL override, pool
+    limits, retries) unless registered explicitly with ``register``.
+    """
+    
+    def __init__(self):
+        self.providers: Dict[str, ChatProvider] = {}
+    
+    def register(self, provider: ChatProvider) -> ChatProvider:
+        """Use a specific client for its provider name"""
+        self.providers[provider.name] = provider
+        return provider
+    
+    def get(self, name: str) -> ChatProvider:
+        """The shared client for a provider name"""
+        provider = self.providers.get(name)
+        if provider is None:
+            if name not in PROVIDER_CLASSES:
+                raise LookupError(f"Unknown provider: {name}")
+            provider = self.providers[name] = PROVIDER_CLASSES[name](
+                api_key=getattr(settings, f"{name}_api_key"),
+                base_url=getattr(settings, f"{name}_base_url") or None,
+                timeout=settings.provider_timeout,
+                max_connections=settings.provider_max_connections,
+                max_keepalive=settings.provider_max_keepalive,
+                max_retries=settings.provider_max_retries,
+                http2=settings.provider_http2
+            )
+        return provider
+    
+    async def chat(self, model_key: str, messages: List[Dict[str, str]], **kwargs) -> Dict:
+        """Chat with a model from models_config by its key"""
+        model = get_model_config(model_key)
+        return await self.get(model.provider).chat(model.name, messages, **kwargs)
+    
+    async def stream(self, model_key: str, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        """Stream a chat completion from a model by its key"""
+        model = get_model_config(model_key)
+        async for text in self.get(model.provider).stream(model.name, messages, **kwargs):
+            yield text
+    
+    async def close(self):
+        """Close every provider's connections"""
+        for provider in self.providers.values():
+            await provider.close()
+    
+    def get_stats(self) -> Dict:
+        """Counters per provider that has been used"""
+        return {name: provider.get_stats() for name, provider in self.providers.items()}
@@ -0,0 +1,260 @@
+"""
+Provider Stub Server
+خادم محاكاة لمزودي النماذج
+
+A local server that mimics the OpenAI/OpenRouter chat completions and
+Anthropic messages APIs (including streamed responses), with configurable
+latency and error injection. Used by the tests and benchmarks; run it standalone with:
+
+    python -m dlplus.providers.stub_server --port 8900 --latency 0.05 --error-rate 0.1
+
+and point OPENAI_BASE_URL / OPENROUTER_BASE_URL / ANTHROPIC_BASE_URL at
+http://127.0.0.1:8900/v1.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from typing import AsyncIterator, Callable, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+def _tokens(text: str) -> List[str]:
+    """Split a reply into word tokens that join back into it"""
+    words = text.split(" ")
+    return [word + " " for word in words[:-1]] + words[-1:]
+
+
+class StubConfig:
+    """Behaviour of the stub, changeable while it runs"""
+    
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        retry_after: Optional[float] = None,
+        token_delay: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        # Pause between streamed tokens
+        self.token_delay = token_delay
+        # Fail this many requests before applying error_rate
+        self.fail_next = 0
+        # Raw body sent with status 200 instead of a reply, while set
+        self.malformed_body: Optional[str] = None
+        self.random = random.Random(seed)
+        
+        self.requests = 0
+        self.errors = 0
+        # Client (host, port) pairs seen: one per TCP connection
+        self.connections = set()
+
+
+def create_stub_app(config: Optional[StubConfig] = None) -> FastAPI:
+    """Build the stub ASGI app; ``app.state.config`` holds its StubConfig"""
+    app = FastAPI(title="DL+ Provider Stub")
+    app.state.config = config or StubConfig()
+    
+    async def simulate(request: Request) -> Optional[Response]:
+        config = request.app.state.config
+        config.requests += 1
+        if request.client is not None:
+            config.connections.add((request.client.host, request.client.port))
+        
+        delay = config.latency + config.random.uniform(0, config.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        
+        failing = config.fail_next > 0
+        if failing:
+            config.fail_next -= 1
+        if failing or config.random.random() < config.error_rate:
+            config.errors += 1
+            headers = {}
+            if config.retry_after is not None:
+                headers["Retry-After"] = str(config.retry_after)
+            return JSONResponse(
+                {"error": {"type": "injected", "message": f"Injected error {config.error_status}"}},
+                status_code=config.error_status,
+                headers=headers
+            )
+        if config.malformed_body is not None:
+            return Response(config.malformed_body, media_type="application/json")
+        return None
+    
+    def stream(request: Request, reply: str, encode: Callable[[str], str], end: str) -> StreamingResponse:
+        """Send ``reply`` one token at a time as server-sent events"""
+        async def events() -> AsyncIterator[str]:
+            delay = request.app.state.config.token_delay
+            for token in _tokens(reply):
+                if delay:
+                    await asyncio.sleep(delay)
+                yield encode(token)
+            yield end
+        
+        return StreamingResponse(events(), media_type="text/event-stream")
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            return JSONResponse({"error": {"message": "Missing API key"}}, status_code=401)
+        error = await simulate(request)
+        if error is not None:
+            return error
+        
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        reply = f"stub reply to: {prompt}"
+        if body.get("stream"):
+            return stream(
+                request,
+                reply,
+                lambda token: "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": token}}]}) + "\n\n",
+                "data: [DONE]\n\n"
+            )
+        return {
+            "id": f"chatcmpl-{request.app.state.config.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": sum(len(m["content"].split()) for m in body["messages"]),
+                "completion_tokens": len(reply.split())
+            }
+        }
+    
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        if not request.headers.get("x-api-key") or not request.headers.get("anthropic-version"):
+            return JSONResponse({"error": {"message": "Missing API key or version"}}, status_code=401)
+        error = await simulate(request)
+        if error is not None:
+            return error
+        
+        body = await request.json()
+        if "max_tokens" not in body or any(m["role"] == "system" for m in body["messages"]):
+            return JSONResponse({"error": {"message": "Invalid request"}}, status_code=400)
+        prompt = body["messages"][-1]["content"]
+        reply = f"stub reply to: {prompt}"
+        if body.get("system"):
+            reply += f" (system: {body['system']})"
+        if body.get("stream"):
+            return stream(
+                request,
+                reply,
+                lambda token: "event: content_block_delta\ndata: " + json.dumps({
+                    "type": "content_block_delta",
+                    "index": 0,
+                    "delta": {"type": "text_delta", "text": token}
+                }) + "\n\n",
+                'event: message_stop\ndata: {"type": "message_stop"}\n\n'
+            )
+        return {
+            "id": f"msg_{request.app.state.config.requests}",
+            "type": "message",
+            "role": "assistant",
+            "model": body["model"],
+            "content": [{"type": "text", "text": reply}],
+            "stop_reason": "end_turn",
+            "usage": {
+                "input_tokens": sum(len(m["content"].split()) for m in body["messages"]),
+                "output_tokens": len(reply.split())
+            }
+        }
+    
+    return app
+
+
+class StubServer:
+    """
+    Runs the stub app with uvicorn in a background thread
+    
+    Use as a context manager; ``base_url`` ends in ``/v1``.
+    """
+    
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.app = create_stub_app(config)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self.host, self.port = self._socket.getsockname()[:2]
+        self._server = uvicorn.Server(uvicorn.Config(self.app, log_level="warning", lifespan="off"))
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def config(self) -> StubConfig:
+        return self.app.state.config
+    
+    @config.setter
+    def config(self, config: StubConfig):
+        self.app.state.config = config
+    
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+    
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Stub server did not start")
+            time.sleep(0.01)
+        return self
+    
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self._socket.close()
+    
+    def __enter__(self) -> "StubServer":
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the LLM provider APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+    
+    config = StubConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        token_delay=args.token_delay
+    )
+    uvicorn.run(create_stub_app(config), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from dlplus.core import IntelligenceCore, ArabicProcessor, IntentType
+from dlplus.core import IntelligenceCore, ArabicProcessor, ContextAnalyzer, IntentType, SessionStore
 from dlplus.agents import WebRetrievalAgent, CodeGeneratorAgent
 
 
@@ -34,6 +34,19 @@ class TestArabicProcessor:
         assert "َ" not in text_without
         assert "ْ" not in text_without
     
+    def test_normalize_text(self):
+        """Test single-pass normalization"""
+        text = "  الســــلامُ عليكُم   في مكتبة ٣ إلى  "
+        assert self.processor.normalize_text(text) == "السلام عليكم في مكتبه 3 الي"
+        assert self.processor.normalize_text("  plain   ascii ") == "plain ascii"
+    
+    def test_normalization_profile(self):
+        """Test normalization steps can be switched off"""
+        from dlplus.core import NormalizationProfile
+        
+        processor = ArabicProcessor(NormalizationProfile(fold_digits=False, fold_yeh=False))
+        assert processor.normalize_text("مكتبة ٣ إلى") == "مكتبه ٣ الى"
+    
     def test_detect_intent_arabic(self):
         """Test intent detection for Arabic"""
         assert self.processor.detect_intent("ابحث عن معلومات") == IntentType.SEARCH
@@ -46,6 +59,151 @@ class TestArabicProcessor:
         assert self.processor.detect_intent("generate code") == IntentType.GENERATE_CODE
         assert self.processor.detect_intent("run command") == IntentType.EXECUTE_COMMAND
     
+    def test_detect_intent_priority(self):
+        """Test Arabic keywords outrank English ones, then IntentType order"""
+        assert self.processor.detect_intent("search ترجم هذا") == IntentType.TRANSLATE
+        assert self.processor.detect_intent("اكتب كود ثم ابحث") == IntentType.SEARCH
+        assert self.processor.detect_intent("اقرأ ملف") == IntentType.READ_FILE
+        assert self.processor.detect_intent("hello") == IntentType.UNKNOWN
+    
+    def test_add_intent_keywords(self):
+        """Test runtime keyword registration"""
+        assert self.processor.detect_intent("translate this") == IntentType.UNKNOWN
+        self.processor.add_intent_keywords(IntentType.TRANSLATE, ["translate"])
+        assert self.processor.detect_intent("translate this") == IntentType.TRANSLATE
+        assert self.processor.detect_intent("search and translate") == IntentType.SEARCH
+    
+    def test_rank_intents_compound(self):
+        """Test compound requests yield several ranked intents"""
+        ranked = self.processor.rank_intents("ابحث ثم اكتب كود")
+        intents = [intent for intent, _ in ranked]
+        
+        assert intents == [IntentType.GENERATE_CODE, IntentType.SEARCH]
+        assert abs(sum(confidence for _, confidence in ranked) - 1.0) < 1e-9
+        assert self.processor.rank_intents("hello") == []
+    
+    def test_rank_intents_proclitics(self):
+        """Test attached prefixes do not hide keywords"""
+        ranked = self.processor.rank_intents("قم بتنفيذ الأمر والتحليل")
+        intents = {intent for intent, _ in ranked}
+        assert intents == {IntentType.EXECUTE_COMMAND, IntentType.ANALYZE}
+    
+    def test_analyze_many(self):
+        """Test batch analysis matches single-text analysis"""
+        texts = ["ابحث عن test.py", "generate code", "hello"] * 5
+        results = list(self.processor.analyze_many(iter(texts), chunk_size=4))
+        
+        assert len(results) == len(texts)
+        assert results[0] == self.processor.analyze(texts[0])
+        assert results[0]["language"] == "ar"
+        assert results[1]["intent"] == "generate_code"
+        assert results[2]["intent"] == "unknown"
+    
+    def test_analyze_many_process_pool(self):
+        """Test process pool fan-out keeps order and runtime keywords"""
+        self.processor.add_intent_keywords(IntentType.TRANSLATE, ["translate"])
+        texts = ["translate this", "ابحث عن معلومات"] * 6
+        
+        serial = list(self.processor.analyze_many(texts, chunk_size=3))
+        try:
+            parallel = list(self.processor.analyze_many(texts, workers=2, chunk_size=3))
+            pool = self.processor._pool
+            again = list(self.processor.analyze_many(texts, workers=2, chunk_size=3))
+            reused = self.processor._pool is pool
+            
+            self.processor.add_intent_keywords(IntentType.EXECUTE_COMMAND, ["deploy"])
+            updated = list(self.processor.analyze_many(["deploy now"] * 6, workers=2, chunk_size=3))
+        finally:
+            self.processor.close()
+        
+        assert parallel == serial == again
+        assert parallel[0]["intent"] == "translate"
+        assert reused
+        assert updated[0]["intent"] == "execute_command"
+        assert self.processor._pool is None
+        # Batches of one chunk never start the pool
+        list(self.processor.analyze_many(texts, workers=2, chunk_size=100))
+        assert self.processor._pool is None
+    
+    def test_memoization(self):
+        """Test opt-in memoization counts hits and returns copies"""
+        processor = ArabicProcessor(cache_size=16)
+        text = "اكتب كود في main.py"
+        
+        first = processor.extract_entities(text)
+        first["files"].append("corrupted.py")
+        second = processor.extract_entities(text)
+        processor.detect_intent(text)
+        processor.detect_intent(text)
+        
+        assert "corrupted.py" not in second["files"]
+        stats = processor.get_cache_stats()
+        assert stats["hits"] == 2
+        assert stats["misses"] == 2
+        assert self.processor.get_cache_stats() is None
+    
+    def test_memoization_sees_new_keywords(self):
+        """Test keywords added after a cache hit change the memoized intent"""
+        processor = ArabicProcessor(cache_size=100)
+        assert processor.detect_intent("deploy the app") == IntentType.UNKNOWN
+        assert processor.rank_intents("deploy the app") == []
+        processor.rank_intents("deploy the app").append("corrupted")
+        assert processor.rank_intents("deploy the app") == []
+        assert processor.get_cache_stats()["hits"] == 2
+        
+        processor.add_intent_keywords(IntentType.EXECUTE_COMMAND, ["deploy"])
+        
+        assert processor.detect_intent("deploy the app") == IntentType.EXECUTE_COMMAND
+        assert processor.rank_intents("deploy the app")[0][0] == IntentType.EXECUTE_COMMAND
+        assert processor.analyze("deploy the app")["intents"][0]["intent"] == "execute_command"
+    
+    def test_lru_cache_bounds(self):
+        """Test LRU eviction and the per-entry size limit"""
+        from dlplus.core.lru_cache import LRUCache
+        
+        cache = LRUCache(max_entries=2, max_bytes=10_000, max_entry_bytes=1_000)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        
+        assert "b" not in cache
+        assert cache.get("a") == 1
+        assert cache.put("huge", "x" * 5_000) is False
+        stats = cache.get_stats()
+        assert stats["evictions"] == 1
+        assert stats["rejected"] == 1
+    
+    def test_normalize_stream(self):
+        """Test chunked normalization matches whole-text normalization"""
+        text = "  الســلامُ   عليكُم \n\n search   for مَرْحَبًا  "
+        chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+        
+        assert "".join(self.processor.normalize_stream(chunks)) == self.processor.normalize_text(text)
+    
+    def test_extract_entities_stream(self, tmp_path):
+        """Test entities straddling chunk boundaries are found whole"""
+        text = "read main.py then open https://example.com/docs/page and run 'ls -la'"
+        path = tmp_path / "doc.txt"
+        path.write_text(text * 50, encoding="utf-8")
+        
+        found = list(self.processor.extract_entities_stream(path, chunk_size=7, max_entity_length=40))
+        
+        assert len(found) == 200
+        assert found[1][:3] == ("urls", "https://example.com/docs/page", text.index("https"))
+        assert found[2][:2] == ("keywords", "ls -la")
+        assert [entity.start for entity in found] == sorted(entity.start for entity in found)
+    
+    def test_keyword_matcher_overlapping(self):
+        """Test every overlapping keyword hit is reported"""
+        from dlplus.core.keyword_matcher import KeywordMatcher
+        
+        matcher = KeywordMatcher({"ab": (2, "x"), "abcd": (1, "y"), "bc": (0, "z")})
+        hits = {(start, keyword) for start, keyword, _, _ in matcher.iter_matches("abcd")}
+        assert hits == {(0, "ab"), (0, "abcd"), (1, "bc")}
+        assert matcher.best_match("abcd") == (0, "z")
+        assert matcher.best_match("xyz") is None
+    
     def test_extract_entities(self):
         """Test entity extraction"""
         text = "Read file test.py and search https://example.com"
@@ -54,6 +212,23 @@ class TestArabicProcessor:
         assert "files" in entities
         assert "urls" in entities
         assert len(entities["urls"]) > 0
+        assert entities["files"] == ["test.py"]
+    
+    def test_extract_entity_matches(self):
+        """Test one-scan extraction of every entity kind with offsets"""
+        text = (
+            "open تقرير.txt and run 'ls -la'\n"
+            "```python\nprint(1)\n```\n"
+            "  $ pip install -r requirements.txt\n"
+        )
+        matches = self.processor.extract_entity_matches(text)
+        
+        assert all(text[m.start:m.end] == m.value for m in matches)
+        entities = self.processor.extract_entities(text)
+        assert entities["files"] == ["تقرير.txt", "requirements.txt"]
+        assert entities["commands"] == ["ls -la", "pip install -r requirements.txt"]
+        assert entities["keywords"] == ["ls -la"]
+        assert entities["languages"] == ["python"]
 
 
 class TestIntelligenceCore:
@@ -92,6 +267,133 @@ class TestIntelligenceCore:
         assert result["success"] == True
         assert result["intent"] is not None
     
+    @pytest.mark.asyncio
+    async def test_prompt_fits_model(self):
+        """Test the prompt estimate stays within the selected model's limit"""
+        from dlplus.config.models_config import get_model_config
+        
+        for index in range(20):
+            result = await self.core.process_request("ابحث عن معلومات مفصلة " * 40, session_id="long")
+        
+        assert result["prompt_tokens"] <= get_model_config(result["model_used"]).max_tokens
+    
+    @pytest.mark.asyncio
+    async def test_plan_runs_registered_tools(self):
+        """Test file reads run as plan steps and missing tools only leave gaps"""
+        reads = []
+        
+        async def read_from_file(path):
+            reads.append(path)
+            return f"contents of {path}"
+        
+        self.core.register_tool("read_from_file", read_from_file, "Read a file")
+        result = await self.core.process_request("analyze a.py and b.py from https://example.com")
+        statuses = {step["id"]: step["status"] for step in result["steps"]}
+        
+        assert result["success"]
+        assert sorted(reads) == ["a.py", "b.py"]
+        assert statuses["read_file_0"] == "ok"
+        # URL fetching is off by default
+        assert "fetch_url_0" not in statuses
+        assert statuses["format_response"] == "ok"
+    
+    @pytest.mark.asyncio
+    async def test_internal_urls_are_not_fetched(self):
+        """Test prompts cannot make the server fetch internal addresses"""
+        from dlplus.config import settings
+        
+        fetched = []
+        
+        class Agent:
+            async def fetch_url(self, url):
+                fetched.append(url)
+                return {"success": True, "url": url, "content": ""}
+        
+        self.core.register_agent("web_retrieval", Agent())
+        settings.enable_url_fetch = True
+        try:
+            result = await self.core.process_request(
+                "analyze http://127.0.0.1/admin and http://169.254.169.254/latest/meta-data"
+            )
+            plan = self.core._create_execution_plan(
+                IntentType.ANALYZE, {"urls": ["http://93.184.216.34/page", "file:///etc/passwd"]},
+                ["run_web_search"], {}
+            )
+        finally:
+            settings.enable_url_fetch = False
+        
+        assert not any(step["id"].startswith("fetch_url") for step in result["steps"])
+        assert fetched == []
+        assert [step["args"]["url"] for step in plan["steps"] if step["action"] == "fetch_url"] == [
+            "http://93.184.216.34/page"
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_url_guard(self):
+        """Test the URL guard's scheme, address and allow-list checks"""
+        from dlplus.core.url_guard import resolve_public, url_rejection
+        
+        for url in [
+            "http://127.0.0.1/", "http://[::1]:8000/", "http://10.0.0.5/", "http://192.168.1.1/",
+            "http://169.254.169.254/", "http://[::ffff:127.0.0.1]/", "http://localhost:8000/",
+            "file:///etc/passwd", "gopher://example.com/", "http://example.com:bad/"
+        ]:
+            assert url_rejection(url) is not None, url
+        assert url_rejection("https://example.com/page") is None
+        assert url_rejection("https://docs.example.com/", ["example.com"]) is None
+        assert url_rejection("https://example.org/", ["example.com"]) is not None
+        
+        await resolve_public("http://93.184.216.34/")
+        with pytest.raises(PermissionError):
+            await resolve_public("http://127.0.0.1/")
+    
+    def test_plan_searches_for_secondary_search_intent(self):
+        """Test a search among the secondary intents still gets a web search step"""
+        intents = [IntentType.GENERATE_CODE, IntentType.SEARCH]
+        tools = self.core._select_tools(IntentType.GENERATE_CODE, {}, [(intent, 0.5) for intent in intents])
+        plan = self.core._create_execution_plan(IntentType.GENERATE_CODE, {}, tools, {}, intents)
+        
+        step_ids = [step["id"] for step in plan["steps"]]
+        assert "web_search" in step_ids and "generate_code" in step_ids
+    
+    @pytest.mark.asyncio
+    async def test_file_writes_can_be_disabled(self):
+        """Test write_to_file steps honor ENABLE_FILE_WRITES"""
+        from dlplus.config import settings
+        
+        writes = []
+        self.core.register_tool("write_to_file", lambda path, content: writes.append(path), "Write a file")
+        settings.enable_file_writes = False
+        try:
+            result = await self.core.process_request("create file notes.txt")
+        finally:
+            settings.enable_file_writes = True
+        
+        statuses = {step["id"]: step for step in result["steps"]}
+        assert writes == []
+        assert statuses["create_file"]["status"] == "failed"
+        assert "disabled" in statuses["create_file"]["error"]
+    
+    def test_get_context_finds_persisted_sessions(self, tmp_path):
+        """Test a stored session that is no longer in memory is not unknown"""
+        from dlplus.core.conversation_store import ConversationStore
+        
+        self.core.conversation_store = ConversationStore(tmp_path / "conversations.db")
+        self.core.get_context("s1").add_turn("hello", "ok", "question", {})
+        self.core.sessions.drop("s1")
+        
+        context = self.core.get_context("s1", create=False)
+        assert [turn.user_message for turn in context.conversation_history] == ["hello"]
+        assert self.core.get_context("unknown", create=False) is None
+    
+    def test_select_tools_compound(self):
+        """Test compound requests select tools for every intent"""
+        ranked = self.core.arabic_processor.rank_intents("ابحث ثم اكتب كود")
+        tools = self.core._select_tools(IntentType.SEARCH, {}, ranked)
+        
+        assert tools[0] == "run_web_search"
+        assert "code_generator" in tools
+    
     def test_get_status(self):
         """Test status retrieval"""
         status = self.core.get_status()
@@ -99,6 +401,1566 @@ class TestIntelligenceCore:
         assert "tools_registered" in status
         assert "agents_registered" in status
         assert isinstance(status["tools_registered"], int)
+        assert "processor_cache" in status
+        assert "sessions" in status
+    
+    @pytest.mark.asyncio
+    async def test_sessions_are_isolated(self):
+        """Test each session keeps its own conversation context"""
+        await self.core.process_request("ابحث عن معلومات", session_id="a")
+        await self.core.process_request("اكتب كود", session_id="b")
+        await self.core.process_request("search again", session_id="a")
+        
+        assert self.core.get_context("a").get_context_summary()["conversation_length"] == 2
+        assert self.core.get_context("b").get_context_summary()["conversation_length"] == 1
+        assert len(self.core.context_analyzer.conversation_history) == 0
+
+
+class TestPlanExecutor:
+    """Test the dependency-graph plan executor"""
+    
+    def setup_method(self):
+        from dlplus.core.plan_executor import PlanExecutor
+        self.executor = PlanExecutor(default_timeout=1.0)
+    
+    @staticmethod
+    async def run_step(step, inputs):
+        await asyncio.sleep(step.get("delay", 0))
+        if step.get("fail"):
+            raise RuntimeError("boom")
+        return {"id": step["id"], "inputs": sorted(inputs)}
+    
+    @pytest.mark.asyncio
+    async def test_independent_steps_run_concurrently(self):
+        """Test total time follows the critical path, not the sum"""
+        steps = [
+            {"id": "a", "delay": 0.1},
+            {"id": "b", "delay": 0.1},
+            {"id": "c", "delay": 0.1},
+            {"id": "join", "depends_on": ["a", "b", "c"]}
+        ]
+        result = await self.executor.execute(steps, self.run_step)
+        
+        assert result["success"]
+        assert result["results"]["join"]["inputs"] == ["a", "b", "c"]
+        assert result["duration_ms"] < 250
+        assert all(report["status"] == "ok" for report in result["steps"])
+    
+    @pytest.mark.asyncio
+    async def test_partial_results(self):
+        """Test non-critical failures and timeouts leave partial results"""
+        steps = [
+            {"id": "ok"},
+            {"id": "broken", "fail": True},
+            {"id": "slow", "delay": 5, "timeout": 0.05},
+            {"id": "needs_broken", "depends_on": ["broken"], "requires": ["broken"]},
+            {"id": "join", "depends_on": ["ok", "broken", "slow"], "critical": True}
+        ]
+        result = await self.executor.execute(steps, self.run_step)
+        statuses = {report["id"]: report["status"] for report in result["steps"]}
+        
+        assert result["success"]
+        assert statuses == {
+            "ok": "ok", "broken": "failed", "slow": "timeout",
+            "needs_broken": "skipped", "join": "ok"
+        }
+        assert result["results"]["join"]["inputs"] == ["ok"]
+    
+    @pytest.mark.asyncio
+    async def test_critical_failure_cancels(self):
+        """Test a critical failure cancels running steps"""
+        steps = [
+            {"id": "critical", "fail": True, "critical": True},
+            {"id": "slow", "delay": 5},
+            {"id": "after", "depends_on": ["slow"]}
+        ]
+        result = await self.executor.execute(steps, self.run_step)
+        statuses = {report["id"]: report["status"] for report in result["steps"]}
+        
+        assert not result["success"]
+        assert result["failed_step"] == "critical"
+        assert statuses["slow"] == "cancelled"
+        assert statuses["after"] == "cancelled"
+        assert result["duration_ms"] < 1000
+    
+    def test_rejects_cycles(self):
+        """Test cyclic plans are rejected"""
+        with pytest.raises(ValueError):
+            self.executor.validate([
+                {"id": "a", "depends_on": ["b"]},
+                {"id": "b", "depends_on": ["a"]}
+            ])
+
+
+class TestToolRuntime:
+    """Test the tool runtime"""
+    
+    def setup_method(self):
+        from dlplus.core.tool_runtime import ToolRuntime
+        self.runtime = ToolRuntime(max_threads=4, max_processes=1, default_timeout=1.0)
+    
+    def teardown_method(self):
+        self.runtime.shutdown(wait=True)
+    
+    def test_concurrency_limit_across_event_loops(self):
+        """Test a tool registered outside any loop can be contended in several loops"""
+        calls = []
+        
+        async def slow(index):
+            calls.append(index)
+            await asyncio.sleep(0.01)
+            return index
+        
+        self.runtime.register("slow", slow, max_concurrency=1)
+        
+        async def contend():
+            return await asyncio.gather(*[self.runtime.invoke("slow", index=index) for index in range(3)])
+        
+        for _ in range(2):
+            loop = asyncio.new_event_loop()
+            try:
+                assert loop.run_until_complete(contend()) == [0, 1, 2]
+            finally:
+                loop.close()
+        assert len(calls) == 6
+    
+    @pytest.mark.asyncio
+    async def test_sync_tools_do_not_block_loop(self):
+        """Test blocking tools run in threads while the loop keeps going"""
+        import time
+        
+        self.runtime.register("slow_io", lambda seconds: time.sleep(seconds) or "done")
+        ticks = 0
+        
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        
+        task = asyncio.ensure_future(ticker())
+        result = await self.runtime.invoke("slow_io", seconds=0.2)
+        task.cancel()
+        
+        assert result == "done"
+        assert ticks >= 5
+        assert self.runtime.get_stats()["slow_io"]["mode"] == "thread"
+    
+    @pytest.mark.asyncio
+    async def test_concurrency_limit_and_queue_depth(self):
+        """Test a tool's semaphore queues calls beyond its limit"""
+        running = peak = 0
+        
+        async def tool(index):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            return index
+        
+        self.runtime.register("limited", tool, max_concurrency=2)
+        calls = [asyncio.ensure_future(self.runtime.invoke("limited", index=i)) for i in range(6)]
+        await asyncio.sleep(0.005)
+        depth = self.runtime.get_stats()["limited"]["queue_depth"]
+        results = await asyncio.gather(*calls)
+        stats = self.runtime.get_stats()["limited"]
+        
+        assert results == list(range(6))
+        assert peak == 2
+        assert depth == 4
+        assert stats["calls"] == 6 and stats["queue_depth"] == 0
+        assert stats["p50_ms"] >= 15
+    
+    @pytest.mark.asyncio
+    async def test_timeout_and_failures(self):
+        """Test per-tool timeouts and errors are raised and counted"""
+        async def hang():
+            await asyncio.sleep(5)
+        
+        def broken():
+            raise ValueError("bad input")
+        
+        self.runtime.register("hang", hang, timeout=0.05)
+        self.runtime.register("broken", broken)
+        
+        with pytest.raises(asyncio.TimeoutError):
+            await self.runtime.invoke("hang")
+        with pytest.raises(ValueError):
+            await self.runtime.invoke("broken")
+        with pytest.raises(LookupError):
+            await self.runtime.invoke("missing")
+        
+        stats = self.runtime.get_stats()
+        assert stats["hang"]["timeouts"] == 1
+        assert stats["broken"]["failures"] == 1
+        assert stats["hang"]["running"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_cpu_bound_tools_use_processes(self):
+        """Test CPU-bound tools run in the process pool"""
+        self.runtime.register("power", pow, cpu_bound=True, timeout=30)
+        
+        assert await self.runtime.invoke("power", base=2, exp=10) == 1024
+        assert self.runtime.get_stats()["power"]["mode"] == "process"
+
+
+
+class TestModelRouter:
+    """Test cost and latency aware model routing"""
+    
+    def setup_method(self):
+        from dlplus.core.model_router import ModelRouter
+        self.now = 0.0
+        self.router = ModelRouter(
+            providers=["openai", "openrouter", "anthropic"],
+            cooldown_seconds=10,
+            clock=lambda: self.now
+        )
+    
+    def test_cheapest_capable_model(self):
+        """Test the cheapest model with the capabilities and context wins"""
+        assert self.router.route(arabic=True)["model"] == "mistral-7b"
+        assert self.router.route(code=True, required_tokens=10000)["model"] == "deepseek-coder"
+        
+        decision = self.router.route(arabic=True, required_tokens=5000)
+        assert decision["model"] == "mistral-7b"
+        assert "qwen-arabic" not in decision["fallbacks"]
+        assert "arabert" not in self.router.models
+    
+    def test_latency_slo(self):
+        """Test models slower than the SLO are passed over"""
+        for _ in range(10):
+            self.router.record("mistral-7b", 3000, success=True)
+            self.router.record("llama-3", 400, success=True)
+        
+        decision = self.router.route(arabic=True, latency_slo_ms=1000)
+        assert decision["model"] == "llama-3"
+        assert "SLO" in decision["reason"]
+        assert decision["fallbacks"][-1] == "mistral-7b"
+        
+        decision = self.router.route(arabic=True, latency_slo_ms=100)
+        assert decision["model"] == "llama-3"
+        assert decision["reason"].startswith("no model meets")
+    
+    def test_degraded_models_fall_back_and_recover(self):
+        """Test failing models are skipped until their cooldown ends"""
+        for _ in range(5):
+            self.router.record("mistral-7b", 50, success=False)
+        
+        decision = self.router.route(arabic=True)
+        assert decision["model"] == "llama-3"
+        assert "skipped degraded: mistral-7b" in decision["reason"]
+        assert self.router.get_stats()["mistral-7b"]["degraded"]
+        
+        self.now += 11
+        for _ in range(5):
+            self.router.record("mistral-7b", 50, success=True)
+        assert self.router.route(arabic=True)["model"] == "mistral-7b"
+    
+    @pytest.mark.asyncio
+    async def test_core_reports_decision(self):
+        """Test responses carry the routing decision and its reason"""
+        core = IntelligenceCore()
+        result = await core.process_request("write python code", latency_slo_ms=2000)
+        
+        assert result["model_used"] == result["model_decision"]["model"]
+        assert result["model_decision"]["reason"]
+        assert "router" in core.get_status()
+
+
+
+class FakeProviders:
+    """Provider registry stand-in with per-model delays and failures"""
+    
+    def __init__(self, delays=None, failing=()):
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.calls = []
+        self.cancelled = []
+    
+    async def chat(self, model_key, messages, **kwargs):
+        self.calls.append(model_key)
+        try:
+            await asyncio.sleep(self.delays.get(model_key, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(model_key)
+            raise
+        if model_key in self.failing:
+            raise RuntimeError(f"{model_key} unavailable")
+        return {"content": f"answer from {model_key}"}
+
+
+class TestModelCaller:
+    """Test hedged and fallback model calls"""
+    
+    messages = [{"role": "user", "content": "hi"}]
+    
+    def caller(self, providers, **kwargs):
+        from dlplus.core.model_caller import ModelCaller
+        kwargs.setdefault("default_delay_ms", 20)
+        kwargs.setdefault("budget_ratio", 1.0)
+        return ModelCaller(providers, **kwargs)
+    
+    @pytest.mark.asyncio
+    async def test_hedge_wins_and_loser_is_cancelled(self):
+        """Test a slow primary is hedged to another provider"""
+        providers = FakeProviders(delays={"gpt-4": 1.0})
+        caller = self.caller(providers)
+        
+        started = asyncio.get_running_loop().time()
+        result = await caller.call(["gpt-4", "gpt-3.5-turbo", "claude-3"], self.messages)
+        
+        assert asyncio.get_running_loop().time() - started < 0.5
+        assert result["model"] == "claude-3"
+        assert result["hedged"] and result["fallback"]
+        assert providers.cancelled == ["gpt-4"]
+        stats = caller.get_stats()
+        assert stats["hedges_sent"] == 1 and stats["hedge_wins"] == 1 and stats["cancelled"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_hedge_budget(self):
+        """Test no hedge is sent once the budget is used up"""
+        providers = FakeProviders(delays={"gpt-4": 0.05})
+        caller = self.caller(providers, budget_ratio=0.0)
+        
+        result = await caller.call(["gpt-4", "claude-3"], self.messages)
+        
+        assert result["model"] == "gpt-4" and not result["hedged"]
+        assert providers.calls == ["gpt-4"]
+        assert caller.get_stats()["hedges_over_budget"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_hedge_delay_follows_p95(self):
+        """Test the hedge delay is the observed p95 once there are samples"""
+        caller = self.caller(FakeProviders(), min_samples=5, default_delay_ms=5000)
+        assert caller.hedge_delay_ms("gpt-4") == 5000
+        
+        for _ in range(10):
+            await caller.call(["gpt-4"], self.messages)
+        assert caller.hedge_delay_ms("gpt-4") < 50
+    
+    @pytest.mark.asyncio
+    async def test_fallback_chain(self):
+        """Test errors move down the chain until a model answers"""
+        from dlplus.core.model_caller import ModelCallError
+        
+        caller = self.caller(FakeProviders(failing={"gpt-4", "claude-3"}))
+        result = await caller.call(["gpt-4", "claude-3", "llama-3"], self.messages, hedge=False)
+        
+        assert result["model"] == "llama-3" and result["fallback"]
+        assert sorted(result["errors"]) == ["claude-3", "gpt-4"]
+        
+        with pytest.raises(ModelCallError) as error:
+            await caller.call(["gpt-4", "claude-3"], self.messages)
+        assert sorted(error.value.errors) == ["claude-3", "gpt-4"]
+        assert caller.get_stats()["failures"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_core_falls_back_to_router_alternatives(self):
+        """Test call_model falls back to models with the same capabilities"""
+        core = IntelligenceCore()
+        core.model_caller.providers = FakeProviders(failing={"gpt-4"})
+        
+        result = await core.call_model("gpt-4", self.messages, hedge=False)
+        
+        assert result["fallback"] and result["model"] != "gpt-4"
+        assert core.router.get_stats()["gpt-4"]["error_rate"] > 0
+        assert core.get_status()["model_calls"]["fallbacks_used"] == 1
+
+
+
+class TestResponseCache:
+    """Test the two-tier response cache"""
+    
+    def setup_method(self):
+        from dlplus.core.response_cache import ResponseCache
+        self.now = 1000.0
+        self.make = lambda **kwargs: ResponseCache(
+            ttls={"search": 60, "execute_command": 0},
+            normalize=ArabicProcessor().normalize_text,
+            clock=lambda: self.now,
+            **kwargs
+        )
+    
+    def test_normalized_and_exact_keys(self):
+        """Test diacritics and spacing only matter in exact mode"""
+        plain, marked = "ابحث عن الذكاء الاصطناعي", "ابْحَثْ عَنِ  الذَّكَاءِ الاصْطِنَاعِيِّ"
+        normalized, exact = self.make(), self.make(mode="exact")
+        
+        assert normalized.key(plain, "search", "m") == normalized.key(marked, "search", "m")
+        assert exact.key(plain, "search", "m") != exact.key(marked, "search", "m")
+        assert normalized.key(plain, "search", "m") != normalized.key(plain, "search", "other")
+    
+    def test_ttl_per_intent(self):
+        """Test search entries expire and commands are never cached"""
+        cache = self.make()
+        assert cache.put("a", "search", {"response": "x"})
+        assert cache.put("b", "analyze", {"response": "y"})
+        assert not cache.put("c", "execute_command", {"response": "z"})
+        
+        assert cache.get("a") == {"response": "x"}
+        self.now += 61
+        assert cache.get("a") is None
+        assert cache.get("b") == {"response": "y"}
+        assert cache.get("c") is None
+        
+        stats = cache.get_stats()
+        assert stats["hits"] == 2 and stats["misses"] == 2 and stats["expired"] == 1
+        assert stats["bytes_saved"] > 0
+    
+    def test_disk_tier(self, tmp_path):
+        """Test entries survive in the disk tier and are promoted"""
+        self.make(disk_dir=tmp_path).put("k", "analyze", {"response": "مرحبا"})
+        cache = self.make(disk_dir=tmp_path)
+        
+        assert cache.get("k") == {"response": "مرحبا"}
+        assert cache.get("k") == {"response": "مرحبا"}
+        assert cache.get_stats()["disk_hits"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_disk_tier_is_bounded_and_swept(self, tmp_path):
+        """Test the disk tier drops its oldest files and expired ones"""
+        cache = self.make(disk_dir=tmp_path, disk_max_bytes=300, sweep_interval=3600)
+        for index in range(5):
+            assert await cache.aput(f"key{index}", "analyze", {"response": "x" * 50})
+        stats = cache.get_stats()
+        assert stats["disk_bytes"] <= 300
+        assert stats["disk_evicted"] == 5 - stats["disk_entries"] > 0
+        assert not (tmp_path / "ke" / "key0.json").exists()
+        
+        await cache.aput("short", "search", {"response": "y"})
+        self.now += 61
+        reopened = self.make(disk_dir=tmp_path, disk_max_bytes=300)
+        assert not (tmp_path / "sh" / "short.json").exists()
+        assert reopened.get_stats()["expired"] == 1
+        assert await reopened.aget("key4") == {"response": "x" * 50}
+        assert await reopened.aget("short") is None
+    
+    def test_hits_are_copies(self):
+        """Test changing a stored or returned value does not change the entry"""
+        cache = self.make()
+        value = {"response": "x", "steps": [{"id": "format_response", "status": "ok"}]}
+        cache.put("k", "analyze", value)
+        value["steps"][0]["status"] = "changed"
+        
+        hit = cache.get("k")
+        hit["steps"].append({"id": "extra"})
+        assert cache.get("k") == {"response": "x", "steps": [{"id": "format_response", "status": "ok"}]}
+    
+    @pytest.mark.asyncio
+    async def test_core_serves_cached_responses(self):
+        """Test a repeated prompt skips the plan and is counted in status"""
+        from dlplus.config import settings
+        
+        settings.response_cache_size = 100
+        try:
+            core = IntelligenceCore()
+        finally:
+            settings.response_cache_size = 0
+        reads = []
+        core.register_tool("read_from_file", lambda path: reads.append(path) or "data", "Read a file")
+        
+        first = await core.process_request("حلل ملف data.txt", session_id="a")
+        second = await core.process_request("حَلِّلْ ملف  data.txt", session_id="b")
+        stats = core.get_status()["response_cache"]
+        
+        assert not first["cached"] and second["cached"]
+        assert second["response"] == first["response"]
+        assert reads == ["data.txt"]
+        assert core.get_context("b").get_context_summary()["conversation_length"] == 1
+        assert stats["hit_ratio"] == 0.5 and stats["bytes_saved"] > 0
+        
+        # A caller changing its response leaves later hits untouched
+        second["steps"][0]["status"] = "changed"
+        first["steps"].clear()
+        third = await core.process_request("حلل ملف data.txt", session_id="c")
+        assert third["cached"]
+        assert third["steps"] and third["steps"][0]["status"] != "changed"
+
+
+class TestSingleFlight:
+    """Test coalescing of identical in-flight requests"""
+    
+    def setup_method(self):
+        self.core = IntelligenceCore()
+        self.reads = []
+        
+        async def read_from_file(path):
+            self.reads.append(path)
+            await asyncio.sleep(0.05)
+            return "data"
+        
+        self.core.register_tool("read_from_file", read_from_file, "Read a file")
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_execution(self):
+        """Test identical concurrent requests run the plan once"""
+        results = await asyncio.gather(*[
+            self.core.process_request("analyze data.txt", session_id=f"user-{i}") for i in range(5)
+        ])
+        
+        assert self.reads == ["data.txt"]
+        assert sum(result["coalesced"] for result in results) == 4
+        assert len({result["response"] for result in results}) == 1
+        stats = self.core.get_status()["coalescing"]
+        assert stats["coalesced"] == 4 and stats["in_flight"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_leader_cancellation_keeps_followers(self):
+        """Test a disconnected leader does not cancel the shared work"""
+        leader = asyncio.ensure_future(self.core.process_request("analyze data.txt", session_id="leader"))
+        await asyncio.sleep(0.01)
+        followers = [
+            asyncio.ensure_future(self.core.process_request("analyze data.txt", session_id=f"f{i}"))
+            for i in range(2)
+        ]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        
+        results = await asyncio.gather(*followers)
+        assert all(result["success"] and result["coalesced"] for result in results)
+        assert self.reads == ["data.txt"]
+        assert leader.cancelled()
+    
+    @pytest.mark.asyncio
+    async def test_abandoned_work_is_cancelled(self):
+        """Test the computation stops once every caller has gone"""
+        from dlplus.core.single_flight import SingleFlight
+        
+        flight = SingleFlight()
+        finished = []
+        
+        async def work():
+            await asyncio.sleep(1)
+            finished.append(True)
+        
+        callers = [asyncio.ensure_future(flight.run("k", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        
+        assert not finished
+        assert flight.get_stats() == {"in_flight": 0, "leaders": 1, "coalesced": 1, "abandoned": 1}
+    
+    @pytest.mark.asyncio
+    async def test_caller_after_abandonment_starts_fresh(self):
+        """Test a caller arriving while abandoned work winds down is not cancelled"""
+        from dlplus.core.single_flight import SingleFlight
+        
+        flight = SingleFlight()
+        
+        async def work():
+            await asyncio.sleep(0.01)
+            return "done"
+        
+        leader = asyncio.ensure_future(flight.run("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        
+        assert leader.cancelled()
+        assert await flight.run("k", work) == ("done", False)
+        assert flight.get_stats()["leaders"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_commands_are_not_coalesced(self):
+        """Test commands with side effects always run separately"""
+        results = await asyncio.gather(*[self.core.process_request("نفذ الأمر ls") for _ in range(3)])
+        
+        assert not any(result["coalesced"] for result in results)
+
+
+class TestEventStream:
+    """Test progress events for streamed requests"""
+    
+    @pytest.mark.asyncio
+    async def test_send_waits_for_reader(self):
+        """Test writers wait at the high-water mark until the reader catches up"""
+        from dlplus.core import EventStream
+        
+        events = EventStream(high_water=4)
+        sent = []
+        
+        async def produce():
+            for index in range(10):
+                await events.send("token", {"text": str(index)})
+                sent.append(index)
+            events.close()
+        
+        producer = asyncio.ensure_future(produce())
+        await asyncio.sleep(0.01)
+        assert len(sent) == 3
+        
+        received = [data["text"] async for _, data in events]
+        await producer
+        assert received == [str(index) for index in range(10)]
+    
+    @pytest.mark.asyncio
+    async def test_close_releases_writers(self):
+        """Test closing the stream (client gone) unblocks and drops writes"""
+        from dlplus.core import EventStream
+        
+        events = EventStream(high_water=1)
+        writer = asyncio.ensure_future(events.send("token", {"text": "a"}))
+        await asyncio.sleep(0.01)
+        assert not writer.done()
+        
+        events.close()
+        await asyncio.wait_for(writer, 1)
+        events.emit("token", {"text": "b"})
+        assert events.emitted == 1
+    
+    @pytest.mark.asyncio
+    async def test_request_events_in_order(self):
+        """Test a request reports analysis, plan and each step as it runs"""
+        from dlplus.core import EventStream
+        
+        core = IntelligenceCore()
+        events = EventStream()
+        
+        async def read_from_file(path):
+            return "data"
+        
+        core.register_tool("read_from_file", read_from_file, "Read a file")
+        result = await core.process_request("analyze data.txt", events=events)
+        events.close()
+        received = [item async for item in events]
+        names = [name for name, _ in received]
+        
+        assert names[:3] == ["analysis", "model", "plan"]
+        assert received[0][1]["intent"] == result["intent"]
+        assert names.count("step_start") == names.count("step_finish") == len(result["steps"])
+        finished = [data for name, data in received if name == "step_finish"]
+        assert finished[-1]["id"] == "format_response" and finished[-1]["status"] == "ok"
+    
+    def test_format_sse(self):
+        """Test events encode in the server-sent events format"""
+        from dlplus.core import EventStream
+        
+        encoded = EventStream.format_sse("token", {"text": "مرحبا"}, event_id=3)
+        
+        assert encoded == 'id: 3\nevent: token\ndata: {"text": "مرحبا"}\n\n'
+
+
+class TestExecutionLog:
+    """Test the structured execution log"""
+    
+    def test_formats_lazily(self):
+        """Test arguments are only formatted when records are read"""
+        import logging
+        from dlplus.core import ExecutionLog
+        
+        formatted = []
+        
+        class Value:
+            def __str__(self):
+                formatted.append(True)
+                return "value"
+        
+        log = ExecutionLog(capacity=3, level="INFO")
+        log.log(logging.DEBUG, "hidden %s", Value())
+        for index in range(5):
+            log.log(logging.INFO, "entry %s: %s", index, Value())
+        
+        assert not formatted
+        assert len(log) == 3
+        records = log.recent(2)
+        assert [record["message"] for record in records] == ["entry 3: value", "entry 4: value"]
+        assert records[0]["level"] == "INFO"
+        assert len(formatted) == 2
+    
+    @pytest.mark.asyncio
+    async def test_sink_writes_batches(self, tmp_path):
+        """Test the background sink appends batched JSON lines"""
+        import json
+        import logging
+        from dlplus.core import ExecutionLog
+        from dlplus.core.execution_log import JsonlSink
+        
+        sink = JsonlSink(tmp_path, batch_size=10, flush_interval=60)
+        log = ExecutionLog(sink=sink)
+        for index in range(25):
+            log.log(logging.WARNING, "مرحلة %d", index)
+        await asyncio.sleep(0.05)
+        # A full batch wakes the writer long before the flush interval
+        assert sink.written == 25 and sink.batches == 1
+        
+        log.log(logging.WARNING, "مرحلة %d", 25)
+        await log.aclose()
+        lines = [json.loads(line) for path in tmp_path.glob("execution-*.jsonl") for line in path.open(encoding="utf-8")]
+        assert [line["message"] for line in lines] == [f"مرحلة {index}" for index in range(26)]
+        assert sink.get_stats()["pending"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_logs_only_on_request(self):
+        """Test responses carry logs only when asked for"""
+        import logging
+        
+        core = IntelligenceCore()
+        core.execution_log.level = logging.DEBUG
+        
+        plain = await core.process_request("search for information")
+        detailed = await core.process_request("search for information", include_logs=True)
+        
+        assert "logs" not in plain
+        assert any(log["message"].startswith("Processing request: search") for log in detailed["logs"])
+        assert core.get_status()["logging"]["level"] == "DEBUG"
+
+
+class TestMetrics:
+    """Test stage timing and the Prometheus exposition"""
+    
+    def test_render_histogram_and_counter(self):
+        """Test buckets are cumulative and labels are escaped"""
+        from dlplus.core.metrics import MetricsRegistry
+        
+        metrics = MetricsRegistry(buckets=(0.001, 0.01))
+        metrics.histogram("stage_duration_seconds", "Stage time", ("stage",))
+        metrics.counter("requests_total", "Requests", ("intent",))
+        metrics.observe("stage_duration_seconds", "intent", 500_000)
+        metrics.observe("stage_duration_seconds", "intent", 5_000_000)
+        metrics.observe("stage_duration_seconds", "intent", 50_000_000)
+        metrics.inc("requests_total", ('say "hi"',))
+        text = metrics.render()
+        
+        assert '# TYPE dlplus_stage_duration_seconds histogram' in text
+        assert 'dlplus_stage_duration_seconds_bucket{stage="intent",le="0.001"} 1' in text
+        assert 'dlplus_stage_duration_seconds_bucket{stage="intent",le="0.01"} 2' in text
+        assert 'dlplus_stage_duration_seconds_bucket{stage="intent",le="+Inf"} 3' in text
+        assert 'dlplus_stage_duration_seconds_sum{stage="intent"} 0.0555' in text
+        assert 'dlplus_stage_duration_seconds_count{stage="intent"} 3' in text
+        assert 'dlplus_requests_total{intent="say \\"hi\\""} 1' in text
+    
+    def test_pending_observations_fold(self):
+        """Test timers and counters kept pending match once folded"""
+        from dlplus.core.metrics import MetricsRegistry, StageTimer
+        
+        metrics = MetricsRegistry(buckets=(0.001,), fold_every=3)
+        metrics.histogram("stage_duration_seconds", "Stage time", ("stage",))
+        metrics.counter("requests_total", "Requests", ("intent",))
+        expected = {}
+        for index in range(7):
+            timer = StageTimer()
+            timer.lap("language")
+            if index % 2:
+                timer.lap("planning")
+            timer.lap("execution")
+            for stage, ns in timer.stages:
+                expected[stage] = expected.get(stage, 0) + ns
+            metrics.observe_stages("stage_duration_seconds", timer)
+            metrics.inc("requests_total", "search")
+        metrics.inc_many("requests_total", ["search", "analyze"])
+        
+        for stage, total in expected.items():
+            value = metrics.value("stage_duration_seconds", stage)
+            assert value["count"] == (3 if stage == "planning" else 7)
+            assert value["sum"] == total / 1e9
+        assert metrics.value("requests_total", "search")["value"] == 8
+        assert metrics.value("requests_total", "analyze")["value"] == 1
+        metrics.reset()
+        assert metrics.value("stage_duration_seconds", "language") is None
+    
+    @pytest.mark.asyncio
+    async def test_request_stages(self):
+        """Test requests record every stage and can report a breakdown"""
+        core = IntelligenceCore()
+        result = await core.process_request("analyze data.txt", include_stages=True)
+        plain = await core.process_request("search for information")
+        stages = result["stages"]
+        
+        for stage in ("language", "intent", "entities", "context", "model_selection", "planning", "execution"):
+            assert stage in stages
+        assert sum(ms for stage, ms in stages.items() if stage != "total") <= stages["total"]
+        assert "stages" not in plain
+        assert core.metrics.value("stage_duration_seconds", "language")["count"] == 2
+        assert core.metrics.value("requests_total", ("analyze", "computed", "true"))["value"] == 1
+        assert core.metrics.value("plan_steps_total", ("format_response", "ok"))["value"] == 2
+
+
+class TestAdmission:
+    """Test admission control and load shedding"""
+    
+    @pytest.mark.asyncio
+    async def test_queued_requests_run_by_priority(self):
+        """Test freed slots go to higher-priority requests first"""
+        from dlplus.core import AdmissionController
+        
+        admission = AdmissionController(max_in_flight=1, max_queue_wait=1.0)
+        holder = await admission.acquire()
+        order = []
+        
+        async def request(priority, name):
+            ticket = await admission.acquire(priority=priority)
+            order.append(name)
+            admission.release(ticket)
+        
+        waiters = [
+            asyncio.ensure_future(request(2, "search")),
+            asyncio.ensure_future(request(1, "general")),
+            asyncio.ensure_future(request(0, "read_file"))
+        ]
+        await asyncio.sleep(0.01)
+        assert admission.get_stats()["queued"] == 3
+        admission.release(holder)
+        await asyncio.gather(*waiters)
+        
+        assert order == ["read_file", "general", "search"]
+        assert admission.get_stats()["in_flight"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_sheds_when_queue_is_full(self):
+        """Test requests beyond the queue bound are rejected at once"""
+        from dlplus.core import AdmissionController, AdmissionRejected
+        
+        admission = AdmissionController(max_in_flight=1, max_queue=1, max_queue_wait=1.0)
+        holder = await admission.acquire()
+        waiter = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire()
+        assert rejected.value.reason == "queue is full"
+        assert rejected.value.retry_after > 0
+        
+        admission.release(holder)
+        admission.release(await waiter)
+        assert admission.get_stats()["rejected"]["queue_full"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_sheds_on_wait_estimate(self):
+        """Test a request is rejected when its expected wait is too long"""
+        from dlplus.core import AdmissionController, AdmissionRejected
+        
+        now = [0.0]
+        admission = AdmissionController(max_in_flight=1, max_queue_wait=2.0, clock=lambda: now[0])
+        ticket = await admission.acquire()
+        now[0] = 3.0
+        admission.release(ticket)
+        assert admission.get_stats()["service_time_ms"] == 3000.0
+        
+        await admission.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire()
+        assert rejected.value.retry_after == pytest.approx(3.0)
+        assert admission.get_stats()["rejected"]["wait_estimate"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        """Test a queued request gives up after the queue timeout"""
+        from dlplus.core import AdmissionController, AdmissionRejected
+        
+        admission = AdmissionController(max_in_flight=1, max_queue_wait=0.02)
+        await admission.acquire()
+        
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire()
+        stats = admission.get_stats()
+        assert stats["rejected"]["queue_timeout"] == 1 and stats["queued"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_rate_limit_per_key(self):
+        """Test each key has its own token bucket"""
+        from dlplus.core import AdmissionController, AdmissionRejected
+        
+        now = [0.0]
+        admission = AdmissionController(rate=1.0, burst=2, clock=lambda: now[0])
+        for _ in range(2):
+            admission.release(await admission.acquire("alice"))
+        
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("alice")
+        assert rejected.value.retry_after == pytest.approx(1.0)
+        admission.release(await admission.acquire("bob"))
+        
+        now[0] = 1.0
+        admission.release(await admission.acquire("alice"))
+        assert admission.get_stats()["rejected"]["rate_limited"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_frees_its_place(self):
+        """Test a client that goes away while queued does not hold a slot"""
+        from dlplus.core import AdmissionController
+        
+        admission = AdmissionController(max_in_flight=1, max_queue_wait=1.0)
+        holder = await admission.acquire()
+        gone = asyncio.ensure_future(admission.acquire())
+        waiting = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        gone.cancel()
+        await asyncio.sleep(0)
+        
+        admission.release(holder)
+        admission.release(await waiting)
+        stats = admission.get_stats()
+        assert gone.cancelled()
+        assert stats["in_flight"] == 0 and stats["queued"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_core_admit_uses_intent_priority(self):
+        """Test the core admits requests with their intent's priority"""
+        core = IntelligenceCore()
+        ticket = await core.admit("read file notes.txt", key="user")
+        
+        assert core.admission.get_stats()["in_flight"] == 1
+        core.admission.release(ticket)
+        core.admission.release(ticket)
+        assert core.admission.get_stats()["in_flight"] == 0
+        assert core.admission.priority("read_file") < core.admission.priority("search")
+
+
+class TestContextAnalyzer:
+    """Test conversation context bookkeeping"""
+    
+    def test_history_is_bounded(self):
+        """Test the history keeps only the most recent turns"""
+        context = ContextAnalyzer(max_history=3, max_message_chars=10)
+        for index in range(10):
+            context.add_turn(f"message {index} " * 5, "ok", "search", {})
+        
+        assert len(context.conversation_history) == 3
+        assert context.conversation_history[0].user_message.startswith("message 7")
+        assert len(context.conversation_history[-1].user_message) == 10
+    
+    def test_mentioned_files_and_tools(self):
+        """Test mentioned files stay ordered and bounded, tools are counted"""
+        context = ContextAnalyzer(max_files=2)
+        context.add_turn("a", "ok", "read_file", {"files": ["a.py", "b.py"]}, ["read_from_file"])
+        context.add_turn("b", "ok", "read_file", {"files": ["a.py", "c.py"]}, ["read_from_file"])
+        
+        summary = context.get_context_summary()
+        assert summary["mentioned_files"] == ["a.py", "c.py"]
+        assert summary["tool_counts"] == {"read_from_file": 2}
+        assert summary["tools_used"] == ["read_from_file"]
+    
+    def test_indexed_lookups_match_scan(self):
+        """Test intent, file and tool indexes agree with a full scan after eviction"""
+        import random
+        
+        rng = random.Random(7)
+        context = ContextAnalyzer(max_history=5)
+        for index in range(200):
+            context.add_turn(
+                f"message {index}",
+                "ok",
+                rng.choice(["search", "analyze", "read_file"]),
+                {"files": rng.sample(["a.py", "b.py", "c.py"], rng.randint(0, 2))},
+                rng.sample(["run_web_search", "read_from_file"], rng.randint(0, 2))
+            )
+            history = list(context.conversation_history)
+            for intent in ["search", "analyze", "read_file"]:
+                expected = [turn for turn in history if turn.intent == intent][-3:]
+                assert context.get_relevant_history(intent) == expected
+            for file in ["a.py", "b.py", "c.py"]:
+                expected = [turn for turn in history if file in turn.entities.get("files", ())][-2:]
+                assert context.get_turns_for_file(file, limit=2) == expected
+            expected = [turn for turn in history if "read_from_file" in turn.tools_used][-3:]
+            assert context.get_turns_for_tool("read_from_file") == expected
+    
+    def test_indexed_lookups_fall_back_to_store(self, tmp_path):
+        """Test lookups reach turns that are no longer hot"""
+        from dlplus.core.conversation_store import ConversationStore
+        
+        store = ConversationStore(tmp_path / "conversations.db")
+        context = ContextAnalyzer(max_history=2, store=store, session_id="s1")
+        context.add_turn("old", "ok", "read_file", {"files": ["old.py"]}, ["read_from_file"])
+        for index in range(3):
+            context.add_turn(f"message {index}", "ok", "search", {})
+        
+        assert [turn.user_message for turn in context.get_relevant_history("read_file")] == ["old"]
+        assert [turn.user_message for turn in context.get_turns_for_file("old.py")] == ["old"]
+        assert [turn.user_message for turn in context.get_turns_for_tool("read_from_file")] == ["old"]
+        assert len(context.get_relevant_history("search", limit=2)) == 2
+    
+    def test_search_history(self):
+        """Test semantic retrieval finds similar messages among the hot turns"""
+        from dlplus.core.embeddings import HashingEmbedder
+        
+        context = ContextAnalyzer(max_history=3, embedder=HashingEmbedder())
+        context.add_turn("ابحث عن الذكاء الاصطناعي", "ok", "search", {})
+        context.add_turn("write a python function to sort a list", "ok", "generate_code", {})
+        context.add_turn("ما هو الطقس اليوم", "ok", "question", {})
+        context.add_turn("deploy the server", "ok", "execute_command", {})
+        
+        turn, score = context.search_history("python function that sorts lists", limit=1)[0]
+        assert turn.user_message == "write a python function to sort a list"
+        assert 0 < score <= 1
+        # The evicted first turn is no longer searchable without a store
+        assert all(turn.seq > 0 for turn, _ in context.search_history("الذكاء الاصطناعي", limit=3))
+    
+    def test_search_history_memmap(self, tmp_path):
+        """Test memory-mapped vectors cover stored turns across restarts"""
+        from dlplus.core.conversation_store import ConversationStore
+        from dlplus.core.embeddings import HashingEmbedder
+        
+        embedder = HashingEmbedder()
+        vector_path = tmp_path / "vectors" / "s1.f32"
+        store = ConversationStore(tmp_path / "conversations.db")
+        context = ContextAnalyzer(max_history=2, store=store, session_id="s1",
+                                  embedder=embedder, vector_path=vector_path)
+        context.add_turn("ابحث عن الذكاء الاصطناعي", "ok", "search", {})
+        for index in range(5):
+            context.add_turn(f"deploy server {index}", "ok", "execute_command", {})
+        context.close()
+        store.close()
+        
+        store = ConversationStore(tmp_path / "conversations.db")
+        embedded = []
+        embed = embedder.embed
+        embedder.embed = lambda text: embedded.append(text) or embed(text)
+        reloaded = ContextAnalyzer(max_history=2, store=store, session_id="s1",
+                                   embedder=embedder, vector_path=vector_path)
+        turn, _ = reloaded.search_history("الذكاء الاصطناعي", limit=1)[0]
+        assert turn.user_message == "ابحث عن الذكاء الاصطناعي"
+        assert turn.seq == 0
+        # Stored vectors are reused; only the query is embedded
+        assert embedded == ["الذكاء الاصطناعي"]
+        assert len(reloaded._vectors) == 6
+        reloaded.close()
+    
+    def test_vector_index_persists_row_count(self, tmp_path):
+        """Test a memory-mapped index reopens with exactly the rows it wrote"""
+        import numpy as np
+        from dlplus.core.vector_index import VectorIndex
+        
+        path = tmp_path / "vectors.f32"
+        index = VectorIndex(4, capacity=1024, path=path)
+        for row in range(3):
+            vector = np.zeros(4, dtype=np.float32)
+            vector[row] = 1.0
+            index.add(vector)
+        # Rows only count once flushed
+        assert len(VectorIndex(4, path=path)) == 0
+        index.flush()
+        
+        reopened = VectorIndex(4, path=path)
+        assert len(reopened) == 3
+        assert reopened.search(np.array([0, 0, 1, 0], dtype=np.float32), k=1)[0][0] == 2
+        assert len(VectorIndex(4, path=path, count=2)) == 2
+        assert len(VectorIndex(8, path=path)) == 0
+        
+        batched = VectorIndex(4, path=tmp_path / "batched.f32", flush_every=2)
+        for row in range(3):
+            batched.add(np.ones(4, dtype=np.float32) / 2)
+        assert len(VectorIndex(4, path=tmp_path / "batched.f32")) == 2
+    
+    def test_vectors_stay_bounded_with_store(self, tmp_path):
+        """Test without a vector file only hot turns are embedded and kept"""
+        from dlplus.core.conversation_store import ConversationStore
+        from dlplus.core.embeddings import HashingEmbedder
+        
+        class CountingEmbedder(HashingEmbedder):
+            calls = 0
+            
+            def embed(self, text):
+                CountingEmbedder.calls += 1
+                return super().embed(text)
+        
+        embedder = CountingEmbedder()
+        store = ConversationStore(tmp_path / "conversations.db")
+        context = ContextAnalyzer(max_history=3, store=store, session_id="s1", embedder=embedder)
+        for index in range(20):
+            context.add_turn(f"deploy server {index}", "ok", "execute_command", {})
+        assert context._vectors._matrix.shape[0] == 3
+        
+        CountingEmbedder.calls = 0
+        reloaded = ContextAnalyzer(max_history=3, store=store, session_id="s1", embedder=embedder)
+        turn, _ = reloaded.search_history("deploy server 18", limit=1)[0]
+        assert turn.seq == 18
+        # Three hot turns plus the query
+        assert CountingEmbedder.calls == 4
+    
+    def test_prompt_context_budget(self):
+        """Test prompt context fits the token budget and prefers relevant turns"""
+        from dlplus.core.prompt_context import estimate_tokens
+        
+        assert estimate_tokens("hello world!") == 3
+        assert estimate_tokens("مرحبا بالعالم") > estimate_tokens("hello world!")
+        
+        context = ContextAnalyzer(max_history=50)
+        context.add_turn("read config.py", "ok", "read_file", {"files": ["config.py"]})
+        for index in range(40):
+            context.add_turn(f"ابحث عن موضوع رقم {index} " * 5, "ok", "search", {})
+        
+        rendered = context.get_context_for_prompt(max_tokens=120, intent="read_file")
+        assert estimate_tokens(rendered) <= 120
+        assert "read config.py" in rendered
+        assert "config.py" in rendered.splitlines()[-2]
+        
+        # Fragments are rendered once and reused
+        fragment = context.conversation_history[-1].fragment
+        context.get_context_for_prompt(max_tokens=120)
+        assert context.conversation_history[-1].fragment is fragment
+    
+    def test_persistence(self, tmp_path):
+        """Test turns survive a restart and only the recent ones stay hot"""
+        from dlplus.core.conversation_store import ConversationStore
+        
+        store = ConversationStore(tmp_path / "conversations.db")
+        context = ContextAnalyzer(max_history=2, store=store, session_id="s1")
+        for index in range(5):
+            context.add_turn(f"message {index}", "ok", "search", {"files": ["a.py"]})
+        store.close()
+        
+        store = ConversationStore(tmp_path / "conversations.db")
+        reloaded = ContextAnalyzer(max_history=2, store=store, session_id="s1")
+        assert store.count("s1") == 5
+        assert [turn.user_message for turn in reloaded.conversation_history] == ["message 3", "message 4"]
+        assert reloaded.get_context_summary()["mentioned_files"] == ["a.py"]
+        
+        page = reloaded.export_page(limit=3)
+        assert len(page["turns"]) == 3
+        assert [turn["user_message"] for turn in reloaded.iter_conversation(page_size=2)][-1] == "message 4"
+        
+        reloaded.clear_context()
+        assert store.count("s1") == 0
+    
+    @pytest.mark.asyncio
+    async def test_persistence_batches_per_tick(self, tmp_path):
+        """Test appends made in one event-loop tick share one transaction"""
+        from dlplus.core.conversation_store import ConversationStore
+        
+        import threading
+        
+        store = ConversationStore(tmp_path / "conversations.db")
+        context = ContextAnalyzer(store=store, session_id="s1")
+        for index in range(3):
+            context.add_turn(f"message {index}", "ok", "search", {})
+        flush, threads = store.flush, []
+        store.flush = lambda: threads.append(threading.get_ident()) or flush()
+        await asyncio.sleep(0)
+        await asyncio.gather(*store._flush_tasks)
+        
+        # The scheduled flush ran off the event loop's thread
+        assert threads and threads[0] != threading.get_ident()
+        assert store.get_stats()["batches_written"] == 1
+        assert store.count("s1") == 3
+    
+    def test_seq_is_assigned_by_the_database(self, tmp_path):
+        """Test two stores on one file (two workers) never reuse a seq"""
+        from dlplus.core.conversation_store import ConversationStore
+        
+        path = tmp_path / "conversations.db"
+        first, second = ConversationStore(path), ConversationStore(path)
+        # Both analyzers start from seq 0, as separate processes would
+        ContextAnalyzer(store=first, session_id="s1").add_turn("from one", "ok", "search", {})
+        ContextAnalyzer(store=second, session_id="s1").add_turn("from two", "ok", "search", {})
+        ContextAnalyzer(store=first, session_id="s2").add_turn("other", "ok", "search", {})
+        
+        rows = first.load_recent("s1", 10)
+        assert [(row["seq"], row["user_message"]) for row in rows] == [(0, "from one"), (1, "from two")]
+        assert [row["seq"] for row in second.load_recent("s2", 10)] == [0]
+        first.close()
+        second.close()
+
+
+class TestSessionStore:
+    """Test the sharded session store"""
+    
+    def test_lru_eviction(self):
+        """Test the least recently used session is evicted when full"""
+        closed = []
+        
+        class Analyzer(ContextAnalyzer):
+            def close(self):
+                closed.append(self)
+        
+        store = SessionStore(max_sessions=2, num_shards=1, factory=lambda session_id: Analyzer())
+        first = store.get("first")
+        second = store.get("second")
+        assert store.get("first") is first
+        store.get("third")
+        
+        assert "first" in store
+        assert "second" not in store
+        assert len(store) == 2
+        assert store.get_stats()["evicted"] == 1
+        # Evicted analyzers write out their vectors
+        assert closed == [second]
+    
+    def test_ttl_expiry(self):
+        """Test idle sessions expire"""
+        now = [0.0]
+        store = SessionStore(ttl_seconds=10, num_shards=4, clock=lambda: now[0])
+        old = store.get("idle")
+        store.get("busy")
+        now[0] = 8.0
+        store.get("busy")
+        now[0] = 15.0
+        
+        assert store.peek("idle") is None
+        assert store.peek("busy") is not None
+        assert store.sweep() == 1
+        assert store.get("idle") is not old
+    
+    def test_memory_stays_bounded(self):
+        """Test many short-lived sessions never exceed the limit"""
+        store = SessionStore(max_sessions=64, num_shards=8)
+        for index in range(5000):
+            store.get(f"session-{index}")
+        
+        assert len(store) <= 64
+
+
+
+class TestProviders:
+    """Test pooled provider clients against the local stub server"""
+    
+    @classmethod
+    def setup_class(cls):
+        from dlplus.providers.stub_server import StubServer
+        cls.server = StubServer().start()
+    
+    @classmethod
+    def teardown_class(cls):
+        cls.server.stop()
+    
+    def setup_method(self):
+        from dlplus.providers.stub_server import StubConfig
+        self.config = self.server.config = StubConfig(seed=7)
+    
+    def provider(self, cls_name="OpenAIProvider", **kwargs):
+        import dlplus.providers as providers
+        kwargs.setdefault("backoff_base", 0.001)
+        return getattr(providers, cls_name)(api_key="test-key", base_url=self.server.base_url, **kwargs)
+    
+    @pytest.mark.asyncio
+    async def test_openai_reuses_connection(self):
+        """Test sequential calls share one keep-alive connection"""
+        provider = self.provider()
+        messages = [{"role": "user", "content": "مرحبا"}]
+        
+        for _ in range(10):
+            result = await provider.chat("gpt-4", messages)
+        await provider.close()
+        
+        assert result["content"] == "stub reply to: مرحبا"
+        assert result["provider"] == "openai"
+        assert result["usage"]["prompt_tokens"] == 1
+        assert self.config.requests == 10
+        assert len(self.config.connections) == 1
+    
+    @pytest.mark.asyncio
+    async def test_anthropic_format(self):
+        """Test system prompts move to the top-level field"""
+        provider = self.provider("AnthropicProvider")
+        result = await provider.chat("claude-3-opus-20240229", [
+            {"role": "system", "content": "be brief"},
+            {"role": "user", "content": "hello"}
+        ])
+        await provider.close()
+        
+        assert result["content"] == "stub reply to: hello (system: be brief)"
+        assert result["usage"] == {"prompt_tokens": 1, "completion_tokens": 7}
+    
+    @pytest.mark.asyncio
+    async def test_malformed_responses_raise_provider_error(self):
+        """Test bad bodies fail as ProviderError and count as failures"""
+        from dlplus.providers import ProviderError
+        
+        for cls_name, body in [
+            ("OpenAIProvider", "{not json"),
+            ("OpenAIProvider", '{"choices": []}'),
+            ("AnthropicProvider", '{"model": "m"}')
+        ]:
+            provider = self.provider(cls_name)
+            self.config.malformed_body = body
+            with pytest.raises(ProviderError, match="Malformed"):
+                await provider.chat("gpt-4", [{"role": "user", "content": "hi"}])
+            await provider.close()
+            assert provider.get_stats()["failures"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors(self):
+        """Test 429/5xx are retried and other errors are not"""
+        from dlplus.providers import ProviderError
+        
+        provider = self.provider("OpenRouterProvider", max_retries=3)
+        self.config.fail_next = 2
+        self.config.error_status = 429
+        result = await provider.chat("mistralai/mistral-7b-instruct", [{"role": "user", "content": "hi"}])
+        assert result["attempts"] == 3
+        assert provider.get_stats()["retries"] == 2
+        
+        self.config.fail_next = 5
+        self.config.error_status = 503
+        with pytest.raises(ProviderError) as error:
+            await provider.chat("mistralai/mistral-7b-instruct", [{"role": "user", "content": "hi"}])
+        assert error.value.attempts == 4 and error.value.status == 503
+        
+        self.config.fail_next = 1
+        self.config.error_status = 400
+        with pytest.raises(ProviderError) as error:
+            await provider.chat("mistralai/mistral-7b-instruct", [{"role": "user", "content": "hi"}])
+        assert error.value.attempts == 1
+        await provider.close()
+        
+        assert provider.get_stats()["failures"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_pool_limits_connections(self):
+        """Test concurrent calls never open more than max_connections"""
+        provider = self.provider(max_connections=2, max_keepalive=2)
+        self.config.latency = 0.02
+        
+        results = await asyncio.gather(*[
+            provider.chat("gpt-4", [{"role": "user", "content": str(i)}]) for i in range(8)
+        ])
+        await provider.close()
+        
+        assert [r["content"] for r in results] == [f"stub reply to: {i}" for i in range(8)]
+        assert len(self.config.connections) == 2
+    
+    @pytest.mark.asyncio
+    async def test_registry_routes_by_model(self):
+        """Test the registry builds one client per provider from settings"""
+        from dlplus.config import settings
+        from dlplus.providers import ProviderRegistry
+        
+        settings.openrouter_base_url = self.server.base_url
+        settings.openrouter_api_key = "test-key"
+        try:
+            registry = ProviderRegistry()
+            result = await registry.chat("qwen-arabic", [{"role": "user", "content": "سلام"}])
+            again = await registry.chat("llama-3", [{"role": "user", "content": "hi"}])
+            stats = registry.get_stats()
+            await registry.close()
+        finally:
+            settings.openrouter_base_url = None
+            settings.openrouter_api_key = ""
+        
+        assert result["model"] == "qwen/qwen-2.5-72b-instruct"
+        assert again["provider"] == "openrouter"
+        assert list(stats) == ["openrouter"] and stats["openrouter"]["requests"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_streaming(self):
+        """Test both wire formats stream text that joins into the full reply"""
+        self.config.token_delay = 0.001
+        self.config.fail_next = 1
+        for cls_name, expected in (
+            ("OpenAIProvider", "stub reply to: hi there"),
+            ("AnthropicProvider", "stub reply to: hi there (system: brief)")
+        ):
+            provider = self.provider(cls_name)
+            chunks = [chunk async for chunk in provider.stream("model", [
+                {"role": "system", "content": "brief"},
+                {"role": "user", "content": "hi there"}
+            ])]
+            await provider.close()
+            
+            assert len(chunks) > 1
+            assert "".join(chunks) == expected
+        assert self.config.errors == 1
+    
+    @pytest.mark.asyncio
+    async def test_core_streams_llm_response(self):
+        """Test LLM responses reach the event stream token by token"""
+        import dlplus.providers as providers
+        from dlplus.config import settings
+        from dlplus.core import EventStream
+        
+        core = IntelligenceCore()
+        for name in ("OpenAIProvider", "OpenRouterProvider", "AnthropicProvider"):
+            core.providers.register(self.provider(name))
+        events = EventStream(high_water=2)
+        
+        settings.llm_responses = True
+        try:
+            task = asyncio.ensure_future(core.process_request("hello there", events=events))
+            tokens = []
+            async for name, data in events:
+                if name == "token":
+                    tokens.append(data["text"])
+                if name == "step_finish" and data["id"] == "format_response":
+                    events.close()
+            result = await task
+            await core.aclose()
+        finally:
+            settings.llm_responses = False
+        
+        assert len(tokens) > 1
+        assert "".join(tokens) == result["response"]
+        assert result["response"].startswith("stub reply to: hello there")
+
+
+class TestAPI:
+    """Test FastAPI endpoints"""
+    
+    def setup_method(self):
+        from fastapi.testclient import TestClient
+        from dlplus.main import app
+        self.client = TestClient(app)
+    
+    def test_batch_analysis(self):
+        """Test batch analysis endpoint"""
+        response = self.client.post(
+            "/api/agent/batch",
+            json={"prompts": ["ابحث عن معلومات", "run command"]}
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 2
+        assert data["results"][0]["intent"] == "search"
+        assert data["results"][1]["language"] == "en"
+    
+    def test_batch_analysis_limit(self):
+        """Test batch analysis rejects oversized batches"""
+        from dlplus.config import settings
+        
+        prompts = ["hello"] * (settings.batch_max_prompts + 1)
+        response = self.client.post("/api/agent/batch", json={"prompts": prompts})
+        
+        assert response.status_code == 413
+    
+    def test_session_context(self):
+        """Test context endpoints are scoped to the session"""
+        self.client.post(
+            "/api/agent/execute",
+            json={"prompt": "ابحث عن معلومات"},
+            headers={"X-Session-ID": "api-session"}
+        )
+        
+        summary = self.client.get("/api/context/summary", params={"session_id": "api-session"})
+        assert summary.status_code == 200
+        assert summary.json()["conversation_length"] == 1
+        
+        self.client.post("/api/context/clear", headers={"X-Session-ID": "api-session"})
+        missing = self.client.get("/api/context/summary", params={"session_id": "api-session"})
+        assert missing.status_code == 404
+    
+    def test_export_context(self):
+        """Test export needs an existing session and a non-negative cursor"""
+        self.client.post(
+            "/api/agent/execute",
+            json={"prompt": "ابحث عن معلومات"},
+            headers={"X-Session-ID": "export-session"}
+        )
+        
+        page = self.client.get("/api/context/export", params={"session_id": "export-session"})
+        assert page.status_code == 200
+        assert len(page.json()["turns"]) == 1
+        
+        missing = self.client.get("/api/context/export", params={"session_id": "no-such-session"})
+        assert missing.status_code == 404
+        assert self.client.get("/api/context/summary", params={"session_id": "no-such-session"}).status_code == 404
+        
+        negative = self.client.get("/api/context/export", params={"session_id": "export-session", "cursor": -1})
+        assert negative.status_code == 422
+    
+    def test_execute_omits_logs(self):
+        """Test logs are left out of the response unless requested"""
+        plain = self.client.post("/api/agent/execute", json={"prompt": "analyze the report"}).json()
+        detailed = self.client.post(
+            "/api/agent/execute",
+            json={"prompt": "analyze the report", "include_logs": True}
+        ).json()
+        
+        assert plain["success"] and "logs" not in plain
+        assert isinstance(detailed["logs"], list)
+    
+    def test_metrics_endpoint(self):
+        """Test /metrics serves the Prometheus text format"""
+        self.client.post("/api/agent/execute", json={"prompt": "analyze the report"})
+        response = self.client.get("/metrics")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'dlplus_stage_duration_seconds_bucket{stage="entities",le="+Inf"}' in response.text
+        assert "dlplus_requests_total{" in response.text
+    
+    def test_rate_limited_request_gets_429(self):
+        """Test shed requests get 429 with a Retry-After header"""
+        from dlplus.core import AdmissionController
+        from dlplus.main import intelligence_core
+        from dlplus.config import settings
+        
+        original = intelligence_core.admission
+        intelligence_core.admission = AdmissionController(rate=0.5, burst=1)
+        try:
+            headers = {settings.api_key_header: "limited-key"}
+            first = self.client.post("/api/agent/execute", json={"prompt": "analyze the report"}, headers=headers)
+            second = self.client.post("/api/agent/execute", json={"prompt": "analyze the report"}, headers=headers)
+            streamed = self.client.post("/api/agent/stream", json={"prompt": "analyze the report"}, headers=headers)
+            other = self.client.post(
+                "/api/agent/execute",
+                json={"prompt": "analyze the report"},
+                headers={settings.api_key_header: "other-key"}
+            )
+        finally:
+            intelligence_core.admission = original
+        
+        assert first.status_code == 200 and other.status_code == 200
+        assert second.status_code == 429 and streamed.status_code == 429
+        assert second.headers["retry-after"] == "2"
+    
+    @pytest.mark.asyncio
+    async def test_stream_releases_slot_on_early_disconnect(self):
+        """Test a stream dropped before its body starts still frees its slot"""
+        from starlette.requests import Request
+        from dlplus.main import intelligence_core, stream_agent, AgentRequest
+        
+        scope = {"type": "http", "method": "POST", "path": "/api/agent/stream", "headers": [], "client": ("127.0.0.1", 1)}
+        response = await stream_agent(AgentRequest(prompt="analyze the report"), Request(scope), None)
+        assert intelligence_core.admission.get_stats()["in_flight"] == 1
+        
+        async def receive():
+            return {"type": "http.disconnect"}
+        
+        async def send(message):
+            raise OSError("client went away")
+        
+        with pytest.raises(OSError):
+            await response(scope, receive, send)
+        assert intelligence_core.admission.get_stats()["in_flight"] == 0
+    
+    def test_stream_events(self):
+        """Test the streaming endpoint sends progress, then the result"""
+        import json
+        
+        with self.client.stream("POST", "/api/agent/stream", json={"prompt": "analyze the report"}) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            body = "".join(response.iter_text())
+        
+        events = []
+        for block in body.strip().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.split("\n"))
+            events.append((fields["event"], json.loads(fields["data"])))
+        names = [name for name, _ in events]
+        
+        assert names[0] == "accepted"
+        assert names[1:4] == ["analysis", "model", "plan"]
+        assert "step_start" in names and "step_finish" in names
+        assert names[-1] == "result"
+        assert events[-1][1]["success"] and events[-1][1]["intent"] == events[1][1]["intent"]
+
+
+class TestBenchmarks:
+    """Test the benchmark harness"""
+    
+    def test_measure(self):
+        """Test stage statistics are reported"""
+        from benchmarks.harness import measure
+        
+        stats = measure(len, ["a", "bb"], iterations=50, warmup=5, alloc_iterations=10)
+        
+        assert stats["iterations"] == 50
+        assert stats["ops_per_sec"] > 0
+        assert stats["p50_us"] <= stats["p99_us"]
+    
+    def test_find_regressions(self):
+        """Test regression gates against a baseline"""
+        from benchmarks.harness import find_regressions
+        
+        baseline = {"stages": {"fast": {"ops_per_sec": 1000, "p99_us": 10.0}}}
+        slower = {"stages": {"fast": {"ops_per_sec": 600, "p99_us": 11.0}}}
+        
+        assert len(find_regressions(slower, baseline, threshold=0.25)) == 1
+        assert find_regressions(slower, baseline, stage_thresholds={"fast": 0.5}) == []
 
 
 class TestWebRetrievalAgent: